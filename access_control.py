@@ -7,6 +7,7 @@ from telegram.ext import ContextTypes
 
 import utils
 import storage
+from request_context import RequestContext
 
 
 def _main_menu_keyboard(user_id: int) -> ReplyKeyboardMarkup:
@@ -26,6 +27,10 @@ def access_control(required_status: str = "active", required_role: Optional[str]
     - статус (active/pending),
     - роль (Admin), если указана.
     Работает и для сообщений, и для callback'ов.
+
+    Права берутся из кэша storage.principals (O(1), без повторных запросов
+    к utils); обработчик получает их в context.request (RequestContext
+    обновления, см. request_context.py).
     """
 
     def decorator(func):
@@ -39,10 +44,11 @@ def access_control(required_status: str = "active", required_role: Optional[str]
             if user_id is None or msg is None:
                 return
 
-            db_user = utils.get_user_by_id(user_id)
+            principal = storage.principals.get(user_id)
+            db_user = principal.user
 
             # Авто-регистрация админа по списку admin_ids из config.json
-            if not db_user and user_id in storage.config.get("admin_ids", []):
+            if not db_user and user_id in storage.principals.admin_ids:
                 db_user = {
                     "user_id": user_id,
                     "username": user.username if user else "unknown",
@@ -52,7 +58,11 @@ def access_control(required_status: str = "active", required_role: Optional[str]
                     "status": "active",
                 }
                 storage.users.append(db_user)
-                storage.save_users()
+                await storage.save_users_async()
+                principal = storage.principals.get(user_id)
+                db_user = principal.user
+
+            context.request = RequestContext(principal)
 
             if not db_user:
                 if not allow_unregistered:
@@ -65,10 +75,10 @@ def access_control(required_status: str = "active", required_role: Optional[str]
                     return await func(update, context, *args, **kwargs)
 
             # Игнорируем заблокированных пользователей
-            if db_user.get("status") == "blocked":
+            status = principal.status
+            if status == "blocked":
                 return
 
-            status = db_user.get("status")
             if required_status and status != required_status:
                 await msg.reply_text(
                     f"Ваш статус: {status}. "
@@ -78,10 +88,9 @@ def access_control(required_status: str = "active", required_role: Optional[str]
                 return
 
             if required_role:
-                role = db_user.get("role")
                 if not (
-                    role == required_role
-                    or (required_role == "Admin" and utils.is_admin(user_id))
+                    principal.role == required_role
+                    or (required_role == "Admin" and principal.is_admin)
                 ):
                     await msg.reply_text(
                         f"Доступ к этой функции разрешён только для пользователей с ролью: {required_role}.",
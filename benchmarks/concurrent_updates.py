@@ -0,0 +1,113 @@
+"""Нагрузочный тест обработки обновлений: задержка p50/p99 при N одновременных пользователях.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.concurrent_updates [--users 200] [--updates 3] [--io-ms 50] [--ocr-share 0.02]
+
+Каждый пользователь одновременно отправляет ``--updates`` обновлений.
+Обработчик имитирует запросы к Telegram (``--io-ms`` ожидания) и немного
+работы в event loop; доля ``--ocr-share`` обновлений — распознавание фото
+(``--ocr-ms`` в отдельном потоке под лимитом heavy("ocr")). Обновления
+проходят через процессор так же, как в Application: последовательно
+(по умолчанию PTB) и через ChatOrderedUpdateProcessor с разными лимитами.
+Задержка — от поступления обновления до окончания его обработки.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+from telegram.ext import BaseUpdateProcessor, SimpleUpdateProcessor
+
+import concurrency
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _busy(ms: float) -> None:
+    deadline = time.perf_counter() + ms / 1000
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def _handle(update: SimpleNamespace, args: argparse.Namespace, seen: Dict[int, List[int]]) -> None:
+    seen.setdefault(update.effective_chat.id, []).append(update.seq)
+    _busy(args.cpu_ms)
+    if update.ocr:
+        async with concurrency.heavy("ocr"):
+            await asyncio.to_thread(time.sleep, args.ocr_ms / 1000)
+    await asyncio.sleep(args.io_ms / 1000)
+
+
+async def run(processor: BaseUpdateProcessor, args: argparse.Namespace) -> Tuple[List[float], float]:
+    rng = random.Random(42)
+    concurrency.reset_heavy_limits()
+    seen: Dict[int, List[int]] = {}
+    latencies: List[float] = []
+
+    async def submit(update: SimpleNamespace) -> None:
+        started = time.perf_counter()
+        await processor.process_update(update, _handle(update, args, seen))
+        latencies.append(time.perf_counter() - started)
+
+    updates = [
+        SimpleNamespace(
+            effective_chat=SimpleNamespace(id=user),
+            effective_user=SimpleNamespace(id=user),
+            seq=seq,
+            ocr=rng.random() < args.ocr_share,
+        )
+        for seq in range(args.updates)
+        for user in range(args.users)
+    ]
+    started = time.perf_counter()
+    async with processor:
+        # Как в Application: обновления забираются по порядку поступления
+        await asyncio.gather(*(submit(update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    # Внутри чата обновления обработаны в порядке поступления
+    if not isinstance(processor, SimpleUpdateProcessor):
+        for order in seen.values():
+            assert order == sorted(order), "обновления одного чата обработаны не по порядку"
+    return latencies, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=3)
+    parser.add_argument("--io-ms", type=float, default=50.0)
+    parser.add_argument("--cpu-ms", type=float, default=0.2)
+    parser.add_argument("--ocr-share", type=float, default=0.02)
+    parser.add_argument("--ocr-ms", type=float, default=1500.0)
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 32, 128])
+    args = parser.parse_args()
+
+    print(f"users={args.users} updates/user={args.updates} io={args.io_ms}ms ocr_share={args.ocr_share}")
+    print(f"{'mode':<24}{'p50, ms':>10}{'p99, ms':>10}{'max, ms':>10}{'total, s':>10}")
+    for limit in args.limits:
+        if limit <= 1:
+            name, processor = "sequential", SimpleUpdateProcessor(1)
+        else:
+            name, processor = f"chat-ordered[{limit}]", concurrency.ChatOrderedUpdateProcessor(limit)
+        latencies, elapsed = asyncio.run(run(processor, args))
+        print(
+            f"{name:<24}{_percentile(latencies, 0.5) * 1000:>10.0f}"
+            f"{_percentile(latencies, 0.99) * 1000:>10.0f}"
+            f"{max(latencies) * 1000:>10.0f}{elapsed:>10.2f}"
+        )
+        assert len(latencies) == args.users * args.updates
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Поиск устройств по подстроке: n-граммный индекс против прохода по списку.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.device_search [--devices 100000]
+
+Строит коллекцию устройств (как storage.devices) с TrigramIndex и меряет
+среднее время запроса для типичных запросов поиска и сканирования кода.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any, Callable, List
+
+from benchmarks.storage_formats import make_devices
+from libs.records import Device
+from libs.repository import Collection
+from libs.trigram_index import TrigramIndex
+
+QUERIES = ["SN00012345", "0001234", "Device 4242", "ice 99", "tablet", "SN0009"]
+
+
+def linear_search(devices: List[Any], text: str) -> List[Any]:
+    text = text.upper()
+    return [
+        d for d in devices
+        if text in d.get("name", "").upper() or text in d.get("type", "").upper() or text in d.get("sn", "").upper()
+    ]
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100_000)
+    args = parser.parse_args()
+
+    index = TrigramIndex(("name", "type", "sn"))
+    devices = Collection(["id", "sn"], record_type=Device, key="id")
+    devices.add_listener(index.observe)
+    started = time.perf_counter()
+    devices.extend(make_devices(args.devices))
+    build = time.perf_counter() - started
+
+    for query in QUERIES:
+        assert [d["id"] for d in index.search(query)] == [d["id"] for d in linear_search(devices, query)]
+
+    print(f"devices: {args.devices}, index build (with collection): {build:.2f} s")
+    print(f"{'query':<14}{'results':>9}{'index, ms':>12}{'scan, ms':>12}")
+    for query in QUERIES:
+        results = len(index.search(query))
+        indexed = _timed(lambda: index.search(query), 20)
+        scan = _timed(lambda: linear_search(devices, query), 3)
+        print(f"{query:<14}{results:>9}{indexed * 1000:>12.3f}{scan * 1000:>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Сравнение форматов хранения: время сохранения/загрузки и размер файлов.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.storage_formats [--devices 10000] [--logs 1000000]
+
+Для каждого доступного кодека (libs/storage_codecs.py) сериализует
+devices.json (N устройств) и device_logs.json (M записей лога), пишет файл
+с fsync и читает его обратно через автоопределение формата.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from libs import storage_codecs
+from libs.records import Device, LogEntry
+
+DEVICE_TYPES = ["Phone", "Tablet", "PC", "RKBoard"]
+
+
+def make_devices(count: int) -> List[Device]:
+    devices = []
+    for i in range(1, count + 1):
+        device = Device(
+            {
+                "id": i,
+                "name": f"Device {i}",
+                "sn": f"SN{i:08d}",
+                "type": DEVICE_TYPES[i % len(DEVICE_TYPES)],
+                "status": "booked" if i % 3 == 0 else "free",
+                "group_id": i % 10 or None,
+            }
+        )
+        if i % 3 == 0:
+            device["user_id"] = 100000 + i % 500
+            device["booking_expiration"] = "2024-05-01T18:00:00"
+        devices.append(device)
+    return devices
+
+
+def make_logs(count: int, devices: int) -> Dict[str, List[LogEntry]]:
+    logs: Dict[str, List[LogEntry]] = {}
+    for i in range(count):
+        sn = f"SN{i % devices + 1:08d}"
+        action = "Забронировано пользователем Иван Петров" if i % 2 else "Освобождено пользователем Иван Петров"
+        logs.setdefault(sn, []).append(LogEntry({"timestamp": "2024-05-01 12:00:00", "action": action}))
+    return logs
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def _write(path: str, payload: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def bench(name: str, data: Any, directory: str) -> List[Tuple[str, str, float, float, int]]:
+    rows = []
+    for codec_name in storage_codecs.available():
+        codec = storage_codecs.get_codec(codec_name)
+        path = os.path.join(directory, f"{name}.{codec_name}")
+        payload, dump_time = _timed(lambda: codec.dumps(data))
+        _, write_time = _timed(lambda: _write(path, payload))
+        raw, read_time = _timed(lambda: _read(path))
+        _, load_time = _timed(lambda: storage_codecs.loads(raw))
+        rows.append((name, codec_name, dump_time + write_time, read_time + load_time, len(payload)))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--logs", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    devices = make_devices(args.devices)
+    logs = make_logs(args.logs, args.devices)
+
+    with tempfile.TemporaryDirectory() as directory:
+        rows = bench(f"devices[{args.devices}]", devices, directory)
+        rows += bench(f"logs[{args.logs}]", logs, directory)
+
+    print(f"{'data':<18}{'format':<13}{'save, s':>10}{'load, s':>10}{'size, MB':>11}")
+    for name, codec_name, save_time, load_time, size in rows:
+        print(f"{name:<18}{codec_name:<13}{save_time:>10.3f}{load_time:>10.3f}{size / 1_000_000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
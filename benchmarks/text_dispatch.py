@@ -0,0 +1,122 @@
+"""Выбор обработчика текстового сообщения: цепочка Regex-хендлеров против словаря надписей.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.text_dispatch [--repeat 20000]
+
+«До» — прежняя регистрация: по MessageHandler(filters.TEXT &
+filters.Regex(...)) на каждую кнопку, Application проверяет их по очереди
+до первого совпадения. «После» — один MessageHandler с фильтром
+main._TextRoute (словарь надписей и короткий список шаблонов). Для каждого
+вида сообщения меряется время check_update до выбора обработчика; текст
+FSM-диалогов («свободный текст») не подходит ни к одной кнопке и в старой
+схеме проверялся всеми шаблонами.
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, List, Sequence
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import MessageHandler, filters
+
+import main as bot
+import storage
+
+SAMPLES = [
+    ("первая кнопка", "Назад"),
+    ("кнопка в середине", "Админ: Экспорт устройств"),
+    ("последняя кнопка", "Экспорт логов CSV"),
+    ("тип устройства", "Tablet"),
+    ("устройство", "Pixel 8 - ID 42"),
+    ("освобождение", "Освободить Pixel 8 (SN: R5CT1234567)"),
+    ("команда админа", "approve 123456"),
+    ("свободный текст", "Иван Петров"),
+]
+
+
+def _update(text: str) -> Update:
+    message = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=Chat(1, Chat.PRIVATE),
+        from_user=User(1, "user", False),
+        text=text,
+    )
+    return Update(update_id=1, message=message)
+
+
+def legacy_handlers(router: Any) -> List[MessageHandler]:
+    """Прежняя цепочка: надписи — Regex "^(надпись|надпись)$" (подряд идущие
+    надписи одного обработчика, как типы устройств), шаблоны — как есть."""
+    chain = []
+    labels: List[str] = []
+    previous = None
+
+    def flush() -> None:
+        if labels:
+            pattern = "^(" + "|".join(re.escape(label) for label in labels) + ")$"
+            chain.append(MessageHandler(filters.TEXT & filters.Regex(pattern), previous))
+            labels.clear()
+
+    for kind, label, handler in router.routes():
+        if kind != "exact" or handler is not previous:
+            flush()
+        previous = handler
+        if kind == "exact":
+            labels.append(label)
+        elif kind == "members":
+            # Типы устройств раньше вшивались в один Regex при запуске
+            labels.extend(storage.config["device_types"])
+            flush()
+        else:
+            chain.append(MessageHandler(filters.TEXT & filters.Regex(label), handler))
+    flush()
+    return chain
+
+
+def first_match(chain: Sequence[MessageHandler], update: Update) -> Any:
+    # Как Application.process_update: первый хендлер с check не None/False
+    for handler in chain:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+
+def _timed(chain: Sequence[MessageHandler], update: Update, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        first_match(chain, update)
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+
+    # Типы устройств из config.json_template (без загрузки данных бота)
+    storage.config.setdefault("device_types", ["Phone", "Tablet", "PC", "RKBoard"])
+    storage.apply_config()
+    router = bot._build_text_router()
+    before = legacy_handlers(router)
+    after = [MessageHandler(filters.TEXT & bot._TextRoute(router), bot._dispatch_text)]
+
+    print(f"routes: {len(router)}, handlers before: {len(before)}, after: {len(after)}")
+    print(f"{'message':<20}{'before, us':>12}{'after, us':>12}")
+    for title, text in SAMPLES:
+        update = _update(text)
+        legacy = first_match(before, update)
+        assert (legacy is None) == (first_match(after, update) is None)
+        old = _timed(before, update, args.repeat)
+        new = _timed(after, update, args.repeat)
+        print(f"{title:<20}{old * 1e6:>12.1f}{new * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
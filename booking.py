@@ -0,0 +1,186 @@
+"""Бронирование, освобождение и передача устройств.
+
+Все изменения владельца устройства идут через этот модуль. Операция берет
+asyncio.Lock устройства (и пользователя, если проверяется его лимит),
+заново читает запись и сверяет ожидаемое состояние (compare-and-set):
+статус и владельца, которые обработчик видел до своих await. Если за это
+время устройство забронировали, освободили или передали, операция не
+выполняется и поднимает BookingError с текстом для пользователя. Поэтому
+обработчики могут работать параллельно (Application.concurrent_updates).
+
+Блокировки берутся в фиксированном порядке (пользователи, затем
+устройства, по возрастанию ключа), так что взаимных блокировок нет.
+"""
+
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import storage
+import utils
+from libs.keyed_locks import KeyedLocks, hold
+
+_device_locks = KeyedLocks()
+_user_locks = KeyedLocks()
+
+
+class BookingError(Exception):
+    """Операция не выполнена; str(error) — сообщение для пользователя."""
+
+
+class DeviceUnavailable(BookingError):
+    pass
+
+
+class BookingLimitReached(BookingError):
+    pass
+
+
+@asynccontextmanager
+async def locked(device_ids: Iterable[Any] = (), user_ids: Iterable[Any] = ()) -> AsyncIterator[None]:
+    """Держит блокировки указанных пользователей и устройств."""
+    async with hold(_user_locks.ordered(user_ids) + _device_locks.ordered(device_ids)):
+        yield
+
+
+def default_expiration(device: Dict[str, Any], now: Optional[datetime] = None) -> datetime:
+    """Срок брони по умолчанию: период устройства или default_booking_period_days."""
+    days = device.get(
+        "default_booking_period",
+        storage.config.get("default_booking_period_days", 1),
+    )
+    return (now or datetime.now()) + timedelta(days=days)
+
+
+def _max_devices() -> int:
+    return storage.config.get("max_devices_per_user", 2)
+
+
+def _check_limit(user_id: int, message: Optional[str] = None) -> None:
+    max_devices = _max_devices()
+    # Без request: под блокировкой нужен актуальный счет, а не запомненный
+    if utils.get_user_booked_count(user_id) >= max_devices:
+        raise BookingLimitReached(
+            message or f"Нельзя забронировать больше {max_devices} устройств одновременно."
+        )
+
+
+def _free(device: Dict[str, Any]) -> None:
+    device["status"] = "free"
+    device.pop("user_id", None)
+    device.pop("booking_expiration", None)
+    # Отметка отправленного напоминания относится к снятой брони
+    device.pop(storage.reminders.MARK, None)
+
+
+# ---------- операции ----------
+
+
+async def book(
+    device_id: int,
+    user_id: int,
+    expiration: datetime,
+    action: str,
+    *,
+    enforce_limit: bool = True,
+) -> Dict[str, Any]:
+    """Бронирует свободное устройство на user_id (free -> booked)."""
+    async with locked([device_id], [user_id] if enforce_limit else []):
+        device = utils.get_device_by_id(device_id)
+        if not device or device.get("status") != "free":
+            raise DeviceUnavailable("❌ Устройство уже забронировано или не найдено.")
+        if enforce_limit:
+            _check_limit(user_id)
+        async with storage.transaction_async():
+            device["status"] = "booked"
+            device["user_id"] = user_id
+            device["booking_expiration"] = expiration.isoformat()
+            await storage.save_devices_async()
+            await utils.log_action_async(device.get("sn", "N/A"), action)
+        return device
+
+
+async def release(device_id: int, action: str, *, owner_id: Optional[int] = None) -> Dict[str, Any]:
+    """Освобождает забронированное устройство (если задан owner_id — только его бронь)."""
+    async with locked([device_id]):
+        device = utils.get_device_by_id(device_id)
+        if (
+            not device
+            or device.get("status") != "booked"
+            or (owner_id is not None and device.get("user_id") != owner_id)
+        ):
+            raise DeviceUnavailable("❌ Устройство не найдено среди бронирований или уже освобождено.")
+        async with storage.transaction_async():
+            _free(device)
+            await storage.save_devices_async()
+            await utils.log_action_async(device["sn"], action)
+        return device
+
+
+async def release_many(devices: Iterable[Dict[str, Any]], action: str, *, owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Освобождает несколько устройств одной транзакцией; возвращает освобожденные.
+
+    Устройства, которые уже освобождены или сменили владельца, пропускаются.
+    """
+    device_ids = [d.get("id") for d in devices]
+    released: List[Dict[str, Any]] = []
+    async with locked(device_ids):
+        async with storage.transaction_async():
+            for device_id in device_ids:
+                device = utils.get_device_by_id(device_id)
+                if not device or device.get("status") != "booked":
+                    continue
+                if owner_id is not None and device.get("user_id") != owner_id:
+                    continue
+                _free(device)
+                await utils.log_action_async(device["sn"], action)
+                released.append(device)
+            if released:
+                await storage.save_devices_async()
+    return released
+
+
+async def transfer(device_id: int, from_user_id: int, to_user_id: int, action: str) -> Dict[str, Any]:
+    """Передает бронь устройства от from_user_id к to_user_id (срок сохраняется)."""
+    async with locked([device_id], [to_user_id]):
+        device = utils.get_booked_device(device_id, from_user_id)
+        if not device:
+            raise DeviceUnavailable("❌ Устройство не найдено или уже освобождено.")
+        _check_limit(
+            to_user_id,
+            f"❌ Новый владелец уже имеет максимальное количество устройств ({_max_devices()}).",
+        )
+        async with storage.transaction_async():
+            device["user_id"] = to_user_id
+            await storage.save_devices_async()
+            await utils.log_action_async(device["sn"], action)
+        return device
+
+
+async def release_expired(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Освобождает устройства с наступившим сроком брони (одной транзакцией)."""
+    now = now or datetime.now()
+    due = storage.expirations.pop_due(now)
+    released: List[Dict[str, Any]] = []
+    if not due:
+        return released
+    async with locked(due):
+        async with storage.transaction_async():
+            for device_id in due:
+                device = utils.get_device_by_id(device_id)
+                if not device or device.get("status") != "booked":
+                    continue
+                # Пока ждали блокировку, бронь могли продлить
+                try:
+                    if datetime.fromisoformat(device["booking_expiration"]) > now:
+                        continue
+                except (KeyError, TypeError, ValueError):
+                    pass
+                _free(device)
+                await utils.log_action_async(device["sn"], utils.EXPIRED_ACTION)
+                released.append(device)
+            if released:
+                await storage.save_devices_async()
+    return released
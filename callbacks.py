@@ -0,0 +1,80 @@
+"""callback_data inline-кнопок: коды действий и общий маршрутизатор.
+
+Кнопки создаются через callback("book_dev", device_id) — получается
+компактная строка версии 1 ("1:bd:42"). Обработчики назначаются в
+main._register_handlers (router.route), а разобранные аргументы читают из
+context.callback вместо повторного разбора query.data.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from libs.callback_router import CallbackRouter
+
+# Действие (оно же префикс старого формата) -> короткий код.
+# Коды попадают в кнопки отправленных сообщений: не менять и не переиспользовать.
+CALLBACK_CODES = {
+    # сканирование и передача
+    "scan_book": "sb",
+    "scan_release": "sr",
+    "scan_transfer": "st",
+    "scan_cancel": "sc",
+    "transfer_confirm": "tc",
+    "transfer_reject": "tr",
+    # устройства
+    "book_dev": "bd",
+    "admin_book_dev": "abd",
+    "admin_book_select": "abs",
+    "admin_book_cancel": "abc",
+    "release_dev": "rd",
+    "info_dev": "id",
+    "search_page": "sp",
+    "back_to_types": "bt",
+    "back_to_main": "bm",
+    "type": "ty",
+    "reg_group": "rg",
+    # администрирование устройств
+    "adm_rel": "ar",
+    "manage_devices_admin": "mda",
+    "admin_type": "at",
+    "admin_all_devices": "aad",
+    "view_booked_admin": "vba",
+    "add_device": "ad",
+    "edit_device": "ed",
+    "delete_device": "dd",
+    "export_devices_admin": "xd",
+    "export_users_admin": "xu",
+    "export_logs_admin": "xl",
+    "import_devices_admin": "im",
+    "toggle_registration": "treg",
+    # пользователи
+    "manage_users_admin": "mua",
+    "manage_users": "mu",
+    "approve_user": "au",
+    "reject_user": "ru",
+    "block_user": "bu",
+    "unblock_user": "uu",
+    "add_user": "nu",
+    "edit_user": "eu",
+    "delete_user": "du",
+    "list_all_users": "lu",
+    "back_to_admin": "ba",
+    # группы
+    "manage_groups_admin": "mga",
+    "add_group": "ag",
+    "edit_group": "eg",
+    "delete_group": "dg",
+    "rename_group": "rng",
+    "assign_group_users": "agu",
+    "assign_group_devices": "agd",
+    "toggle_group_user": "tgu",
+    "toggle_group_device": "tgd",
+}
+
+router = CallbackRouter(CALLBACK_CODES)
+
+
+def callback(action: str, *args: Any) -> str:
+    """callback_data кнопки: действие и аргументы в компактном формате."""
+    return router.encode(action, *args)
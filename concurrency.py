@@ -0,0 +1,104 @@
+"""Параллельная обработка обновлений Telegram.
+
+ChatOrderedUpdateProcessor обрабатывает обновления разных чатов
+параллельно (не больше ``max_concurrent_updates`` одновременно), а
+обновления одного чата — строго по очереди, поэтому состояние диалога
+(BotState в user_data) меняется в том же порядке, что и при
+последовательной обработке.
+
+heavy(kind) ограничивает число одновременных тяжелых операций
+(OCR, импорт, экспорт) отдельно от общего лимита.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+import storage
+from libs.keyed_locks import KeyedLocks
+
+# Лимиты тяжелых операций по умолчанию (heavy_handler_limits в config.json)
+DEFAULT_HEAVY_LIMITS = {"ocr": 2, "import": 1, "export": 2}
+
+# Сколько обновлений на один обрабатываемый может ждать в очереди своего чата
+PENDING_PER_SLOT = 4
+
+
+def chat_key(update: object) -> Optional[Any]:
+    """Ключ очереди обновления: чат, иначе пользователь (None — без очереди)."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельно по чатам, последовательно внутри чата.
+
+    Базовый класс ограничивает число принятых обновлений (в том числе
+    ждущих своей очереди в чате); собственный семафор — число реально
+    выполняемых, так что обновления, ждущие свой чат, не занимают слоты
+    обработки.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: Optional[int] = None) -> None:
+        super().__init__(max_pending_updates or max_concurrent_updates * PENDING_PER_SLOT)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats = KeyedLocks()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+        async with self._chats.get(key):
+            async with self._running:
+                await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def build_update_processor(config: Dict[str, Any]) -> Optional[ChatOrderedUpdateProcessor]:
+    """Процессор по config["concurrent_updates"]; None — последовательная обработка."""
+    limit = int(config.get("concurrent_updates") or 0)
+    if limit <= 1:
+        return None
+    return ChatOrderedUpdateProcessor(limit)
+
+
+# ---------- тяжелые операции ----------
+
+_heavy: Dict[str, asyncio.Semaphore] = {}
+
+
+def _heavy_semaphore(kind: str) -> asyncio.Semaphore:
+    semaphore = _heavy.get(kind)
+    if semaphore is None:
+        limits = {**DEFAULT_HEAVY_LIMITS, **(storage.config.get("heavy_handler_limits") or {})}
+        semaphore = asyncio.Semaphore(max(1, int(limits.get(kind, 1))))
+        _heavy[kind] = semaphore
+    return semaphore
+
+
+def reset_heavy_limits() -> None:
+    """Сбрасывает семафоры (после изменения heavy_handler_limits)."""
+    _heavy.clear()
+
+
+@asynccontextmanager
+async def heavy(kind: str) -> AsyncIterator[None]:
+    """Не больше heavy_handler_limits[kind] одновременных операций вида kind."""
+    async with _heavy_semaphore(kind):
+        yield
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import io
 import csv
 import re
 import os
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from telegram import (
     Update,
@@ -14,13 +15,23 @@ from telegram import (
     ReplyKeyboardMarkup,
     WebAppInfo,
 )
+from telegram.error import TimedOut
 from telegram.ext import ContextTypes
 
 import logging
+import booking
+import concurrency
 import storage
+import request_context
 import utils
 from access_control import access_control, main_menu_keyboard
+from callbacks import callback, router as callback_router
+from libs.callback_router import CallbackData
 from libs.device_importer import load_devices_from_file
+from libs.notifier import Notifier
+from libs.pagination import Page, page_buttons, page_of, with_page
+from libs.result_cursor import ResultCursor
+from request_context import RequestContext
 from states import BotState
 import json
 import base64
@@ -31,6 +42,10 @@ from urllib.parse import parse_qsl
 
 logger = logging.getLogger(__name__)
 
+# Исходящие уведомления: очередь с лимитами Telegram (~30 сообщений/с,
+# 1 сообщение/с в чат); workers запускаются при старте приложения (main.py)
+notifier = Notifier(rate=30, per_chat_interval=1.0, retryable=(TimedOut,))
+
 # Импорт для OCR (опционально, если библиотека установлена)
 try:
     import easyocr
@@ -116,8 +131,49 @@ def _group_label_short(group_id: Optional[int]) -> str:
     return label if len(label) <= 20 else label[:17] + "..."
 
 
-async def _notify_admins_about_registration(context: ContextTypes.DEFAULT_TYPE, user_data: Dict[str, Any]) -> None:
-    """Отправить уведомление администраторам о новой заявке."""
+# Записей на странице админских списков (устройства, назначение в группу);
+# у пользователей текст длиннее, поэтому страница меньше (лимит 4096 символов)
+ADMIN_PAGE_SIZE = 20
+USERS_PAGE_SIZE = 10
+
+
+def _page_navigation(base: str, page: Page) -> List[InlineKeyboardButton]:
+    """Ряд кнопок навигации по страницам экрана base (пустой — страница одна)."""
+    return [InlineKeyboardButton(text, callback_data=data) for text, data in page_buttons(base, page)]
+
+
+def _request(update: Update, context: ContextTypes.DEFAULT_TYPE) -> RequestContext:
+    """Контекст обновления (права, группа, запомненные значения) из access_control."""
+    return request_context.for_update(update, context)
+
+
+def _callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[CallbackData]:
+    """Разобранные callback_data нажатия: из маршрутизатора (context.callback)
+    или, при прямом вызове обработчика, разбором query.data."""
+    parsed = getattr(context, "callback", None)
+    if parsed is None and update.callback_query is not None:
+        parsed = callback_router.parse(update.callback_query.data)
+    return parsed
+
+
+def _callback_ids(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, count: int = 1
+) -> Optional[Tuple[int, ...]]:
+    """Числовые аргументы нажатия action (None — другое действие или формат)."""
+    parsed = _callback(update, context)
+    if parsed is None or parsed.action != action:
+        return None
+    return parsed.ints(count)
+
+
+def _callback_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Номер страницы из callback_data нажатия (0 — без номера)."""
+    parsed = _callback(update, context)
+    return parsed.page if parsed is not None else 0
+
+
+def _notify_admins_about_registration(user_data: Dict[str, Any]) -> None:
+    """Поставить в очередь уведомление администраторам о новой заявке."""
     admin_ids = storage.config.get("admin_ids", [])
     if not admin_ids:
         return
@@ -129,10 +185,7 @@ async def _notify_admins_about_registration(context: ContextTypes.DEFAULT_TYPE,
         f"👥 Группа ID: {user_data.get('group_id')}"
     )
     for admin_id in admin_ids:
-        try:
-            await context.bot.send_message(chat_id=admin_id, text=text)
-        except Exception:
-            continue
+        notifier.enqueue(admin_id, text, key=("registration", user_data.get("user_id")))
 
 
 # ==========
@@ -146,6 +199,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - Справка\n"
         "/register - Отправить заявку на регистрацию\n"
         "/set_name Имя Фамилия - Установить отображаемое имя\n"
+        "/reload_config - Перечитать config.json (администратор)\n"
         "\nОсновные кнопки в меню зависят от вашей роли."
     )
 
@@ -163,7 +217,7 @@ async def set_name_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Используйте формат: /set_name Имя Фамилия")
         return
     user["display_name"] = name_text
-    storage.save_users()
+    await storage.save_users_async()
     await update.message.reply_text(f"Отображаемое имя обновлено: {name_text}")
 
 
@@ -225,7 +279,7 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tg_user = update.effective_user
     user_id = tg_user.id
 
-    if any(u.get("user_id") == user_id for u in storage.users):
+    if utils.get_user_by_id(user_id) is not None:
         await update.message.reply_text(
             "Вы уже зарегистрированы или ваша заявка ожидает рассмотрения."
         )
@@ -254,7 +308,7 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         inline_buttons.append([
             InlineKeyboardButton(
                 f"{group.get('name', 'Без названия')} (ID: {group_id})",
-                callback_data=f"reg_group_{group_id}"
+                callback_data=callback("reg_group", group_id)
             )
         ])
 
@@ -269,7 +323,7 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def register_group_select_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает выбор группы пользователем при регистрации."""
     query = update.callback_query
-    if not query or not query.data or not query.data.startswith("reg_group_"):
+    if not query or _callback_ids(update, context, "reg_group") is None:
         return
 
     await query.answer()
@@ -290,18 +344,13 @@ async def register_group_select_callback(update: Update, context: ContextTypes.D
         )
         return
 
-    if any(u.get("user_id") == pending["user_id"] for u in storage.users):
+    if utils.get_user_by_id(pending["user_id"]) is not None:
         _set_state(context, BotState.NONE)
         context.user_data.pop("pending_registration", None)
         await query.edit_message_text("Вы уже подали заявку или зарегистрированы.")
         return
 
-    match = re.match(r"reg_group_(\d+)", query.data)
-    if not match:
-        await query.edit_message_text("Некорректный формат выбора группы.")
-        return
-
-    group_id = int(match.group(1))
+    group_id = _callback_ids(update, context, "reg_group")[0]
     group = utils.get_group_by_id(group_id)
     if not group:
         await query.edit_message_text("Выбранная группа не найдена. Попробуйте еще раз.")
@@ -318,10 +367,10 @@ async def register_group_select_callback(update: Update, context: ContextTypes.D
             "group_id": group_id,
         }
     )
-    storage.save_users()
+    await storage.save_users_async()
 
     # Уведомляем админов
-    await _notify_admins_about_registration(context, storage.users[-1])
+    _notify_admins_about_registration(storage.users[-1])
 
     _set_state(context, BotState.NONE)
     context.user_data.pop("pending_registration", None)
@@ -339,7 +388,7 @@ async def toggle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
     msg = query.message if query else update.message
 
     storage.config["registration_enabled"] = not storage.config.get("registration_enabled", False)
-    storage.save_config()
+    await storage.save_config_async()
     state_text = "включена" if storage.config["registration_enabled"] else "выключена"
 
     if query:
@@ -350,64 +399,71 @@ async def toggle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
         await msg.reply_text(f"Регистрация сейчас: {state_text}")
 
 
+def reload_settings() -> Tuple[List[str], List[str]]:
+    """Перечитывает config.json (storage.reload_config) и сбрасывает зависящие от него лимиты.
+
+    Возвращает (примененные ключи, ключи, ждущие перезапуска).
+    """
+    changed, pending = storage.reload_config()
+    if "heavy_handler_limits" in changed:
+        concurrency.reset_heavy_limits()
+    if changed or pending:
+        logger.info("Config reloaded: changed=%s, restart required=%s", changed, pending)
+    return changed, pending
+
+
+@access_control(required_role="Admin")
+async def reload_config_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перечитывает config.json без перезапуска бота."""
+    try:
+        changed, pending = reload_settings()
+    except (OSError, ValueError) as e:
+        await update.message.reply_text(f"❌ Не удалось перечитать config.json: {e}\nНастройки не изменены.")
+        return
+    lines = [f"✅ Настройки перечитаны. Изменено: {', '.join(changed) if changed else 'ничего'}."]
+    if pending:
+        lines.append(f"⚠️ Вступят в силу после перезапуска: {', '.join(pending)}.")
+    await update.message.reply_text("\n".join(lines))
+
+
 # ==========
 # Устройства – список / бронирование / мои / освобождение
 # ==========
 
 def _search_devices_by_text(search_text: str) -> List[Dict[str, Any]]:
     """Поиск устройств по тексту (модель, название, тип, серийный номер)."""
-    search_text = search_text.strip().upper()
+    search_text = search_text.strip()
     if not search_text or len(search_text) < 2:
         return []
-    
-    results = []
-    for device in storage.devices:
-        # Поиск в названии
-        if search_text in device.get("name", "").upper():
-            results.append(device)
-            continue
-        # Поиск в типе
-        if search_text in device.get("type", "").upper():
-            results.append(device)
-            continue
-        # Поиск в серийном номере
-        if search_text in device.get("sn", "").upper():
-            results.append(device)
-            continue
-    
-    return results
+    # Триграммный индекс вместо прохода по всем устройствам
+    return storage.device_search.search(search_text)
 
 
-@access_control()
-async def search_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Поиск устройств по введенному тексту."""
-    utils.cleanup_expired_bookings()
-    
-    search_text = update.message.text.strip()
-    if len(search_text) < 2:
-        await update.message.reply_text(
-            "Введите минимум 2 символа для поиска.",
-            reply_markup=main_menu_keyboard(update.effective_user.id)
-        )
-        return
-    
-    all_devices = _search_devices_by_text(search_text)
-    
-    # Фильтруем устройства по группе пользователя
-    user_id = update.effective_user.id
+# Результатов поиска на странице; курсор листается кнопками ◀️/▶️
+SEARCH_PAGE_SIZE = 10
+# Ключ user_data с курсором последнего поиска
+SEARCH_CURSOR_KEY = "search_cursor"
+
+
+def _ranked_device_search(search_text: str, user_id: int) -> Iterator[Any]:
+    """Устройства по релевантности (точный SN, начало SN, начало названия,
+    подстрока), видимые пользователю; вычисляются по мере чтения."""
+    found = storage.device_search.ranked(search_text, exact=("sn",), prefix=("sn", "name"))
+    visible = utils.device_visibility(user_id)
+    return found if visible is None else filter(visible, found)
+
+
+def _render_search_page(cursor: ResultCursor, page: int, user_id: int):
+    """Текст и клавиатура одной страницы результатов поиска."""
     is_admin = utils.is_admin(user_id)
-    devices = utils.filter_devices_by_user_group(user_id, all_devices)
-    
-    if not devices:
-        await update.message.reply_text(
-            f"❌ По запросу '{search_text}' ничего не найдено в вашей группе.\n\n"
-            "Попробуйте другой запрос или используйте меню.",
-            reply_markup=main_menu_keyboard(update.effective_user.id)
-        )
-        return
-    
-    # Показываем найденные устройства с кнопками
-    lines = [f"🔍 Найдено устройств: {len(devices)}\n"]
+    devices = cursor.page(page)
+    first = page * cursor.page_size + 1
+    has_next = cursor.has_page(page + 1)
+    total = cursor.total()
+    header = f"🔍 Найдено устройств: {total}" if total is not None else "🔍 Найдено устройств"
+    if total is None or total > cursor.page_size:
+        header += f" (показаны {first}–{first + len(devices) - 1})"
+    lines = [header + "\n"]
     inline_buttons = []
     
     for device in devices:
@@ -425,48 +481,111 @@ async def search_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
             row = [
                 InlineKeyboardButton(
                     f"✅ {name} (SN: {sn})",
-                    callback_data=f"book_dev_{device['id']}"
+                    callback_data=callback("book_dev", device["id"])
                 )
             ]
             if is_admin:
                 row.append(
                     InlineKeyboardButton(
                         "👑 На пользователя",
-                        callback_data=f"admin_book_dev_{device['id']}",
+                        callback_data=callback("admin_book_dev", device["id"]),
                     )
                 )
             inline_buttons.append(row)
         elif device_user_id == user_id:
-            expiration = utils.format_datetime(device.get("booking_expiration"))
             inline_buttons.append([
                 InlineKeyboardButton(
                     f"🔓 {name} (SN: {sn}) - Освободить",
-                    callback_data=f"release_dev_{device['id']}"
+                    callback_data=callback("release_dev", device["id"])
                 )
             ])
     
-    text = "\n".join(lines)
-    inline_buttons.append([InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_main")])
+    navigation = []
+    if page > 0:
+        navigation.append(
+            InlineKeyboardButton("◀️ Назад", callback_data=callback("search_page", cursor.token, page - 1))
+        )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton("▶️ Далее", callback_data=callback("search_page", cursor.token, page + 1))
+        )
+    if navigation:
+        inline_buttons.append(navigation)
+    inline_buttons.append([InlineKeyboardButton("◀️ Главное меню", callback_data=callback("back_to_main"))])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_buttons)
+
+
+@access_control()
+async def search_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск устройств по введенному тексту.
+
+    Результаты ранжируются и показываются постранично: курсор сохраняется
+    в user_data, и листание страниц не повторяет поиск.
+    """
+    search_text = update.message.text.strip()
+    if len(search_text) < 2:
+        await update.message.reply_text(
+            "Введите минимум 2 символа для поиска.",
+            reply_markup=main_menu_keyboard(update.effective_user.id)
+        )
+        return
     
-    await update.message.reply_text(
-        text,
-        parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(inline_buttons) if inline_buttons else None,
-    )
+    user_id = update.effective_user.id
+    cursor = ResultCursor(_ranked_device_search(search_text, user_id), SEARCH_PAGE_SIZE)
+    
+    if not cursor.has_page(0):
+        context.user_data.pop(SEARCH_CURSOR_KEY, None)
+        await update.message.reply_text(
+            f"❌ По запросу '{search_text}' ничего не найдено в вашей группе.\n\n"
+            "Попробуйте другой запрос или используйте меню.",
+            reply_markup=main_menu_keyboard(update.effective_user.id)
+        )
+        return
+    
+    context.user_data[SEARCH_CURSOR_KEY] = cursor
+    text, reply_markup = _render_search_page(cursor, 0, user_id)
+    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=reply_markup)
+
+
+@access_control()
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание результатов поиска (аргументы: token курсора, страница)."""
+    query = update.callback_query
+    ids = _callback_ids(update, context, "search_page", 2)
+    cursor = context.user_data.get(SEARCH_CURSOR_KEY)
+    if ids is None or cursor is None or cursor.token != ids[0]:
+        await query.answer("Результаты поиска устарели, повторите поиск.", show_alert=True)
+        return
+    page = ids[1]
+    if not cursor.has_page(page):
+        await query.answer("Больше результатов нет.")
+        return
+    await query.answer()
+    text, reply_markup = _render_search_page(cursor, page, update.effective_user.id)
+    await query.edit_message_text(text, parse_mode="Markdown", reply_markup=reply_markup)
+
+
+def _visible_type_counts(request: RequestContext, status: Optional[str] = None) -> Dict[str, int]:
+    """Количество видимых пользователю устройств по типам (из счетчиков storage)."""
+    return storage.device_counts.by_type(utils.visible_group_ids(request.user_id, request=request), status)
+
+
+def _device_type_buttons(counts: Dict[str, int]) -> List[List[InlineKeyboardButton]]:
+    return [
+        [InlineKeyboardButton(f"📦 {dev_type} ({counts[dev_type]})", callback_data=callback("type", dev_type))]
+        for dev_type in sorted(counts)
+    ]
 
 
 @access_control()
 async def list_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает типы устройств для выбора (фильтрованные по группе пользователя)."""
-    utils.cleanup_expired_bookings()
-    user_id = update.effective_user.id
-    is_admin = utils.is_admin(user_id)
+    request = _request(update, context)
     
-    # Фильтруем устройства по группе пользователя
-    available_devices = utils.filter_devices_by_user_group(user_id, storage.devices)
+    counts = _visible_type_counts(request)
     
-    if not available_devices:
-        user_group = utils.get_user_group(user_id)
+    if not counts:
+        user_group = request.group
         if not user_group:
             await update.message.reply_text(
                 "❌ У вас не назначена группа. Обратитесь к администратору для назначения группы."
@@ -475,33 +594,20 @@ async def list_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Нет устройств для отображения в вашей группе.")
         return
 
-    # Группируем устройства по типам
-    types = sorted(set(d.get("type", "Неизвестно") for d in available_devices))
-    
-    inline_buttons = []
-    for dev_type in types:
-        count = len([d for d in available_devices if d.get("type") == dev_type])
-        inline_buttons.append([InlineKeyboardButton(f"📦 {dev_type} ({count})", callback_data=f"type_{dev_type}")])
-    
     await update.message.reply_text(
         "📱 Выберите тип устройства:",
-        reply_markup=InlineKeyboardMarkup(inline_buttons),
+        reply_markup=InlineKeyboardMarkup(_device_type_buttons(counts)),
     )
     _set_state(context, BotState.VIEWING_DEVICE_MODELS)
 
 
 @access_control()
 async def book_device_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    utils.cleanup_expired_bookings()
-    user_id = update.effective_user.id
-    available_devices = [
-        d for d in utils.filter_devices_by_user_group(user_id, storage.devices)
-        if d.get("status") == "free"
-    ]
-    if not available_devices:
+    free_counts = _visible_type_counts(_request(update, context), status="free")
+    if not free_counts:
         await update.message.reply_text("Нет доступных устройств для бронирования в вашей группе.")
         return
-    types_available = sorted({d.get("type", "Неизвестно") for d in available_devices})
+    types_available = sorted(free_counts)
 
     kb = [[t] for t in types_available]
     kb.append(["Назад"])
@@ -514,18 +620,18 @@ async def book_device_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @access_control()
 async def select_device_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает модели выбранного типа с кнопками действий (фильтрованные по группе пользователя)."""
-    utils.cleanup_expired_bookings()
     text = update.message.text.strip()
     user_id = update.effective_user.id
-    is_admin = utils.is_admin(user_id)
+    request = _request(update, context)
+    is_admin = request.is_admin
     
     # Убираем эмодзи и количество, если есть
     dev_type = re.sub(r'^📦\s*', '', text)
     dev_type = re.sub(r'\s*\(\d+\)$', '', dev_type).strip()
     
     # Получаем все устройства этого типа и фильтруем по группе пользователя
-    all_devices = [d for d in storage.devices if d.get("type") == dev_type]
-    devices = utils.filter_devices_by_user_group(user_id, all_devices)
+    all_devices = storage.devices.find_by("type", dev_type)
+    devices = utils.filter_devices_by_user_group(user_id, all_devices, request=request)
     
     if not devices:
         await update.message.reply_text(
@@ -566,14 +672,14 @@ async def select_device_type(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 row = [
                     InlineKeyboardButton(
                         f"✅ {model_name} (SN: {sn})",
-                        callback_data=f"book_dev_{device['id']}"
+                        callback_data=callback("book_dev", device["id"])
                     )
                 ]
                 if is_admin:
                     row.append(
                         InlineKeyboardButton(
                             "👑 На пользователя",
-                            callback_data=f"admin_book_dev_{device['id']}",
+                            callback_data=callback("admin_book_dev", device["id"]),
                         )
                     )
                 inline_buttons.append(row)
@@ -583,7 +689,7 @@ async def select_device_type(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"🔓 {model_name} (SN: {sn}) - Освободить",
-                        callback_data=f"release_dev_{device['id']}"
+                        callback_data=callback("release_dev", device["id"])
                     )
                 ])
             else:
@@ -593,14 +699,14 @@ async def select_device_type(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"🔒 {model_name} (SN: {sn}) - Забронировано",
-                        callback_data=f"info_dev_{device['id']}"
+                        callback_data=callback("info_dev", device["id"])
                     )
                 ])
     
     text = f"📦 **{dev_type}**\n\n" + "\n".join(lines)
     
     if inline_buttons:
-        inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data="back_to_types")])
+        inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data=callback("back_to_types"))])
         await update.message.reply_text(
             text,
             parse_mode="Markdown",
@@ -616,7 +722,6 @@ async def select_device_type(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 @access_control()
 async def book_specific_device(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    utils.cleanup_expired_bookings()
     text = update.message.text.strip()
     
     # Проверяем, не является ли это выбором устройства при сканировании
@@ -634,7 +739,7 @@ async def book_specific_device(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
 
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device = utils.get_device_by_id(device_id)
     if not device:
         await update.message.reply_text("Ошибка: устройство не найдено.")
         return
@@ -651,11 +756,12 @@ async def book_specific_device(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     user_id = update.effective_user.id
+    request = _request(update, context)
     
     # Проверка принадлежности к группе (для не-админов)
-    if not utils.is_admin(user_id):
-        if not utils.can_user_book_device(user_id, device_id):
-            user_group = utils.get_user_group(user_id)
+    if not request.is_admin:
+        if not utils.can_user_book_device(user_id, device_id, request=request):
+            user_group = request.group
             device_group = utils.get_device_group(device_id)
             if not user_group:
                 await update.message.reply_text(
@@ -672,69 +778,114 @@ async def book_specific_device(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
             return
     
-    # лимит устройств
-    max_devices = storage.config.get("max_devices_per_user", 2)
-    current_count = len([d for d in storage.devices if d.get("user_id") == user_id and d.get("status") == "booked"])
-    if current_count >= max_devices:
-        await update.message.reply_text(
-            f"Нельзя забронировать больше {max_devices} устройств одновременно."
+    # Бронь (лимит устройств и статус проверяются под блокировкой)
+    expiration = booking.default_expiration(device)
+    try:
+        await booking.book(
+            device_id,
+            user_id,
+            expiration,
+            f"Забронировано пользователем {utils.get_user_full_name(user_id, request=request)} "
+            f"до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
         )
+    except booking.BookingError as e:
+        await update.message.reply_text(str(e))
         return
 
-    default_days = device.get(
-        "default_booking_period",
-        storage.config.get("default_booking_period_days", 1),
-    )
-    now = datetime.now()
-    expiration = now + timedelta(days=default_days)
-
-    device["status"] = "booked"
-    device["user_id"] = user_id
-    device["booking_expiration"] = expiration.isoformat()
-    storage.save_devices()
-
     await update.message.reply_text(
         f"Устройство {device['name']} (SN: {device['sn']}) "
         f"забронировано до {expiration.strftime('%Y-%m-%d %H:%M:%S')}."
     )
 
-    utils.log_action(
-        device["sn"],
-        f"Забронировано пользователем {utils.get_user_full_name(user_id)} "
-        f"до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
-    )
 
-    # уведомление перед окончанием брони
-    notify_before = storage.config.get("notify_before_minutes", 60)
-    delta = expiration - datetime.now() - timedelta(minutes=notify_before)
-    if delta.total_seconds() > 0:
-        context.application.job_queue.run_once(
-            notify_booking_expiring,
-            when=delta,
-            data={
-                "chat_id": update.effective_chat.id,
-                "device_name": device["name"],
-                "sn": device["sn"],
-                "expiration": expiration.strftime("%Y-%m-%d %H:%M:%S"),
-            },
-        )
+# ==========
+# Истечение броней и напоминания: по одному заданию job_queue на ближайший срок
+# ==========
 
+EXPIRATION_JOB_NAME = "booking_expiration"
+REMINDER_JOB_NAME = "booking_reminders"
 
-async def notify_booking_expiring(context: ContextTypes.DEFAULT_TYPE):
-    data = context.job.data
-    await context.bot.send_message(
-        chat_id=data["chat_id"],
-        text=(
-            f"Напоминание: срок бронирования устройства {data['device_name']} "
-            f"(SN: {data['sn']}) скоро истечёт.\n"
-            f"Дата окончания: {data['expiration']}"
-        ),
-    )
+
+def _arm_job(job_queue, scheduler, callback, name: str) -> None:
+    """Переставляет единственное задание name на ближайший срок scheduler."""
+    for job in job_queue.get_jobs_by_name(name):
+        job.schedule_removal()
+    deadline = scheduler.next_deadline()
+    if deadline is None:
+        return
+    delay = max((deadline - datetime.now()).total_seconds(), 0)
+    job_queue.run_once(callback, when=delay, name=name)
+
+
+def schedule_expiration_job(job_queue) -> None:
+    """Ставит (переставляет) задание освобождения на ближайший срок брони."""
+    _arm_job(job_queue, storage.expirations, expire_bookings_job, EXPIRATION_JOB_NAME)
+
+
+def schedule_reminder_job(job_queue) -> None:
+    """Ставит (переставляет) задание напоминаний на ближайшее напоминание."""
+    _arm_job(job_queue, storage.reminders, send_reminders_job, REMINDER_JOB_NAME)
+
+
+async def expire_bookings_job(context: ContextTypes.DEFAULT_TYPE):
+    """Освобождает устройства с наступившим сроком и ждет следующего срока."""
+    try:
+        await booking.release_expired()
+    finally:
+        schedule_expiration_job(context.job_queue)
+
+
+def _mark_reminded(device_id: int, expiration: str):
+    """on_done напоминания: отметить отправку в записи устройства."""
+
+    async def done(error: Optional[BaseException]) -> None:
+        if error is not None:
+            return
+        device = utils.get_device_by_id(device_id)
+        if device is None or device.get("booking_expiration") != expiration:
+            return
+        async with storage.transaction_async():
+            device[storage.reminders.MARK] = expiration
+            await storage.save_devices_async()
+
+    return done
+
+
+async def send_reminders_job(context: ContextTypes.DEFAULT_TYPE):
+    """Ставит наступившие напоминания в очередь отправки и ждет следующего срока.
+
+    Отправленное напоминание отмечается в записи устройства (reminded_for),
+    поэтому после перезапуска оно не повторяется, а неотправленные
+    восстанавливаются из броней при загрузке.
+    """
+    try:
+        now = datetime.now()
+        for device_id in storage.reminders.pop_due(now):
+            device = utils.get_device_by_id(device_id)
+            if device is None or device.get("status") != "booked" or device.get("user_id") is None:
+                continue
+            try:
+                expiration = datetime.fromisoformat(device["booking_expiration"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if expiration <= now:
+                continue
+            notifier.enqueue(
+                device["user_id"],
+                (
+                    f"Напоминание: срок бронирования устройства {device['name']} "
+                    f"(SN: {device['sn']}) скоро истечёт.\n"
+                    f"Дата окончания: {expiration.strftime('%Y-%m-%d %H:%M:%S')}"
+                ),
+                key=("reminder", device_id, device["booking_expiration"]),
+                on_done=_mark_reminded(device_id, device["booking_expiration"]),
+            )
+    finally:
+        schedule_reminder_job(context.job_queue)
 
 
 @access_control()
 async def my_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    utils.cleanup_expired_bookings()
     user_id = update.effective_user.id
     my_devs = utils.get_user_devices(user_id)
 
@@ -780,11 +931,9 @@ async def release_device_text(update: Update, context: ContextTypes.DEFAULT_TYPE
     dev = next(
         (
             d
-            for d in storage.devices
+            for d in utils.get_user_booked_devices(user_id)
             if d.get("name") == name
             and d.get("sn") == sn
-            and d.get("user_id") == user_id
-            and d.get("status") == "booked"
         ),
         None,
     )
@@ -792,12 +941,13 @@ async def release_device_text(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Устройство не найдено среди ваших бронирований.")
         return
 
-    dev["status"] = "free"
-    dev.pop("user_id", None)
-    dev.pop("booking_expiration", None)
-    storage.save_devices()
-
-    utils.log_action(dev["sn"], f"Освобождено пользователем {utils.get_user_full_name(user_id)}")
+    try:
+        await booking.release(
+            dev["id"], f"Освобождено пользователем {utils.get_user_full_name(user_id)}", owner_id=user_id
+        )
+    except booking.BookingError:
+        await update.message.reply_text("Устройство не найдено среди ваших бронирований.")
+        return
 
     await update.message.reply_text(
         f"Устройство {dev['name']} (SN: {dev['sn']}) успешно освобождено.",
@@ -808,17 +958,15 @@ async def release_device_text(update: Update, context: ContextTypes.DEFAULT_TYPE
 @access_control()
 async def release_all_user_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    any_released = False
-    for d in storage.devices:
-        if d.get("user_id") == user_id and d.get("status") == "booked":
-            d["status"] = "free"
-            d.pop("user_id", None)
-            d.pop("booking_expiration", None)
-            utils.log_action(d["sn"], f"Освобождено пользователем {utils.get_user_full_name(user_id)}")
-            any_released = True
+    any_released = bool(
+        await booking.release_many(
+            utils.get_user_booked_devices(user_id),
+            f"Освобождено пользователем {utils.get_user_full_name(user_id)}",
+            owner_id=user_id,
+        )
+    )
 
     if any_released:
-        storage.save_devices()
         await update.message.reply_text(
             "Все ваши устройства освобождены.",
             reply_markup=main_menu_keyboard(user_id),
@@ -870,12 +1018,10 @@ async def manage_devices_callback(update: Update, context: ContextTypes.DEFAULT_
     else:
         msg = update.message
     
-    utils.cleanup_expired_bookings()
-    
     if not storage.devices:
         kb = [
-            [InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device")],
-            [InlineKeyboardButton("📥 Импорт устройств", callback_data="import_devices_admin")],
+            [InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device"))],
+            [InlineKeyboardButton("📥 Импорт устройств", callback_data=callback("import_devices_admin"))],
         ]
         if query:
             await query.edit_message_text(
@@ -910,14 +1056,14 @@ async def manage_devices_callback(update: Update, context: ContextTypes.DEFAULT_
             lines.append(device_info)
             
             inline_buttons.append([
-                InlineKeyboardButton(f"✏️ Изменить {device['id']}", callback_data=f"edit_device_{device['id']}"),
-                InlineKeyboardButton(f"🗑️ Удалить {device['id']}", callback_data=f"delete_device_{device['id']}")
+                InlineKeyboardButton(f"✏️ Изменить {device['id']}", callback_data=callback("edit_device", device["id"])),
+                InlineKeyboardButton(f"🗑️ Удалить {device['id']}", callback_data=callback("delete_device", device["id"]))
             ])
         lines.append("")
     
     text = f"📋 **Все устройства** ({len(storage.devices)} шт.)\n\n" + "\n\n".join(lines)
-    inline_buttons.append([InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device")])
-    inline_buttons.append([InlineKeyboardButton("📥 Импорт устройств", callback_data="import_devices_admin")])
+    inline_buttons.append([InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device"))])
+    inline_buttons.append([InlineKeyboardButton("📥 Импорт устройств", callback_data=callback("import_devices_admin"))])
     
     if query:
         await query.edit_message_text(
@@ -939,12 +1085,10 @@ async def manage_devices_admin_callback(update: Update, context: ContextTypes.DE
     if query:
         await query.answer()
     
-    utils.cleanup_expired_bookings()
-    
     if not storage.devices:
         kb = [
-            [InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device")],
-            [InlineKeyboardButton("📥 Импорт устройств", callback_data="import_devices_admin")],
+            [InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device"))],
+            [InlineKeyboardButton("📥 Импорт устройств", callback_data=callback("import_devices_admin"))],
         ]
         if query:
             await query.edit_message_text(
@@ -958,13 +1102,8 @@ async def manage_devices_admin_callback(update: Update, context: ContextTypes.DE
             )
         return
     
-    # Группируем устройства по типам
-    types = {}
-    for device in storage.devices:
-        dev_type = device.get("type", "Неизвестно")
-        if dev_type not in types:
-            types[dev_type] = 0
-        types[dev_type] += 1
+    # Количество по типам — из счетчиков storage
+    types = storage.device_counts.by_type()
     
     # Создаем кнопки для каждого типа
     inline_buttons = []
@@ -973,7 +1112,7 @@ async def manage_devices_admin_callback(update: Update, context: ContextTypes.DE
         inline_buttons.append([
             InlineKeyboardButton(
                 f"📦 {dev_type} ({count})",
-                callback_data=f"admin_type_{dev_type}"
+                callback_data=with_page(callback("admin_type", dev_type), 0)
             )
         ])
     
@@ -981,19 +1120,19 @@ async def manage_devices_admin_callback(update: Update, context: ContextTypes.DE
     inline_buttons.append([
         InlineKeyboardButton(
             f"📋 Все устройства ({len(storage.devices)})",
-            callback_data="admin_all_devices"
+            callback_data=callback("admin_all_devices")
         )
     ])
-    inline_buttons.append([InlineKeyboardButton("📥 Импорт устройств", callback_data="import_devices_admin")])
+    inline_buttons.append([InlineKeyboardButton("📥 Импорт устройств", callback_data=callback("import_devices_admin"))])
     
     # Кнопка добавления устройства
     inline_buttons.append([
-        InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device")
+        InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device"))
     ])
     
     # Кнопка назад в админ-панель
     inline_buttons.append([
-        InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")
+        InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_admin"))
     ])
     
     text = "📋 **Управление устройствами**\n\nВыберите тип устройств для управления:"
@@ -1026,8 +1165,7 @@ async def view_booked_admin_callback(update: Update, context: ContextTypes.DEFAU
     if query:
         await query.answer()
     
-    utils.cleanup_expired_bookings()
-    booked = [d for d in storage.devices if d.get("status") == "booked"]
+    booked = storage.devices.find_by("status", "booked")
     if not booked:
         if query:
             await query.edit_message_text("Нет забронированных устройств.")
@@ -1053,12 +1191,12 @@ async def view_booked_admin_callback(update: Update, context: ContextTypes.DEFAU
         lines.append(device_info)
         
         inline_buttons.append([
-            InlineKeyboardButton(f"🔓 Освободить {device['id']}", callback_data=f"adm_rel_{device['id']}")
+            InlineKeyboardButton(f"🔓 Освободить {device['id']}", callback_data=callback("adm_rel", device["id"]))
         ])
     
     text = f"🔒 **Забронированные устройства** ({len(booked)} шт.)\n\n" + "\n\n".join(lines)
-    inline_buttons.append([InlineKeyboardButton("🔓 Освободить все", callback_data="adm_rel_all")])
-    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+    inline_buttons.append([InlineKeyboardButton("🔓 Освободить все", callback_data=callback("adm_rel", "all"))])
+    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_admin"))])
     
     if query:
         await query.edit_message_text(
@@ -1077,8 +1215,7 @@ async def view_booked_admin_callback(update: Update, context: ContextTypes.DEFAU
 @access_control(required_role="Admin")
 async def view_all_booked(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает забронированные устройства с кнопками."""
-    utils.cleanup_expired_bookings()
-    booked = [d for d in storage.devices if d.get("status") == "booked"]
+    booked = storage.devices.find_by("status", "booked")
     if not booked:
         await update.message.reply_text("Нет забронированных устройств.")
         return
@@ -1101,11 +1238,11 @@ async def view_all_booked(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lines.append(device_info)
         
         inline_buttons.append([
-            InlineKeyboardButton(f"🔓 Освободить {device['id']}", callback_data=f"adm_rel_{device['id']}")
+            InlineKeyboardButton(f"🔓 Освободить {device['id']}", callback_data=callback("adm_rel", device["id"]))
         ])
     
     text = f"🔒 **Забронированные устройства** ({len(booked)} шт.)\n\n" + "\n\n".join(lines)
-    inline_buttons.append([InlineKeyboardButton("🔓 Освободить все", callback_data="adm_rel_all")])
+    inline_buttons.append([InlineKeyboardButton("🔓 Освободить все", callback_data=callback("adm_rel", "all"))])
     
     await update.message.reply_text(
         text,
@@ -1118,40 +1255,38 @@ async def view_all_booked(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_release_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    data = query.data
-
-    if data == "adm_rel_all":
-        released = False
-        for d in storage.devices:
-            if d.get("status") == "booked":
-                d["status"] = "free"
-                d.pop("user_id", None)
-                d.pop("booking_expiration", None)
-                utils.log_action(d["sn"], "Освобождено администратором (массово)")
-                released = True
+    parsed = _callback(update, context)
+
+    if parsed is not None and parsed.action == "adm_rel" and parsed.args == ("all",):
+        released = bool(
+            await booking.release_many(
+                storage.devices.find_by("status", "booked"), "Освобождено администратором (массово)"
+            )
+        )
         if released:
-            storage.save_devices()
             await query.edit_message_text("Все устройства освобождены.")
         else:
             await query.edit_message_text("Нет забронированных устройств.")
         return
 
-    match = re.match(r"adm_rel_(\d+)", data)
-    if not match:
+    ids = _callback_ids(update, context, "adm_rel")
+    if ids is None:
         await query.edit_message_text("Некорректный формат команды.")
         return
 
-    dev_id = int(match.group(1))
-    dev = next((d for d in storage.devices if d.get("id") == dev_id and d.get("status") == "booked"), None)
+    dev_id = ids[0]
+    dev = utils.get_device_by_id(dev_id)
+    if dev and dev.get("status") != "booked":
+        dev = None
     if not dev:
         await query.edit_message_text("Устройство уже освобождено или не найдено.")
         return
 
-    dev["status"] = "free"
-    dev.pop("user_id", None)
-    dev.pop("booking_expiration", None)
-    storage.save_devices()
-    utils.log_action(dev["sn"], "Освобождено администратором")
+    try:
+        await booking.release(dev_id, "Освобождено администратором")
+    except booking.BookingError:
+        await query.edit_message_text("Устройство уже освобождено или не найдено.")
+        return
 
     await query.edit_message_text(
         f"Устройство {dev['name']} (SN: {dev['sn']}) освобождено администратором."
@@ -1191,12 +1326,12 @@ async def admin_devices_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
     match_del = re.match(r"del\s+(\d+)", text, re.IGNORECASE)
     if match_del:
         dev_id = int(match_del.group(1))
-        dev = next((d for d in storage.devices if d.get("id") == dev_id), None)
+        dev = utils.get_device_by_id(dev_id)
         if not dev:
             await update.message.reply_text("Устройство не найдено.")
             return
         storage.devices.remove(dev)
-        storage.save_devices()
+        await storage.save_devices_async()
         await update.message.reply_text(f"Устройство {dev['name']} (SN: {dev['sn']}) удалено.")
         return
 
@@ -1205,13 +1340,13 @@ async def admin_devices_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if match_ren:
         dev_id = int(match_ren.group(1))
         new_name = match_ren.group(2).strip()
-        dev = next((d for d in storage.devices if d.get("id") == dev_id), None)
+        dev = utils.get_device_by_id(dev_id)
         if not dev:
             await update.message.reply_text("Устройство не найдено.")
             return
         old = dev["name"]
         dev["name"] = new_name
-        storage.save_devices()
+        await storage.save_devices_async()
         await update.message.reply_text(f"Имя устройства изменено: {old} → {new_name}")
         return
 
@@ -1310,7 +1445,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
             "group_id": group_id,
         }
         storage.devices.append(device)
-        storage.save_devices()
+        await storage.save_devices_async()
         group_name = group.get("name", "Без названия")
         _set_state(context, BotState.NONE)
         context.user_data.pop("new_device_data", None)
@@ -1331,7 +1466,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
         
         if edit_device_id:
             # Редактирование устройства
-            device = next((d for d in storage.devices if d.get("id") == edit_device_id), None)
+            device = utils.get_device_by_id(edit_device_id)
             if not device:
                 await update.message.reply_text("Устройство не найдено.")
                 _set_state(context, BotState.NONE)
@@ -1365,7 +1500,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
             device["sn"] = sn
             device["type"] = dev_type
             device["group_id"] = group_id
-            storage.save_devices()
+            await storage.save_devices_async()
             
             _set_state(context, BotState.NONE)
             edit_device_type = context.user_data.pop("edit_device_type", old_type)
@@ -1410,7 +1545,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 "group_id": None,
             }
         )
-        storage.save_devices()
+        await storage.save_devices_async()
         _set_state(context, BotState.NONE)
         await update.message.reply_text(f"Устройство {name} добавлено.")
         return
@@ -1441,7 +1576,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
             
             old_name = group.get("name")
             group["name"] = group_name
-            storage.save_groups()
+            await storage.save_groups_async()
             _set_state(context, BotState.NONE)
             context.user_data.pop("rename_group_id", None)
             
@@ -1465,7 +1600,7 @@ async def handle_state_message(update: Update, context: ContextTypes.DEFAULT_TYP
             "id": new_id,
             "name": group_name
         })
-        storage.save_groups()
+        await storage.save_groups_async()
         _set_state(context, BotState.NONE)
         
         await update.message.reply_text(
@@ -1514,7 +1649,8 @@ async def process_devices_csv(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     added = 0
     try:
-        rows = load_devices_from_file(file_path)
+        async with concurrency.heavy("import"):
+            rows = await asyncio.to_thread(load_devices_from_file, file_path)
         max_id = max([d.get("id", 0) for d in storage.devices], default=0)
         for row in rows:
             if not row["SN"] and not row["Name"]:
@@ -1541,7 +1677,9 @@ async def process_devices_csv(update: Update, context: ContextTypes.DEFAULT_TYPE
                 }
             )
             added += 1
-        storage.save_devices()
+        await storage.save_devices_async()
+        # Барьер: импорт должен лечь на диск до ответа администратору
+        await storage.flush_async()
         await update.message.reply_text(f"Устройства импортированы. Добавлено: {added}.")
     except ValueError as err:
         await update.message.reply_text(f"Ошибка импорта: {err}")
@@ -1561,7 +1699,7 @@ async def process_devices_csv(update: Update, context: ContextTypes.DEFAULT_TYPE
 @access_control(required_role="Admin")
 async def manage_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Управление пользователями с кнопками действий."""
-    pending = [u for u in storage.users if u.get("status") == "pending"]
+    pending = storage.users.find_by("status", "pending")
     
     # Показываем ожидающие заявки
     if pending:
@@ -1583,14 +1721,14 @@ async def manage_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
             lines.append(user_info)
             
             inline_buttons.append([
-                InlineKeyboardButton(f"✅ Утвердить {u['user_id']}", callback_data=f"approve_user_{u['user_id']}"),
-                InlineKeyboardButton(f"❌ Отклонить {u['user_id']}", callback_data=f"reject_user_{u['user_id']}"),
-                InlineKeyboardButton(f"🚫 Блокировать", callback_data=f"block_user_{u['user_id']}")
+                InlineKeyboardButton(f"✅ Утвердить {u['user_id']}", callback_data=callback("approve_user", u["user_id"])),
+                InlineKeyboardButton(f"❌ Отклонить {u['user_id']}", callback_data=callback("reject_user", u["user_id"])),
+                InlineKeyboardButton(f"🚫 Блокировать", callback_data=callback("block_user", u["user_id"]))
             ])
         
         text = "⏳ **Ожидающие заявки**\n\n" + "\n".join(lines)
-        inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data="add_user")])
-        inline_buttons.append([InlineKeyboardButton("📋 Все пользователи", callback_data="list_all_users")])
+        inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data=callback("add_user"))])
+        inline_buttons.append([InlineKeyboardButton("📋 Все пользователи", callback_data=callback("list_all_users"))])
         
         await update.message.reply_text(
             text,
@@ -1600,8 +1738,8 @@ async def manage_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         # Нет ожидающих заявок, показываем кнопку добавления и список всех
         kb = [
-            [InlineKeyboardButton("➕ Добавить пользователя", callback_data="add_user")],
-            [InlineKeyboardButton("📋 Все пользователи", callback_data="list_all_users")],
+            [InlineKeyboardButton("➕ Добавить пользователя", callback_data=callback("add_user"))],
+            [InlineKeyboardButton("📋 Все пользователи", callback_data=callback("list_all_users"))],
         ]
         await update.message.reply_text(
             "✅ Нет ожидающих заявок.",
@@ -1610,7 +1748,7 @@ async def manage_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def list_all_users_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает всех пользователей с кнопками действий."""
+    """Показывает пользователей с кнопками действий, постранично (в порядке списка)."""
     query = update.callback_query
     await query.answer()
     
@@ -1618,10 +1756,11 @@ async def list_all_users_callback(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("Нет пользователей.")
         return
     
+    page = page_of(len(storage.users), _callback_page(update, context), USERS_PAGE_SIZE)
     lines = []
     inline_buttons = []
     
-    for u in storage.users:
+    for u in storage.users[page.start:page.stop]:
         status_emoji = "✅" if u.get("status") == "active" else "⏳"
         role_emoji = "👑" if u.get("role") == "Admin" else "👤"
         
@@ -1645,17 +1784,20 @@ async def list_all_users_callback(update: Update, context: ContextTypes.DEFAULT_
         lines.append(user_info)
         
         inline_buttons.append([
-            InlineKeyboardButton(f"✏️ Изменить {u['user_id']}", callback_data=f"edit_user_{u['user_id']}"),
-            InlineKeyboardButton(f"🗑️ Удалить {u['user_id']}", callback_data=f"delete_user_{u['user_id']}"),
+            InlineKeyboardButton(f"✏️ Изменить {u['user_id']}", callback_data=callback("edit_user", u["user_id"])),
+            InlineKeyboardButton(f"🗑️ Удалить {u['user_id']}", callback_data=callback("delete_user", u["user_id"])),
             InlineKeyboardButton(
                 "🚫 Заблокировать" if u.get("status") != "blocked" else "🔓 Разблокировать",
-                callback_data=("block_user_" if u.get("status") != "blocked" else "unblock_user_") + str(u["user_id"])
+                callback_data=callback("block_user" if u.get("status") != "blocked" else "unblock_user", u["user_id"])
             )
         ])
     
     text = f"👥 **Все пользователи** ({len(storage.users)} шт.)\n\n" + "\n\n".join(lines)
-    inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data="add_user")])
-    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+    navigation = _page_navigation(callback("list_all_users"), page)
+    if navigation:
+        inline_buttons.append(navigation)
+    inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data=callback("add_user"))])
+    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_admin"))])
     
     await query.edit_message_text(
         text,
@@ -1696,7 +1838,7 @@ async def admin_users_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пользователь не найден.")
             return
         user["status"] = "active"
-        storage.save_users()
+        await storage.save_users_async()
         await update.message.reply_text(f"Пользователь @{user.get('username')} утверждён.")
         return
 
@@ -1709,7 +1851,7 @@ async def admin_users_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пользователь не найден.")
             return
         storage.users.remove(user)
-        storage.save_users()
+        await storage.save_users_async()
         await update.message.reply_text(f"Заявка пользователя @{user.get('username')} отклонена и удалена.")
         return
 
@@ -1752,7 +1894,7 @@ async def admin_users_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пользователь не найден.")
             return
         storage.users.remove(user)
-        storage.save_users()
+        await storage.save_users_async()
         await update.message.reply_text("Пользователь удалён.")
         return
 
@@ -1765,7 +1907,7 @@ async def admin_users_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пользователь не найден.")
             return
         user["status"] = "blocked"
-        storage.save_users()
+        await storage.save_users_async()
         await update.message.reply_text(f"Пользователь @{user.get('username')} заблокирован.")
         return
 
@@ -1778,7 +1920,7 @@ async def admin_users_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пользователь не найден.")
             return
         user["status"] = "active"
-        storage.save_users()
+        await storage.save_users_async()
         await update.message.reply_text(f"Пользователь @{user.get('username')} разблокирован.")
         return
 
@@ -1907,7 +2049,7 @@ async def handle_state_user_message(update: Update, context: ContextTypes.DEFAUL
                 "phone": phone,  # Сохраняем телефон
             }
         )
-        storage.save_users()
+        await storage.save_users_async()
         _set_state(context, BotState.NONE)
         await update.message.reply_text("Данные пользователя обновлены.")
         return
@@ -1930,7 +2072,7 @@ async def handle_state_user_message(update: Update, context: ContextTypes.DEFAUL
         
         pending_user["group_id"] = group_id
         storage.users.append({k: v for k, v in pending_user.items() if k != "source"})
-        storage.save_users()
+        await storage.save_users_async()
         
         source = pending_user.get("source")
         _set_state(context, BotState.NONE)
@@ -1962,19 +2104,19 @@ async def approve_user_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"approve_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "approve_user")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
         return
     
     user["status"] = "active"
-    storage.save_users()
+    await storage.save_users_async()
     await query.edit_message_text(f"✅ Пользователь @{user.get('username')} утверждён.")
     
     # Обновляем список
@@ -1986,12 +2128,12 @@ async def reject_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"reject_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "reject_user")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
@@ -1999,7 +2141,7 @@ async def reject_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     username = user.get('username', 'N/A')
     storage.users.remove(user)
-    storage.save_users()
+    await storage.save_users_async()
     await query.edit_message_text(f"❌ Заявка пользователя @{username} отклонена и удалена.")
     
     # Обновляем список
@@ -2010,16 +2152,16 @@ async def block_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Блокировка пользователя (игнорируется ботом)."""
     query = update.callback_query
     await query.answer()
-    match = re.match(r"block_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "block_user")
+    if ids is None:
         return
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
         return
     user["status"] = "blocked"
-    storage.save_users()
+    await storage.save_users_async()
     await query.edit_message_text(f"🚫 Пользователь @{user.get('username')} заблокирован.")
     await manage_users_callback(update, context)
 
@@ -2028,16 +2170,16 @@ async def unblock_user_callback(update: Update, context: ContextTypes.DEFAULT_TY
     """Разблокировка пользователя (делаем active)."""
     query = update.callback_query
     await query.answer()
-    match = re.match(r"unblock_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "unblock_user")
+    if ids is None:
         return
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
         return
     user["status"] = "active"
-    storage.save_users()
+    await storage.save_users_async()
     await query.edit_message_text(f"🔓 Пользователь @{user.get('username')} разблокирован.")
     await manage_users_callback(update, context)
 
@@ -2047,12 +2189,12 @@ async def edit_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"edit_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "edit_user")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
@@ -2083,12 +2225,12 @@ async def delete_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"delete_user_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "delete_user")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    user_id = int(match.group(1))
+    user_id = ids[0]
     user = utils.get_user_by_id(user_id)
     if not user:
         await query.edit_message_text("Пользователь не найден.")
@@ -2096,7 +2238,7 @@ async def delete_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     username = user.get('username', 'N/A')
     storage.users.remove(user)
-    storage.save_users()
+    await storage.save_users_async()
     await query.edit_message_text(f"🗑️ Пользователь @{username} удалён.")
     
     # Обновляем список
@@ -2112,7 +2254,7 @@ async def manage_users_callback(update: Update, context: ContextTypes.DEFAULT_TY
     else:
         msg = update.message
     
-    pending = [u for u in storage.users if u.get("status") == "pending"]
+    pending = storage.users.find_by("status", "pending")
     
     if pending:
         lines = []
@@ -2128,14 +2270,14 @@ async def manage_users_callback(update: Update, context: ContextTypes.DEFAULT_TY
             lines.append(user_info)
             
             inline_buttons.append([
-                InlineKeyboardButton(f"✅ Утвердить {u['user_id']}", callback_data=f"approve_user_{u['user_id']}"),
-                InlineKeyboardButton(f"❌ Отклонить {u['user_id']}", callback_data=f"reject_user_{u['user_id']}"),
-                InlineKeyboardButton(f"🚫 Блокировать", callback_data=f"block_user_{u['user_id']}")
+                InlineKeyboardButton(f"✅ Утвердить {u['user_id']}", callback_data=callback("approve_user", u["user_id"])),
+                InlineKeyboardButton(f"❌ Отклонить {u['user_id']}", callback_data=callback("reject_user", u["user_id"])),
+                InlineKeyboardButton(f"🚫 Блокировать", callback_data=callback("block_user", u["user_id"]))
             ])
         
         text = "⏳ **Ожидающие заявки**\n\n" + "\n".join(lines)
-        inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data="add_user")])
-        inline_buttons.append([InlineKeyboardButton("📋 Все пользователи", callback_data="list_all_users")])
+        inline_buttons.append([InlineKeyboardButton("➕ Добавить пользователя", callback_data=callback("add_user"))])
+        inline_buttons.append([InlineKeyboardButton("📋 Все пользователи", callback_data=callback("list_all_users"))])
         
         if query:
             await query.edit_message_text(
@@ -2151,8 +2293,8 @@ async def manage_users_callback(update: Update, context: ContextTypes.DEFAULT_TY
             )
     else:
         kb = [
-            [InlineKeyboardButton("➕ Добавить пользователя", callback_data="add_user")],
-            [InlineKeyboardButton("📋 Все пользователи", callback_data="list_all_users")],
+            [InlineKeyboardButton("➕ Добавить пользователя", callback_data=callback("add_user"))],
+            [InlineKeyboardButton("📋 Все пользователи", callback_data=callback("list_all_users"))],
         ]
         if query:
             await query.edit_message_text(
@@ -2205,13 +2347,13 @@ async def edit_device_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"edit_device_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "edit_device")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device:
         await query.edit_message_text("Устройство не найдено.")
@@ -2251,13 +2393,13 @@ async def delete_device_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"delete_device_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "delete_device")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device:
         await query.edit_message_text("Устройство не найдено.")
@@ -2268,7 +2410,7 @@ async def delete_device_callback(update: Update, context: ContextTypes.DEFAULT_T
     device_type = device.get("type", "Неизвестно")
     
     storage.devices.remove(device)
-    storage.save_devices()
+    await storage.save_devices_async()
     
     await query.edit_message_text(
         f"🗑️ Устройство **{device_name}** (SN: `{device_sn}`) удалено.",
@@ -2284,25 +2426,36 @@ async def delete_device_callback(update: Update, context: ContextTypes.DEFAULT_T
         await manage_devices_admin_callback(update, context)
 
 
-async def show_admin_devices_by_type(update: Update, context: ContextTypes.DEFAULT_TYPE, dev_type: str = None):
-    """Показывает список устройств для управления (по типу или все)."""
+async def show_admin_devices_by_type(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    dev_type: str = None,
+    page_number: int = 0,
+):
+    """Показывает список устройств для управления (по типу или все), постранично.
+
+    Устройства страницы берутся срезом упорядоченного представления storage
+    (devices_by_type / devices_by_id), кнопки строятся только для них.
+    """
     query = update.callback_query
     if query:
         await query.answer()
     
-    utils.cleanup_expired_bookings()
-    
-    # Получаем устройства
+    # Диапазон устройств в упорядоченном представлении
     if dev_type:
-        devices = [d for d in storage.devices if d.get("type") == dev_type]
-        title = f"📦 **{dev_type}** ({len(devices)} шт.)"
+        view = storage.devices_by_type
+        first, last = view.bounds(dev_type)
+        base = callback("admin_type", dev_type)
+        title = f"📦 **{dev_type}** ({last - first} шт.)"
     else:
-        devices = sorted(storage.devices, key=lambda x: x.get("id", 0))
-        title = f"📋 **Все устройства** ({len(devices)} шт.)"
+        view = storage.devices_by_id
+        first, last = view.bounds()
+        base = callback("admin_all_devices")
+        title = f"📋 **Все устройства** ({last - first} шт.)"
     
-    if not devices:
+    if first == last:
         text = f"Нет устройств типа {dev_type}." if dev_type else "Нет устройств."
-        inline_buttons = [[InlineKeyboardButton("◀️ Назад к типам", callback_data="manage_devices_admin")]]
+        inline_buttons = [[InlineKeyboardButton("◀️ Назад к типам", callback_data=callback("manage_devices_admin"))]]
         if query:
             await query.edit_message_text(
                 text,
@@ -2310,10 +2463,13 @@ async def show_admin_devices_by_type(update: Update, context: ContextTypes.DEFAU
             )
         return
     
+    page = page_of(last - first, page_number, ADMIN_PAGE_SIZE)
+    devices = view.slice(first + page.start, first + page.stop)
+    
     # Формируем список устройств только с кнопками (без текста)
     inline_buttons = []
     
-    for device in sorted(devices, key=lambda x: x.get("id", 0)):
+    for device in devices:
         status_emoji = "✅" if device.get("status") == "free" else "🔒"
         device_name = device.get("name", "Неизвестно")
         device_id = device.get("id")
@@ -2355,20 +2511,24 @@ async def show_admin_devices_by_type(update: Update, context: ContextTypes.DEFAU
         inline_buttons.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"edit_device_{device_id}"
+                callback_data=callback("edit_device", device_id)
             )
         ])
         inline_buttons.append([
             InlineKeyboardButton(
                 "🗑️",
-                callback_data=f"delete_device_{device_id}"
+                callback_data=callback("delete_device", device_id)
             )
         ])
     
+    navigation = _page_navigation(base, page)
+    if navigation:
+        inline_buttons.append(navigation)
+    
     # Только заголовок, без текстового списка устройств
     text = f"{title}\n\nВыберите устройство для редактирования:"
-    inline_buttons.append([InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device")])
-    inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data="manage_devices_admin")])
+    inline_buttons.append([InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device"))])
+    inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data=callback("manage_devices_admin"))])
     
     if query:
         await query.edit_message_text(
@@ -2389,20 +2549,19 @@ async def admin_type_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"admin_type_(.+)", query.data)
-    if not match:
+    parsed = _callback(update, context)
+    if parsed is None or parsed.action != "admin_type" or not parsed.args:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    dev_type = match.group(1)
-    await show_admin_devices_by_type(update, context, dev_type)
+    await show_admin_devices_by_type(update, context, parsed.args[0], parsed.page)
 
 
 async def admin_all_devices_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает все устройства в админ-панели."""
     query = update.callback_query
     await query.answer()
-    await show_admin_devices_by_type(update, context, None)
+    await show_admin_devices_by_type(update, context, None, _callback_page(update, context))
 
 
 # ==========
@@ -2441,28 +2600,29 @@ async def export_devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def export_devices_internal(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     """Внутренняя функция экспорта устройств."""
-    rows = [
-        [
-            d.get("id"),
-            d.get("name"),
-            d.get("sn"),
-            d.get("type"),
-            d.get("status"),
-            d.get("user_id"),
-            d.get("booking_expiration"),
+    async with concurrency.heavy("export"):
+        rows = [
+            [
+                d.get("id"),
+                d.get("name"),
+                d.get("sn"),
+                d.get("type"),
+                d.get("status"),
+                d.get("user_id"),
+                d.get("booking_expiration"),
+            ]
+            for d in storage.devices
         ]
-        for d in storage.devices
-    ]
-    bio = _build_csv_bytes(
-        ["id", "name", "sn", "type", "status", "user_id", "booking_expiration"],
-        rows,
-        "devices_export.csv",
-    )
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=bio,
-        caption="Экспорт устройств",
-    )
+        bio = _build_csv_bytes(
+            ["id", "name", "sn", "type", "status", "user_id", "booking_expiration"],
+            rows,
+            "devices_export.csv",
+        )
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=bio,
+            caption="Экспорт устройств",
+        )
 
 
 async def export_users_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2481,28 +2641,29 @@ async def export_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def export_users_internal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Внутренняя функция экспорта пользователей."""
-    rows = [
-        [
-            u.get("user_id"),
-            u.get("first_name"),
-            u.get("last_name"),
-            u.get("username"),
-            u.get("role"),
-            u.get("status"),
-            u.get("phone", ""),  # Добавляем телефон
+    async with concurrency.heavy("export"):
+        rows = [
+            [
+                u.get("user_id"),
+                u.get("first_name"),
+                u.get("last_name"),
+                u.get("username"),
+                u.get("role"),
+                u.get("status"),
+                u.get("phone", ""),  # Добавляем телефон
+            ]
+            for u in storage.users
         ]
-        for u in storage.users
-    ]
-    bio = _build_csv_bytes(
-        ["user_id", "first_name", "last_name", "username", "role", "status", "phone"],
-        rows,
-        "users_export.csv",
-    )
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=bio,
-        caption="Экспорт пользователей",
-    )
+        bio = _build_csv_bytes(
+            ["user_id", "first_name", "last_name", "username", "role", "status", "phone"],
+            rows,
+            "users_export.csv",
+        )
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=bio,
+            caption="Экспорт пользователей",
+        )
 
 
 async def export_logs_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2520,21 +2681,24 @@ async def export_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def export_logs_internal(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Внутренняя функция экспорта логов."""
-    rows: List[List[Any]] = []
-    for sn, entries in storage.logs.items():
-        for e in entries:
-            rows.append([e.get("timestamp"), sn, e.get("action")])
-    bio = _build_csv_bytes(
-        ["timestamp", "device_sn", "action"],
-        rows,
-        "device_logs_export.csv",
-    )
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=bio,
-        caption="Экспорт логов бронирований",
-    )
+    """Внутренняя функция экспорта логов.
+
+    Сначала идут записи из архива (log_archive/), затем текущая история.
+    """
+    async with concurrency.heavy("export"):
+        # Архив и текущая история читаются с диска не в event loop
+        entries = await asyncio.to_thread(lambda: storage.read_log_archive() + storage.read_all_logs())
+        rows: List[List[Any]] = [[e.get("timestamp"), sn, e.get("action")] for sn, e in entries]
+        bio = _build_csv_bytes(
+            ["timestamp", "device_sn", "action"],
+            rows,
+            "device_logs_export.csv",
+        )
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=bio,
+            caption="Экспорт логов бронирований",
+        )
 
 
 # ==========
@@ -2547,14 +2711,13 @@ def _find_devices_by_code(code: str) -> List[Dict[str, Any]]:
     if not code:
         return []
     
-    # Сначала ищем точное совпадение
-    exact_matches = [d for d in storage.devices if d.get("sn", "").upper() == code]
+    # Сначала ищем точное совпадение (индекс SN без учета регистра)
+    exact_matches = utils.get_devices_by_sn(code)
     if exact_matches:
         return exact_matches
     
-    # Затем ищем частичные совпадения
-    partial_matches = [d for d in storage.devices if code in d.get("sn", "").upper()]
-    return partial_matches
+    # Затем ищем частичные совпадения (по триграммному индексу SN)
+    return storage.device_search.search(code, fields=("sn",))
 
 
 @access_control()
@@ -2651,10 +2814,14 @@ def _extract_serial_number(text: str) -> Optional[str]:
 
 
 async def _recognize_text_from_photo(photo_bytes: bytes) -> Optional[str]:
-    """Распознает текст из фото с помощью OCR."""
+    """Распознает текст из фото с помощью OCR (в отдельном потоке, с лимитом "ocr")."""
     if not OCR_AVAILABLE:
         return None
-    
+    async with concurrency.heavy("ocr"):
+        return await asyncio.to_thread(_recognize_text_sync, photo_bytes)
+
+
+def _recognize_text_sync(photo_bytes: bytes) -> Optional[str]:
     try:
         # Получаем OCR reader (ленивая инициализация)
         reader = _get_ocr_reader()
@@ -2728,8 +2895,10 @@ async def handle_photo_scan(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         parse_mode="Markdown"
                     )
                     
-                    # Обрабатываем найденный серийный номер как код напрямую
-                    await _process_code_directly(update, context, serial_number, message_for_reply=processing_msg)
+                    # Обрабатываем найденный серийный номер как код напрямую (с учетом ошибок OCR)
+                    await _process_code_directly(
+                        update, context, serial_number, message_for_reply=processing_msg, fuzzy=True
+                    )
                     return
                 else:
                     await processing_msg.edit_text(
@@ -2780,12 +2949,15 @@ async def _process_code_directly(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     code: str,
-    message_for_reply=None
+    message_for_reply=None,
+    fuzzy: bool = False,
 ):
     """Обрабатывает код напрямую без необходимости в update.message.text.
-    Ищет устройства по серийному номеру, названию, модели и типу."""
-    utils.cleanup_expired_bookings()
-    
+    Ищет устройства по серийному номеру, названию, модели и типу.
+
+    fuzzy=True (код распознан OCR): если точных совпадений нет, ищутся SN
+    с типичными ошибками распознавания (O/0, I/1, S/5, B/8 и ±sn_fuzzy_max_distance
+    символов), ближайшие — первыми."""
     if not code or not code.strip():
         reply_target = message_for_reply or update.message
         await reply_target.reply_text("Код не распознан. Попробуйте еще раз.")
@@ -2809,14 +2981,22 @@ async def _process_code_directly(
     
     devices = list(all_devices.values())
     
+    if not devices and fuzzy:
+        devices = [device for _, device in storage.sn_fuzzy.lookup(code)]
+        if devices:
+            await reply_target.reply_text(
+                f"🔎 Точного совпадения для '{code}' нет, найдены похожие SN: "
+                + ", ".join(str(d.get("sn")) for d in devices[:5])
+            )
+    
     if not devices:
         kb = None
-        if utils.is_admin(update.effective_user.id):
+        if _request(update, context).is_admin:
             kb = InlineKeyboardMarkup(
                 [
                     [
-                        InlineKeyboardButton("➕ Добавить устройство", callback_data="add_device"),
-                        InlineKeyboardButton("◀️ Отмена", callback_data="back_to_main"),
+                        InlineKeyboardButton("➕ Добавить устройство", callback_data=callback("add_device")),
+                        InlineKeyboardButton("◀️ Отмена", callback_data=callback("back_to_main")),
                     ]
                 ]
             )
@@ -2888,8 +3068,8 @@ async def _handle_device_found(
     # Сценарий 1: Устройство свободно
     if device_status == "free":
         kb = [
-            [InlineKeyboardButton("✅ Забронировать", callback_data=f"scan_book_{device['id']}")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="scan_cancel")],
+            [InlineKeyboardButton("✅ Забронировать", callback_data=callback("scan_book", device["id"]))],
+            [InlineKeyboardButton("❌ Отмена", callback_data=callback("scan_cancel"))],
         ]
         await reply_target.reply_text(
             device_info + "✅ Устройство свободно и доступно для бронирования.",
@@ -2904,8 +3084,8 @@ async def _handle_device_found(
         exp_text = utils.format_datetime(expiration) if expiration else "Не указано"
         
         kb = [
-            [InlineKeyboardButton("🔓 Освободить", callback_data=f"scan_release_{device['id']}")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="scan_cancel")],
+            [InlineKeyboardButton("🔓 Освободить", callback_data=callback("scan_release", device["id"]))],
+            [InlineKeyboardButton("❌ Отмена", callback_data=callback("scan_cancel"))],
         ]
         await reply_target.reply_text(
             device_info
@@ -2925,10 +3105,10 @@ async def _handle_device_found(
     kb = [
         [
             InlineKeyboardButton(
-                "🔄 Запросить передачу", callback_data=f"scan_transfer_{device['id']}"
+                "🔄 Запросить передачу", callback_data=callback("scan_transfer", device["id"])
             )
         ],
-        [InlineKeyboardButton("❌ Отмена", callback_data="scan_cancel")],
+        [InlineKeyboardButton("❌ Отмена", callback_data=callback("scan_cancel"))],
     ]
     await reply_target.reply_text(
         device_info
@@ -2946,24 +3126,25 @@ async def scan_book_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"scan_book_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "scan_book")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device or device.get("status") != "free":
         await query.edit_message_text("❌ Устройство уже забронировано или не найдено.")
         return
     
     user_id = update.effective_user.id
+    request = _request(update, context)
     
     # Проверка принадлежности к группе (для не-админов)
-    if not utils.is_admin(user_id):
-        if not utils.can_user_book_device(user_id, device_id):
-            user_group = utils.get_user_group(user_id)
+    if not request.is_admin:
+        if not utils.can_user_book_device(user_id, device_id, request=request):
+            user_group = request.group
             device_group = utils.get_device_group(device_id)
             if not user_group:
                 await query.edit_message_text(
@@ -2980,30 +3161,20 @@ async def scan_book_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 )
             return
     
-    # Проверка лимита устройств
-    max_devices = storage.config.get("max_devices_per_user", 2)
-    current_count = len(
-        [d for d in storage.devices if d.get("user_id") == user_id and d.get("status") == "booked"]
-    )
-    if current_count >= max_devices:
-        await query.edit_message_text(
-            f"❌ Нельзя забронировать больше {max_devices} устройств одновременно."
+    # Бронирование (лимит устройств и статус проверяются под блокировкой)
+    expiration = booking.default_expiration(device)
+    try:
+        await booking.book(
+            device_id,
+            user_id,
+            expiration,
+            f"Забронировано пользователем {utils.get_user_full_name(user_id, request=request)} "
+            f"через сканирование до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
         )
+    except booking.BookingError as e:
+        await query.edit_message_text(str(e))
         return
     
-    # Бронирование
-    default_days = device.get(
-        "default_booking_period",
-        storage.config.get("default_booking_period_days", 1),
-    )
-    now = datetime.now()
-    expiration = now + timedelta(days=default_days)
-    
-    device["status"] = "booked"
-    device["user_id"] = user_id
-    device["booking_expiration"] = expiration.isoformat()
-    storage.save_devices()
-    
     await query.edit_message_text(
         f"✅ Устройство **{device['name']}** (SN: `{device['sn']}`) "
         f"забронировано до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
@@ -3011,27 +3182,6 @@ async def scan_book_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
     # Выход из режима сканирования после действия
     context.user_data.pop("scanning_mode", None)
-    
-    utils.log_action(
-        device["sn"],
-        f"Забронировано пользователем {utils.get_user_full_name(user_id)} "
-        f"через сканирование до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
-    )
-    
-    # Уведомление перед окончанием брони
-    notify_before = storage.config.get("notify_before_minutes", 60)
-    delta = expiration - datetime.now() - timedelta(minutes=notify_before)
-    if delta.total_seconds() > 0:
-        context.application.job_queue.run_once(
-            notify_booking_expiring,
-            when=delta,
-            data={
-                "chat_id": update.effective_chat.id,
-                "device_name": device["name"],
-                "sn": device["sn"],
-                "expiration": expiration.strftime("%Y-%m-%d %H:%M:%S"),
-            },
-        )
 
 
 async def scan_release_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3039,38 +3189,29 @@ async def scan_release_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"scan_release_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "scan_release")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
+    device_id = ids[0]
     user_id = update.effective_user.id
     
-    device = next(
-        (
-            d
-            for d in storage.devices
-            if d.get("id") == device_id
-            and d.get("user_id") == user_id
-            and d.get("status") == "booked"
-        ),
-        None,
-    )
+    device = utils.get_booked_device(device_id, user_id)
     
     if not device:
         await query.edit_message_text("❌ Устройство не найдено среди ваших бронирований.")
         return
     
-    device["status"] = "free"
-    device.pop("user_id", None)
-    device.pop("booking_expiration", None)
-    storage.save_devices()
-    
-    utils.log_action(
-        device["sn"],
-        f"Освобождено пользователем {utils.get_user_full_name(user_id)} через сканирование",
-    )
+    try:
+        await booking.release(
+            device_id,
+            f"Освобождено пользователем {utils.get_user_full_name(user_id)} через сканирование",
+            owner_id=user_id,
+        )
+    except booking.BookingError:
+        await query.edit_message_text("❌ Устройство не найдено среди ваших бронирований.")
+        return
     
     await query.edit_message_text(
         f"✅ Устройство **{device['name']}** (SN: `{device['sn']}`) успешно освобождено.",
@@ -3085,13 +3226,13 @@ async def scan_transfer_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"scan_transfer_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "scan_transfer")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device or device.get("status") != "booked":
         await query.edit_message_text("❌ Устройство не найдено или уже освобождено.")
@@ -3109,7 +3250,6 @@ async def scan_transfer_callback(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data["transfer_current_owner"] = current_owner_id
     _set_state(context, BotState.WAITING_TRANSFER_CONFIRMATION)
     
-    # Отправляем уведомление текущему владельцу
     current_owner_name = utils.get_user_full_name(new_owner_id)
     device_info = f"**{device['name']}** (SN: `{device['sn']}`)"
     
@@ -3118,42 +3258,50 @@ async def scan_transfer_callback(update: Update, context: ContextTypes.DEFAULT_T
             [
                 InlineKeyboardButton(
                     "✅ Подтвердить передачу",
-                    callback_data=f"transfer_confirm_{device_id}_{new_owner_id}",
+                    callback_data=callback("transfer_confirm", device_id, new_owner_id),
                 )
             ],
             [
                 InlineKeyboardButton(
-                    "❌ Отклонить", callback_data=f"transfer_reject_{device_id}_{new_owner_id}"
+                    "❌ Отклонить", callback_data=callback("transfer_reject", device_id, new_owner_id)
                 )
             ],
         ]
     )
     
-    try:
-        await context.bot.send_message(
-            chat_id=current_owner_id,
-            text=(
-                f"🔄 Запрос на передачу устройства\n\n"
-                f"Пользователь **{current_owner_name}** запрашивает передачу устройства:\n"
-                f"{device_info}\n\n"
-                f"Подтвердите или отклоните запрос."
-            ),
-            parse_mode="Markdown",
-            reply_markup=transfer_kb,
-        )
-    except Exception as e:
-        await query.edit_message_text(
-            f"❌ Не удалось отправить уведомление владельцу устройства. "
-            f"Возможно, пользователь не начал диалог с ботом.\n\nОшибка: {str(e)}"
-        )
-        _set_state(context, BotState.NONE)
-        return
-    
     await query.edit_message_text(
         f"📨 Запрос на передачу устройства **{device['name']}** отправлен владельцу.\n\n"
         f"Ожидайте подтверждения...",
         parse_mode="Markdown",
     )
+
+    # Отправка владельцу — через очередь; при ошибке сообщение заменяется
+    async def transfer_request_done(error: Optional[BaseException]) -> None:
+        if error is None:
+            return
+        _set_state(context, BotState.NONE)
+        try:
+            await query.edit_message_text(
+                f"❌ Не удалось отправить уведомление владельцу устройства. "
+                f"Возможно, пользователь не начал диалог с ботом.\n\nОшибка: {str(error)}"
+            )
+        except Exception:
+            pass
+
+    notifier.enqueue(
+        current_owner_id,
+        (
+            f"🔄 Запрос на передачу устройства\n\n"
+            f"Пользователь **{current_owner_name}** запрашивает передачу устройства:\n"
+            f"{device_info}\n\n"
+            f"Подтвердите или отклоните запрос."
+        ),
+        key=("transfer_request", device_id, new_owner_id),
+        on_done=transfer_request_done,
+        parse_mode="Markdown",
+        reply_markup=transfer_kb,
+    )
+
     # Выход из режима сканирования после действия
     context.user_data.pop("scanning_mode", None)
 
@@ -3163,53 +3311,34 @@ async def transfer_confirm_callback(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"transfer_confirm_(\d+)_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "transfer_confirm", 2)
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    new_owner_id = int(match.group(2))
+    device_id, new_owner_id = ids
     current_owner_id = update.effective_user.id
     
-    device = next(
-        (
-            d
-            for d in storage.devices
-            if d.get("id") == device_id
-            and d.get("user_id") == current_owner_id
-            and d.get("status") == "booked"
-        ),
-        None,
-    )
+    device = utils.get_booked_device(device_id, current_owner_id)
     
     if not device:
         await query.edit_message_text("❌ Устройство не найдено или уже освобождено.")
         return
     
-    # Проверка лимита для нового владельца
-    max_devices = storage.config.get("max_devices_per_user", 2)
-    new_owner_count = len(
-        [d for d in storage.devices if d.get("user_id") == new_owner_id and d.get("status") == "booked"]
-    )
-    if new_owner_count >= max_devices:
-        await query.edit_message_text(
-            f"❌ Новый владелец уже имеет максимальное количество устройств ({max_devices})."
-        )
-        return
-    
-    # Передача устройства
+    # Передача устройства (срок брони сохраняется, лимит нового владельца проверяется под блокировкой)
     old_owner_name = utils.get_user_full_name(current_owner_id)
     new_owner_name = utils.get_user_full_name(new_owner_id)
     
-    device["user_id"] = new_owner_id
-    # Сохраняем срок бронирования
-    storage.save_devices()
-    
-    utils.log_action(
-        device["sn"],
-        f"Передано от {old_owner_name} к {new_owner_name} через сканирование",
-    )
+    try:
+        await booking.transfer(
+            device_id,
+            current_owner_id,
+            new_owner_id,
+            f"Передано от {old_owner_name} к {new_owner_name} через сканирование",
+        )
+    except booking.BookingError as e:
+        await query.edit_message_text(str(e))
+        return
     
     await query.edit_message_text(
         f"✅ Устройство **{device['name']}** (SN: `{device['sn']}`) "
@@ -3218,18 +3347,15 @@ async def transfer_confirm_callback(update: Update, context: ContextTypes.DEFAUL
     )
     
     # Уведомление новому владельцу
-    try:
-        await context.bot.send_message(
-            chat_id=new_owner_id,
-            text=(
-                f"✅ Устройство передано вам\n\n"
-                f"**{device['name']}** (SN: `{device['sn']}`)\n"
-                f"Передано от: **{old_owner_name}**"
-            ),
-            parse_mode="Markdown",
-        )
-    except Exception:
-        pass  # Игнорируем ошибки отправки уведомления
+    notifier.enqueue(
+        new_owner_id,
+        (
+            f"✅ Устройство передано вам\n\n"
+            f"**{device['name']}** (SN: `{device['sn']}`)\n"
+            f"Передано от: **{old_owner_name}**"
+        ),
+        parse_mode="Markdown",
+    )
 
 
 async def transfer_reject_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3237,16 +3363,15 @@ async def transfer_reject_callback(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"transfer_reject_(\d+)_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "transfer_reject", 2)
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    requester_id = int(match.group(2))
+    device_id, requester_id = ids
     current_owner_id = update.effective_user.id
     
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device = utils.get_device_by_id(device_id)
     
     if not device:
         await query.edit_message_text("❌ Устройство не найдено.")
@@ -3261,16 +3386,11 @@ async def transfer_reject_callback(update: Update, context: ContextTypes.DEFAULT
     )
     
     # Уведомление запросившему
-    try:
-        await context.bot.send_message(
-            chat_id=requester_id,
-            text=(
-                f"❌ Запрос на передачу устройства **{device_name}** отклонен владельцем."
-            ),
-            parse_mode="Markdown",
-        )
-    except Exception:
-        pass
+    notifier.enqueue(
+        requester_id,
+        f"❌ Запрос на передачу устройства **{device_name}** отклонен владельцем.",
+        parse_mode="Markdown",
+    )
 
 
 async def scan_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3291,24 +3411,25 @@ async def book_device_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"book_dev_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "book_dev")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device or device.get("status") != "free":
         await query.edit_message_text("❌ Устройство уже забронировано или не найдено.")
         return
     
     user_id = update.effective_user.id
+    request = _request(update, context)
     
     # Проверка принадлежности к группе (для не-админов)
-    if not utils.is_admin(user_id):
-        if not utils.can_user_book_device(user_id, device_id):
-            user_group = utils.get_user_group(user_id)
+    if not request.is_admin:
+        if not utils.can_user_book_device(user_id, device_id, request=request):
+            user_group = request.group
             device_group = utils.get_device_group(device_id)
             if not user_group:
                 await query.edit_message_text(
@@ -3325,41 +3446,25 @@ async def book_device_callback(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
             return
     
-    # Проверка лимита устройств
-    max_devices = storage.config.get("max_devices_per_user", 2)
-    current_count = len(
-        [d for d in storage.devices if d.get("user_id") == user_id and d.get("status") == "booked"]
-    )
-    if current_count >= max_devices:
-        await query.edit_message_text(
-            f"❌ Нельзя забронировать больше {max_devices} устройств одновременно."
+    # Бронирование (лимит устройств и статус проверяются под блокировкой)
+    expiration = booking.default_expiration(device)
+    try:
+        await booking.book(
+            device_id,
+            user_id,
+            expiration,
+            f"Забронировано пользователем {utils.get_user_full_name(user_id, request=request)} "
+            f"до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
         )
+    except booking.BookingError as e:
+        await query.edit_message_text(str(e))
         return
     
-    # Бронирование
-    default_days = device.get(
-        "default_booking_period",
-        storage.config.get("default_booking_period_days", 1),
-    )
-    now = datetime.now()
-    expiration = now + timedelta(days=default_days)
-    
-    device["status"] = "booked"
-    device["user_id"] = user_id
-    device["booking_expiration"] = expiration.isoformat()
-    storage.save_devices()
-    
     await query.edit_message_text(
         f"✅ Устройство **{device['name']}** (SN: `{device['sn']}`) "
         f"забронировано до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
         parse_mode="Markdown",
     )
-    
-    utils.log_action(
-        device["sn"],
-        f"Забронировано пользователем {utils.get_user_full_name(user_id)} "
-        f"до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
-    )
 
 
 @access_control(required_role="Admin")
@@ -3368,19 +3473,19 @@ async def admin_book_device_callback(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"admin_book_dev_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "admin_book_dev")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device or device.get("status") != "free":
         await query.answer("Устройство уже забронировано или не найдено.", show_alert=True)
         return
     
-    active_users = [u for u in storage.users if u.get("status") == "active"]
+    active_users = storage.users.find_by("status", "active")
     if not active_users:
         await query.message.reply_text("Нет активных пользователей для назначения.")
         return
@@ -3398,7 +3503,7 @@ async def admin_book_device_callback(update: Update, context: ContextTypes.DEFAU
         buttons.append([
             InlineKeyboardButton(
                 f"{full_name} [{user_id}]",
-                callback_data=f"admin_book_select_{device_id}_{user_id}",
+                callback_data=callback("admin_book_select", device_id, user_id),
             )
         ])
     
@@ -3408,7 +3513,7 @@ async def admin_book_device_callback(update: Update, context: ContextTypes.DEFAU
     else:
         info_text = ""
     
-    buttons.append([InlineKeyboardButton("❌ Отмена", callback_data="admin_book_cancel")])
+    buttons.append([InlineKeyboardButton("❌ Отмена", callback_data=callback("admin_book_cancel"))])
     
     text = (
         f"👑 **Бронирование устройства на пользователя**\n\n"
@@ -3432,15 +3537,14 @@ async def admin_book_select_user_callback(update: Update, context: ContextTypes.
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"admin_book_select_(\d+)_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "admin_book_select", 2)
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    target_user_id = int(match.group(2))
+    device_id, target_user_id = ids
     
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device = utils.get_device_by_id(device_id)
     target_user = utils.get_user_by_id(target_user_id)
     
     if not device or device.get("status") != "free":
@@ -3451,21 +3555,25 @@ async def admin_book_select_user_callback(update: Update, context: ContextTypes.
         await query.edit_message_text("❌ Пользователь не найден или не активен.")
         return
     
-    default_days = device.get(
-        "default_booking_period",
-        storage.config.get("default_booking_period_days", 1),
-    )
-    now = datetime.now()
-    expiration = now + timedelta(days=default_days)
-    
-    device["status"] = "booked"
-    device["user_id"] = target_user_id
-    device["booking_expiration"] = expiration.isoformat()
-    storage.save_devices()
+    expiration = booking.default_expiration(device)
     
     target_name = utils.get_user_full_name(target_user_id)
     admin_name = utils.get_user_full_name(update.effective_user.id)
     
+    # Администратор назначает устройство без учета лимита пользователя
+    try:
+        await booking.book(
+            device_id,
+            target_user_id,
+            expiration,
+            f"Админ {admin_name} забронировал на пользователя {target_name} "
+            f"до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
+            enforce_limit=False,
+        )
+    except booking.BookingError as e:
+        await query.edit_message_text(str(e))
+        return
+    
     await query.edit_message_text(
         f"✅ Устройство **{device.get('name', 'N/A')}** (SN: `{device.get('sn', 'N/A')}`)\n"
         f"забронировано на пользователя **{target_name}** до {expiration.strftime('%d.%m.%Y %H:%M')}.\n\n"
@@ -3473,22 +3581,14 @@ async def admin_book_select_user_callback(update: Update, context: ContextTypes.
         parse_mode="Markdown",
     )
     
-    utils.log_action(
-        device.get("sn", "N/A"),
-        f"Админ {admin_name} забронировал на пользователя {target_name} до {expiration.strftime('%Y-%m-%d %H:%M:%S')}.",
+    notifier.enqueue(
+        target_user_id,
+        (
+            f"👑 Администратор назначил вам устройство **{device.get('name', 'N/A')}** "
+            f"(SN: `{device.get('sn', 'N/A')}`) до {expiration.strftime('%d.%m.%Y %H:%M')}."
+        ),
+        parse_mode="Markdown",
     )
-    
-    try:
-        await context.bot.send_message(
-            chat_id=target_user_id,
-            text=(
-                f"👑 Администратор назначил вам устройство **{device.get('name', 'N/A')}** "
-                f"(SN: `{device.get('sn', 'N/A')}`) до {expiration.strftime('%d.%m.%Y %H:%M')}."
-            ),
-            parse_mode="Markdown",
-        )
-    except Exception:
-        pass
 
 
 @access_control(required_role="Admin")
@@ -3504,38 +3604,27 @@ async def release_device_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"release_dev_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "release_dev")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
+    device_id = ids[0]
     user_id = update.effective_user.id
     
-    device = next(
-        (
-            d
-            for d in storage.devices
-            if d.get("id") == device_id
-            and d.get("user_id") == user_id
-            and d.get("status") == "booked"
-        ),
-        None,
-    )
+    device = utils.get_booked_device(device_id, user_id)
     
     if not device:
         await query.edit_message_text("❌ Устройство не найдено среди ваших бронирований.")
         return
     
-    device["status"] = "free"
-    device.pop("user_id", None)
-    device.pop("booking_expiration", None)
-    storage.save_devices()
-    
-    utils.log_action(
-        device["sn"],
-        f"Освобождено пользователем {utils.get_user_full_name(user_id)}",
-    )
+    try:
+        await booking.release(
+            device_id, f"Освобождено пользователем {utils.get_user_full_name(user_id)}", owner_id=user_id
+        )
+    except booking.BookingError:
+        await query.edit_message_text("❌ Устройство не найдено среди ваших бронирований.")
+        return
     
     await query.edit_message_text(
         f"✅ Устройство **{device['name']}** (SN: `{device['sn']}`) успешно освобождено.",
@@ -3548,13 +3637,13 @@ async def info_device_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"info_dev_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "info_dev")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    device_id = int(match.group(1))
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device_id = ids[0]
+    device = utils.get_device_by_id(device_id)
     
     if not device:
         await query.edit_message_text("❌ Устройство не найдено.")
@@ -3575,8 +3664,8 @@ async def info_device_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     
     kb = [
-        [InlineKeyboardButton("🔄 Запросить передачу", callback_data=f"scan_transfer_{device['id']}")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")],
+        [InlineKeyboardButton("🔄 Запросить передачу", callback_data=callback("scan_transfer", device["id"]))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_main"))],
     ]
     
     await query.edit_message_text(
@@ -3593,16 +3682,10 @@ async def back_to_types_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     # Вызываем list_devices через создание временного update
     # Проще просто отправить новое сообщение
-    user_id = update.effective_user.id
     await query.edit_message_text("Загрузка...")
     
-    # Группируем устройства по типам
-    types = sorted(set(d.get("type", "Неизвестно") for d in storage.devices))
-    
-    kb = []
-    for dev_type in types:
-        count = len([d for d in storage.devices if d.get("type") == dev_type])
-        kb.append([InlineKeyboardButton(f"📦 {dev_type} ({count})", callback_data=f"type_{dev_type}")])
+    # Те же типы и количества, что в list_devices (с учетом группы)
+    kb = _device_type_buttons(_visible_type_counts(_request(update, context)))
     
     text = "📱 Выберите тип устройства:"
     await query.edit_message_text(
@@ -3635,20 +3718,20 @@ async def select_device_type_callback(update: Update, context: ContextTypes.DEFA
     
     await query.answer()
     
-    # Извлекаем тип устройства из callback_data
-    # Формат: "type_PC", "type_Phone" и т.д.
-    if not query.data or not query.data.startswith("type_"):
+    # Тип устройства — аргумент callback_data (действие "type")
+    parsed = _callback(update, context)
+    if parsed is None or parsed.action != "type" or not parsed.args:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    dev_type = query.data[5:]  # Убираем префикс "type_"
-    utils.cleanup_expired_bookings()
+    dev_type = parsed.args[0]
     user_id = update.effective_user.id
-    is_admin = utils.is_admin(user_id)
+    request = _request(update, context)
+    is_admin = request.is_admin
     
     # Получаем все устройства этого типа и фильтруем по группе пользователя
-    all_devices = [d for d in storage.devices if d.get("type") == dev_type]
-    devices = utils.filter_devices_by_user_group(user_id, all_devices)
+    all_devices = storage.devices.find_by("type", dev_type)
+    devices = utils.filter_devices_by_user_group(user_id, all_devices, request=request)
     
     if not devices:
         await query.edit_message_text(
@@ -3689,14 +3772,14 @@ async def select_device_type_callback(update: Update, context: ContextTypes.DEFA
                 row = [
                     InlineKeyboardButton(
                         f"✅ {model_name} (SN: {sn})",
-                        callback_data=f"book_dev_{device['id']}"
+                        callback_data=callback("book_dev", device["id"])
                     )
                 ]
                 if is_admin:
                     row.append(
                         InlineKeyboardButton(
                             "👑 На пользователя",
-                            callback_data=f"admin_book_dev_{device['id']}",
+                            callback_data=callback("admin_book_dev", device["id"]),
                         )
                     )
                 inline_buttons.append(row)
@@ -3706,7 +3789,7 @@ async def select_device_type_callback(update: Update, context: ContextTypes.DEFA
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"🔓 {model_name} (SN: {sn}) - Освободить",
-                        callback_data=f"release_dev_{device['id']}"
+                        callback_data=callback("release_dev", device["id"])
                     )
                 ])
             else:
@@ -3716,14 +3799,14 @@ async def select_device_type_callback(update: Update, context: ContextTypes.DEFA
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"🔒 {model_name} (SN: {sn}) - Забронировано",
-                        callback_data=f"info_dev_{device['id']}"
+                        callback_data=callback("info_dev", device["id"])
                     )
                 ])
     
     text = "\n".join(lines)
     
     if inline_buttons:
-        inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data="back_to_types")])
+        inline_buttons.append([InlineKeyboardButton("◀️ Назад к типам", callback_data=callback("back_to_types"))])
         await query.edit_message_text(
             text,
             parse_mode="Markdown",
@@ -3893,7 +3976,9 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
                             parse_mode="Markdown"
                         )
 
-                        await _process_code_directly(update, context, serial_number, message_for_reply=processing_msg)
+                        await _process_code_directly(
+                            update, context, serial_number, message_for_reply=processing_msg, fuzzy=True
+                        )
                         return
                     else:
                         await processing_msg.edit_text(
@@ -3955,8 +4040,8 @@ async def manage_groups_admin(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if not storage.groups:
         inline_buttons = [
-            [InlineKeyboardButton("➕ Создать группу", callback_data="add_group")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+            [InlineKeyboardButton("➕ Создать группу", callback_data=callback("add_group"))],
+            [InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_admin"))]
         ]
         text = "👥 **Управление группами**\n\nПока нет групп. Создайте первую группу:"
     else:
@@ -3965,17 +4050,17 @@ async def manage_groups_admin(update: Update, context: ContextTypes.DEFAULT_TYPE
             group_id = group.get("id")
             group_name = group.get("name", "Без названия")
             # Подсчитываем пользователей и устройства в группе
-            users_count = len([u for u in storage.users if u.get("group_id") == group_id])
-            devices_count = len([d for d in storage.devices if d.get("group_id") == group_id])
+            users_count = storage.users.count_by("group_id", group_id)
+            devices_count = storage.devices.count_by("group_id", group_id)
             inline_buttons.append([
                 InlineKeyboardButton(
                     f"👥 {group_name} ({users_count} пользователей, {devices_count} устройств)",
-                    callback_data=f"edit_group_{group_id}"
+                    callback_data=callback("edit_group", group_id)
                 )
             ])
         
-        inline_buttons.append([InlineKeyboardButton("➕ Создать группу", callback_data="add_group")])
-        inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+        inline_buttons.append([InlineKeyboardButton("➕ Создать группу", callback_data=callback("add_group"))])
+        inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data=callback("back_to_admin"))])
         
         text = f"👥 **Управление группами**\n\nВсего групп: {len(storage.groups)}\n\nВыберите группу для редактирования:"
     
@@ -4013,12 +4098,12 @@ async def edit_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"edit_group_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "edit_group")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
+    group_id = ids[0]
     group = utils.get_group_by_id(group_id)
     
     if not group:
@@ -4026,15 +4111,15 @@ async def edit_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     group_name = group.get("name", "Без названия")
-    users_count = len([u for u in storage.users if u.get("group_id") == group_id])
-    devices_count = len([d for d in storage.devices if d.get("group_id") == group_id])
+    users_count = storage.users.count_by("group_id", group_id)
+    devices_count = storage.devices.count_by("group_id", group_id)
     
     inline_buttons = [
-        [InlineKeyboardButton("✏️ Изменить название", callback_data=f"rename_group_{group_id}")],
-        [InlineKeyboardButton("👥 Назначить пользователям", callback_data=f"assign_group_users_{group_id}")],
-        [InlineKeyboardButton("📱 Назначить устройствам", callback_data=f"assign_group_devices_{group_id}")],
-        [InlineKeyboardButton("🗑️ Удалить группу", callback_data=f"delete_group_{group_id}")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="manage_groups_admin")]
+        [InlineKeyboardButton("✏️ Изменить название", callback_data=callback("rename_group", group_id))],
+        [InlineKeyboardButton("👥 Назначить пользователям", callback_data=callback("assign_group_users", group_id))],
+        [InlineKeyboardButton("📱 Назначить устройствам", callback_data=callback("assign_group_devices", group_id))],
+        [InlineKeyboardButton("🗑️ Удалить группу", callback_data=callback("delete_group", group_id))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callback("manage_groups_admin"))]
     ]
     
     text = (
@@ -4058,12 +4143,12 @@ async def delete_group_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"delete_group_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "delete_group")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
+    group_id = ids[0]
     group = utils.get_group_by_id(group_id)
     
     if not group:
@@ -4075,21 +4160,20 @@ async def delete_group_callback(update: Update, context: ContextTypes.DEFAULT_TY
     # Удаляем группу из пользователей и устройств
     users_updated = 0
     devices_updated = 0
-    for user in storage.users:
-        if user.get("group_id") == group_id:
+    async with storage.transaction_async():
+        for user in storage.users.find_by("group_id", group_id):
             user.pop("group_id", None)
             users_updated += 1
-    
-    for device in storage.devices:
-        if device.get("group_id") == group_id:
+
+        for device in storage.devices.find_by("group_id", group_id):
             device.pop("group_id", None)
             devices_updated += 1
-    
-    # Удаляем группу
-    storage.groups.remove(group)
-    storage.save_groups()
-    storage.save_users()
-    storage.save_devices()
+
+        # Удаляем группу
+        storage.groups.remove(group)
+        await storage.save_groups_async()
+        await storage.save_users_async()
+        await storage.save_devices_async()
     
     await query.edit_message_text(
         f"✅ Группа '{group_name}' удалена.\n\n"
@@ -4106,12 +4190,12 @@ async def rename_group_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"rename_group_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "rename_group")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
+    group_id = ids[0]
     group = utils.get_group_by_id(group_id)
     
     if not group:
@@ -4135,13 +4219,13 @@ async def assign_group_users_callback(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"assign_group_users_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "assign_group_users")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
-    await _render_group_assignment(query, group_id, mode="users")
+    group_id = ids[0]
+    await _render_group_assignment(query, group_id, mode="users", page_number=_callback_page(update, context))
 
 
 @access_control(required_role="Admin")
@@ -4150,13 +4234,13 @@ async def assign_group_devices_callback(update: Update, context: ContextTypes.DE
     query = update.callback_query
     await query.answer()
     
-    match = re.match(r"assign_group_devices_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "assign_group_devices")
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
-    await _render_group_assignment(query, group_id, mode="devices")
+    group_id = ids[0]
+    await _render_group_assignment(query, group_id, mode="devices", page_number=_callback_page(update, context))
 
 
 @access_control(required_role="Admin")
@@ -4164,13 +4248,12 @@ async def toggle_group_user_callback(update: Update, context: ContextTypes.DEFAU
     """Переключает принадлежность пользователя к группе."""
     query = update.callback_query
     
-    match = re.match(r"toggle_group_user_(\d+)_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "toggle_group_user", 2)
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
-    user_id = int(match.group(2))
+    group_id, user_id = ids
     
     group = utils.get_group_by_id(group_id)
     user = utils.get_user_by_id(user_id)
@@ -4186,10 +4269,10 @@ async def toggle_group_user_callback(update: Update, context: ContextTypes.DEFAU
     else:
         user["group_id"] = group_id
         response = f"Пользователь {utils.get_user_full_name(user_id)} назначен в группу '{group.get('name')}'."
-    storage.save_users()
+    await storage.save_users_async()
     
     await query.answer(response[:200])
-    await _render_group_assignment(query, group_id, mode="users")
+    await _render_group_assignment(query, group_id, mode="users", page_number=_callback_page(update, context))
 
 
 @access_control(required_role="Admin")
@@ -4197,16 +4280,15 @@ async def toggle_group_device_callback(update: Update, context: ContextTypes.DEF
     """Переключает принадлежность устройства к группе."""
     query = update.callback_query
     
-    match = re.match(r"toggle_group_device_(\d+)_(\d+)", query.data)
-    if not match:
+    ids = _callback_ids(update, context, "toggle_group_device", 2)
+    if ids is None:
         await query.edit_message_text("Ошибка: некорректный формат команды.")
         return
     
-    group_id = int(match.group(1))
-    device_id = int(match.group(2))
+    group_id, device_id = ids
     
     group = utils.get_group_by_id(group_id)
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device = utils.get_device_by_id(device_id)
     
     if not group or not device:
         await query.edit_message_text("❌ Группа или устройство не найдены.")
@@ -4219,14 +4301,19 @@ async def toggle_group_device_callback(update: Update, context: ContextTypes.DEF
     else:
         device["group_id"] = group_id
         response = f"Устройство {device.get('name')} назначено в группу '{group.get('name')}'."
-    storage.save_devices()
+    await storage.save_devices_async()
     
     await query.answer(response[:200])
-    await _render_group_assignment(query, group_id, mode="devices")
+    await _render_group_assignment(query, group_id, mode="devices", page_number=_callback_page(update, context))
 
 
-async def _render_group_assignment(query, group_id: int, mode: str) -> None:
-    """Показывает список пользователей/устройств для назначения группе."""
+async def _render_group_assignment(query, group_id: int, mode: str, page_number: int = 0) -> None:
+    """Показывает страницу пользователей/устройств для назначения группе.
+
+    Записи страницы — срез упорядоченного представления storage
+    (users_by_name / devices_for_groups); кнопки переключения помнят
+    страницу, чтобы после нажатия остаться на ней.
+    """
     group = utils.get_group_by_id(group_id)
     if not group:
         await query.edit_message_text("❌ Группа не найдена.")
@@ -4238,11 +4325,12 @@ async def _render_group_assignment(query, group_id: int, mode: str) -> None:
     def _shorten(text: str, limit: int = 32) -> str:
         return text if len(text) <= limit else text[: limit - 1] + "…"
     
+    view = storage.users_by_name if mode == "users" else storage.devices_for_groups
+    base = callback(f"assign_group_{mode}", group_id)
+    page = page_of(len(view), page_number, ADMIN_PAGE_SIZE)
+    items = view.slice(page.start, page.stop)
+    
     if mode == "users":
-        items = sorted(
-            storage.users,
-            key=lambda u: (u.get("first_name", ""), u.get("last_name", ""), u.get("user_id", 0)),
-        )
         if not items:
             text = (
                 f"👥 **Группа: {group_name}**\n\n"
@@ -4257,12 +4345,13 @@ async def _render_group_assignment(query, group_id: int, mode: str) -> None:
             ]
             inline_buttons = []
             for user in items:
-                user_id = user.get("user_id")
+                # Записи storage — libs.records.User: поля читаются из слотов
+                user_id = user.user_id
                 if not user_id:
                     continue
                 full_name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or user.get("username", "Без имени")
                 full_name = _shorten(full_name)
-                current_group_id = user.get("group_id")
+                current_group_id = user.group_id
                 if current_group_id == group_id:
                     prefix = "✅"
                 elif current_group_id:
@@ -4275,15 +4364,11 @@ async def _render_group_assignment(query, group_id: int, mode: str) -> None:
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"{prefix} {full_name} [{user_id}]",
-                        callback_data=f"toggle_group_user_{group_id}_{user_id}",
+                        callback_data=with_page(callback("toggle_group_user", group_id, user_id), page.number),
                     )
                 ])
             text = "\n".join(lines)
     else:  # devices
-        items = sorted(
-            storage.devices,
-            key=lambda d: (d.get("type", ""), d.get("name", ""), d.get("sn", "")),
-        )
         if not items:
             text = (
                 f"📱 **Группа: {group_name}**\n\n"
@@ -4303,7 +4388,7 @@ async def _render_group_assignment(query, group_id: int, mode: str) -> None:
                     continue
                 name = _shorten(device.get("name", "Без названия"))
                 sn = device.get("sn", "N/A")
-                current_group_id = device.get("group_id")
+                current_group_id = device.group_id
                 if current_group_id == group_id:
                     prefix = "✅"
                 elif current_group_id:
@@ -4316,12 +4401,15 @@ async def _render_group_assignment(query, group_id: int, mode: str) -> None:
                 inline_buttons.append([
                     InlineKeyboardButton(
                         f"{prefix} {name} (SN: {sn})",
-                        callback_data=f"toggle_group_device_{group_id}_{device_id}",
+                        callback_data=with_page(callback("toggle_group_device", group_id, device_id), page.number),
                     )
                 ])
             text = "\n".join(lines)
     
-    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data=f"edit_group_{group_id}")])
+    navigation = _page_navigation(base, page)
+    if navigation:
+        inline_buttons.append(navigation)
+    inline_buttons.append([InlineKeyboardButton("◀️ Назад", callback_data=callback("edit_group", group_id))])
     await query.edit_message_text(
         text,
         parse_mode="Markdown",
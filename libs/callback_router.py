@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from libs.pagination import PAGE_SEPARATOR, split_page
+
+logger = logging.getLogger(__name__)
+
+# Формат callback_data версии 1: "1:<код действия>:<арг>:<арг>[#страница]";
+# номер страницы есть только у действий, назначенных с paged=True
+VERSION = "1"
+SEPARATOR = ":"
+_V1_PREFIX = VERSION + SEPARATOR
+# Старый формат: "<действие>_<арг>_<арг>" (кнопки уже отправленных сообщений)
+LEGACY_SEPARATOR = "_"
+
+Handler = Callable[[Any, Any], Awaitable[Any]]
+
+
+class CallbackData(NamedTuple):
+    """Разобранные callback_data: действие, аргументы и номер страницы."""
+
+    action: str
+    args: Tuple[str, ...] = ()
+    page: int = 0
+
+    def ints(self, count: int = 1) -> Optional[Tuple[int, ...]]:
+        """Первые count аргументов как числа (None — аргументов нет или не числа)."""
+        if len(self.args) < count:
+            return None
+        values = self.args[:count]
+        if not all(value.isdigit() for value in values):
+            return None
+        return tuple(int(value) for value in values)
+
+
+class ActionStats:
+    """Счетчики обработки одного действия."""
+
+    __slots__ = ("calls", "errors", "total", "slowest")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def add(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+
+
+class CallbackRouter:
+    """Маршрутизатор нажатий inline-кнопок.
+
+    callback_data разбирается один раз: формат версии 1 — по коду действия
+    (словарь), старый формат — по самому длинному известному префиксу до
+    «_» (несколько обращений к словарю). Обработчик выбирается по действию
+    из словаря; разобранные данные кладутся в context.callback.
+
+    codes — постоянная таблица действие -> короткий код. Коды попадают в
+    кнопки отправленных сообщений, поэтому их нельзя менять или
+    переиспользовать (только добавлять новые).
+    """
+
+    def __init__(self, codes: Mapping[str, str], clock: Callable[[], float] = time.perf_counter) -> None:
+        self._codes: Dict[str, str] = dict(codes)
+        self._actions: Dict[str, str] = {code: action for action, code in self._codes.items()}
+        if len(self._actions) != len(self._codes):
+            raise ValueError("Коды действий callback_data должны быть уникальны")
+        # Действия, у которых последний аргумент — произвольный текст (тип устройства)
+        self._rest: Set[str] = set()
+        # Действия со списками по страницам: номер страницы — суффикс "#<n>"
+        self._paged: Set[str] = set()
+        self._handlers: Dict[str, Handler] = {}
+        self._clock = clock
+        self.stats: Dict[str, ActionStats] = {}
+        self.unknown = 0
+
+    def route(self, action: str, handler: Handler, *, rest: bool = False, paged: bool = False) -> None:
+        """Назначает обработчик действию.
+
+        rest — аргумент целиком (без разбиения); paged — callback_data несет
+        номер страницы (кнопки создаются через pagination.with_page).
+        """
+        if action not in self._codes:
+            raise KeyError(f"Нет кода для действия callback_data: {action}")
+        self._handlers[action] = handler
+        if rest:
+            self._rest.add(action)
+        if paged:
+            self._paged.add(action)
+
+    # ---------- кодирование ----------
+
+    def encode(self, action: str, *args: Any) -> str:
+        """callback_data действия в формате версии 1: "1:bd:42"."""
+        parts = [VERSION, self._codes[action]]
+        for value in args:
+            text = str(value)
+            if SEPARATOR in text and action not in self._rest:
+                raise ValueError(f"Аргумент callback_data содержит '{SEPARATOR}': {text!r}")
+            parts.append(text)
+        return SEPARATOR.join(parts)
+
+    def parse(self, data: Optional[str]) -> Optional[CallbackData]:
+        """CallbackData из callback_data (любой версии); None — неизвестное действие."""
+        if not data:
+            return None
+        if data.startswith(_V1_PREFIX):
+            body = data[len(_V1_PREFIX):]
+            code = body.partition(SEPARATOR)[0].partition(PAGE_SEPARATOR)[0]
+            action = self._actions.get(code)
+            if action is None:
+                return None
+            page = 0
+            # Суффикс страницы снимается только у постраничных действий: у прочих
+            # "#" в аргументе (тип "Rack#2") — часть текста
+            if action in self._paged:
+                body, page = split_page(body)
+            return CallbackData(action, self._split(action, body[len(code) + 1:], SEPARATOR), page)
+        # Старый формат появился раньше страниц: номера страницы в нем нет
+        if data in self._codes:
+            return CallbackData(data)
+        # Самый длинный известный префикс: "admin_book_select_5_7" -> admin_book_select
+        end = data.rfind(LEGACY_SEPARATOR)
+        while end > 0:
+            action = data[:end]
+            if action in self._codes:
+                return CallbackData(action, self._split(action, data[end + 1:], LEGACY_SEPARATOR))
+            end = data.rfind(LEGACY_SEPARATOR, 0, end)
+        return None
+
+    def _split(self, action: str, tail: str, separator: str) -> Tuple[str, ...]:
+        if not tail:
+            return ()
+        if action in self._rest:
+            return (tail,)
+        return tuple(tail.split(separator))
+
+    # ---------- обработка ----------
+
+    async def dispatch(self, update: Any, context: Any) -> Any:
+        """Обработчик CallbackQueryHandler: разбор, выбор обработчика, метрики."""
+        query = update.callback_query
+        parsed = self.parse(query.data)
+        handler = self._handlers.get(parsed.action) if parsed is not None else None
+        if handler is None:
+            self.unknown += 1
+            logger.debug("Неизвестные callback_data: %r", query.data)
+            await query.answer()
+            return None
+        context.callback = parsed
+        stats = self.stats.get(parsed.action)
+        if stats is None:
+            stats = self.stats[parsed.action] = ActionStats()
+        started = self._clock()
+        failed = True
+        try:
+            result = await handler(update, context)
+            failed = False
+            return result
+        finally:
+            stats.add(self._clock() - started, failed)
+
+    def report(self) -> List[str]:
+        """Строки статистики по действиям (по суммарному времени обработки)."""
+        lines = []
+        for action, stats in sorted(self.stats.items(), key=lambda item: item[1].total, reverse=True):
+            lines.append(
+                f"{action}: {stats.calls} вызовов, ошибок {stats.errors}, "
+                f"среднее {stats.total / stats.calls * 1000:.1f} мс, максимум {stats.slowest * 1000:.1f} мс"
+            )
+        if self.unknown:
+            lines.append(f"неизвестных callback_data: {self.unknown}")
+        return lines
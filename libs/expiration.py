@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import heapq
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ExpirationScheduler:
+    """Сроки брони устройств в мин-куче (expiry, device_id).
+
+    Подписывается на коллекцию устройств (Collection.add_listener): при
+    изменении записи срок разбирается заново только если поменялась строка
+    booking_expiration или статус, поэтому обработчикам не нужно проходить
+    по всем устройствам. Устаревшие элементы кучи (перебронирование,
+    освобождение) не удаляются сразу, а пропускаются при извлечении.
+
+    on_earlier вызывается, когда ближайший срок стал раньше: по нему
+    таймер (задание job_queue) переставляется на новый срок.
+    """
+
+    def __init__(self, key: str = "id", status: str = "booked", field: str = "booking_expiration") -> None:
+        self.key = key
+        self.status = status
+        self.field = field
+        self._heap: List[Tuple[datetime, int, Any]] = []
+        self._counter = count()
+        # device_id -> (срок, исходная строка)
+        self._deadlines: Dict[Any, Tuple[datetime, str]] = {}
+        self.on_earlier: Optional[Callable[[datetime], None]] = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    # ---------- подписка на коллекцию ----------
+
+    def _token(self, record: Any) -> Optional[str]:
+        """Строка, от которой зависит срок записи (None — срока нет)."""
+        if record.get("status") != self.status:
+            return None
+        return record.get(self.field) or None
+
+    def _when(self, token: str) -> datetime:
+        return datetime.fromisoformat(token)
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        device_id = record.get(self.key)
+        try:
+            hash(device_id)
+        except TypeError:
+            return
+        token = None if removed else self._token(record)
+        known = self._deadlines.get(device_id)
+        if known is not None and known[1] == token:
+            return
+        if token is None:
+            self._deadlines.pop(device_id, None)
+            return
+        try:
+            when = self._when(token)
+        except (TypeError, ValueError):
+            self._deadlines.pop(device_id, None)
+            return
+        previous = self.next_deadline()
+        self._deadlines[device_id] = (when, token)
+        heapq.heappush(self._heap, (when, next(self._counter), device_id))
+        self._compact()
+        if self.on_earlier is not None and (previous is None or when < previous):
+            self.on_earlier(when)
+
+    def rebuild(self, records: Any) -> None:
+        """Пересчитывает все сроки (heapify — O(n) после разбора n сроков)."""
+        self._deadlines = {}
+        for record in records:
+            device_id = record.get(self.key)
+            token = self._token(record)
+            if token is None:
+                continue
+            try:
+                self._deadlines[device_id] = (self._when(token), token)
+            except (TypeError, ValueError):
+                continue
+        self._heap = [(when, next(self._counter), key) for key, (when, _) in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def _compact(self) -> None:
+        # Куча не должна разрастаться из-за устаревших элементов
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(when, next(self._counter), key) for key, (when, _) in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, item: Tuple[datetime, int, Any]) -> bool:
+        known = self._deadlines.get(item[2])
+        return known is not None and known[0] == item[0]
+
+    # ---------- сроки ----------
+
+    def next_deadline(self) -> Optional[datetime]:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[Any]:
+        """Устройства, чей срок наступил к now (снимаются с учета)."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if self._is_current(item):
+                del self._deadlines[item[2]]
+                due.append(item[2])
+        return due
+
+
+class ReminderScheduler(ExpirationScheduler):
+    """Сроки напоминаний: booking_expiration минус lead (notify_before_minutes).
+
+    Напоминания выводятся из состояния устройств, поэтому переживают
+    перезапуск: после отправки в записи устройства сохраняется
+    ``reminded_for`` = booking_expiration, и для этой брони напоминание
+    больше не планируется. Новая бронь (другой срок) планируется заново.
+    """
+
+    MARK = "reminded_for"
+
+    def __init__(self, lead: timedelta = timedelta(0), **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.lead = lead
+
+    def _token(self, record: Any) -> Optional[str]:
+        token = super()._token(record)
+        if token is None or record.get(self.MARK) == token:
+            return None
+        return token
+
+    def _when(self, token: str) -> datetime:
+        return super()._when(token) - self.lead
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+Normalizer = Callable[[Any], Any]
+
+
+class FacetCounters:
+    """Счетчики записей по (группа, тип, статус).
+
+    Хранятся вложенными словарями group -> type -> status -> количество и
+    обновляются по подписке на коллекцию (Collection.add_listener):
+    бронирование, освобождение, импорт и смена группы меняют только
+    счетчики старого и нового ключа записи. Меню строятся из счетчиков за
+    O(групп × типов), без прохода по устройствам.
+    """
+
+    def __init__(
+        self,
+        group_field: str = "group_id",
+        type_field: str = "type",
+        status_field: str = "status",
+        normalizers: Optional[Dict[str, Normalizer]] = None,
+        default_type: Any = None,
+    ) -> None:
+        self.fields = (group_field, type_field, status_field)
+        normalizers = normalizers or {}
+        self._normalizers = tuple(normalizers.get(field) for field in self.fields)
+        self.default_type = default_type
+        self._counts: Dict[Any, Dict[Any, Dict[Any, int]]] = {}
+        # id(record) -> ключ, под которым запись посчитана
+        self._docs: Dict[int, Tuple[Any, Any, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ---------- подписка на коллекцию ----------
+
+    def _key(self, record: Any) -> Tuple[Any, Any, Any]:
+        group_field, type_field, status_field = self.fields
+        key = (
+            record.get(group_field),
+            record.get(type_field, self.default_type),
+            record.get(status_field),
+        )
+        return tuple(
+            value if normalize is None else normalize(value)
+            for value, normalize in zip(key, self._normalizers)
+        )
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        doc = id(record)
+        key = None if removed else self._key(record)
+        known = self._docs.get(doc)
+        if known == key:
+            return
+        if known is not None:
+            self._add(known, -1)
+        if key is None:
+            self._docs.pop(doc, None)
+        else:
+            self._docs[doc] = key
+            self._add(key, 1)
+
+    def _add(self, key: Tuple[Any, Any, Any], delta: int) -> None:
+        group, dev_type, status = key
+        types = self._counts.setdefault(group, {})
+        statuses = types.setdefault(dev_type, {})
+        count = statuses.get(status, 0) + delta
+        if count > 0:
+            statuses[status] = count
+            return
+        statuses.pop(status, None)
+        if not statuses:
+            del types[dev_type]
+            if not types:
+                del self._counts[group]
+
+    def rebuild(self, records: Iterable[Any]) -> None:
+        self._counts = {}
+        self._docs = {}
+        for record in records:
+            self.observe(record)
+
+    # ---------- чтение ----------
+
+    def _selected(self, groups: Optional[Iterable[Any]]) -> Iterable[Dict[Any, Dict[Any, int]]]:
+        if groups is None:
+            return self._counts.values()
+        return [self._counts[group] for group in set(groups) if group in self._counts]
+
+    def by_type(self, groups: Optional[Iterable[Any]] = None, status: Any = None) -> Dict[Any, int]:
+        """Количество по типам в группах groups (None — во всех) со статусом
+        status (None — с любым); типы без записей не попадают в результат."""
+        result: Dict[Any, int] = {}
+        for types in self._selected(groups):
+            for dev_type, statuses in types.items():
+                count = sum(statuses.values()) if status is None else statuses.get(status, 0)
+                if count:
+                    result[dev_type] = result.get(dev_type, 0) + count
+        return result
+
+    def total(self, groups: Optional[Iterable[Any]] = None, status: Any = None) -> int:
+        return sum(self.by_type(groups, status).values())
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import re
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# Символы, которые OCR путает с цифрами: ключ строится по «цифровому» варианту
+CONFUSIONS = str.maketrans({"O": "0", "Q": "0", "I": "1", "L": "1", "S": "5", "B": "8", "Z": "2", "G": "6"})
+
+_NOT_ALNUM = re.compile(r"[^0-9A-Z]")
+_by_seq = attrgetter("_seq")
+
+
+def sn_key(sn: Any) -> str:
+    """Ключ SN для нечеткого поиска: верхний регистр, без разделителей, O->0, I->1, S->5, B->8..."""
+    if sn is None:
+        return ""
+    return _NOT_ALNUM.sub("", str(sn).upper()).translate(CONFUSIONS)
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Расстояние Левенштейна (вставка, удаление, замена — по 1).
+
+    Бит-параллельный алгоритм Майерса: столбец матрицы расстояний хранится
+    битами целого числа, поэтому на символ b — несколько операций с int
+    вместо прохода по len(a) ячейкам.
+    """
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, score = full, 0, len(a)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+    return score
+
+
+def deletions(key: str, depth: int) -> Set[str]:
+    """Все строки, получаемые из key удалением не более depth символов (включая key)."""
+    result = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        result |= frontier
+    return result
+
+
+class FuzzySerialIndex:
+    """Нечеткий поиск SN с ошибками OCR.
+
+    Путаница O/0, I/1, S/5, B/8 убирается уже в ключе (sn_key). Оставшиеся
+    ошибки — пропущенный, лишний или неверный символ — ищутся индексом
+    удалений: для каждого ключа хранятся все варианты с удалением до
+    max_distance символов. Если расстояние Левенштейна между ключами не
+    больше k, у них есть общий вариант с не более чем k удалениями с каждой
+    стороны, поэтому поиск — это несколько обращений к словарю по вариантам
+    запроса и проверка найденных кандидатов, без прохода по всем SN.
+
+    Подписывается на коллекцию устройств (Collection.add_listener).
+    """
+
+    def __init__(self, field: str = "sn", max_distance: int = 1) -> None:
+        self.field = field
+        self.max_distance = max_distance
+        # вариант -> ключ (или множество ключей, если их несколько)
+        self._variants: Dict[str, Union[str, Set[str]]] = {}
+        # ключ -> id записей
+        self._keys: Dict[str, Set[int]] = {}
+        # id(record) -> (record, ключ)
+        self._docs: Dict[int, Tuple[Any, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ---------- подписка на коллекцию ----------
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        doc = id(record)
+        key = None if removed else sn_key(record.get(self.field)) or None
+        known = self._docs.get(doc)
+        if known is not None and known[1] == key and known[0] is record:
+            return
+        if known is not None:
+            del self._docs[doc]
+            docs = self._keys.get(known[1])
+            if docs is not None:
+                docs.discard(doc)
+                if not docs:
+                    del self._keys[known[1]]
+                    self._drop_variants(known[1])
+        if key is not None:
+            self._docs[doc] = (record, key)
+            docs = self._keys.get(key)
+            if docs is None:
+                self._keys[key] = {doc}
+                self._add_variants(key)
+            else:
+                docs.add(doc)
+
+    def _add_variants(self, key: str) -> None:
+        variants = self._variants
+        for variant in deletions(key, self.max_distance):
+            current = variants.get(variant)
+            if current is None:
+                variants[variant] = key
+            elif isinstance(current, str):
+                if current != key:
+                    variants[variant] = {current, key}
+            else:
+                current.add(key)
+
+    def _drop_variants(self, key: str) -> None:
+        variants = self._variants
+        for variant in deletions(key, self.max_distance):
+            current = variants.get(variant)
+            if current is None:
+                continue
+            if isinstance(current, str):
+                if current == key:
+                    del variants[variant]
+                continue
+            current.discard(key)
+            if len(current) == 1:
+                variants[variant] = next(iter(current))
+
+    def rebuild(self, records: Iterable[Any]) -> None:
+        self._variants = {}
+        self._keys = {}
+        self._docs = {}
+        for record in records:
+            self.observe(record)
+
+    # ---------- поиск ----------
+
+    def lookup(self, code: str, max_distance: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """(расстояние, запись) для SN в пределах max_distance; сначала ближайшие.
+
+        max_distance не больше заданного при создании индекса.
+        """
+        query = sn_key(code)
+        if not query:
+            return []
+        depth = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        keys: Set[str] = set()
+        for variant in deletions(query, depth):
+            current = self._variants.get(variant)
+            if current is None:
+                continue
+            if isinstance(current, str):
+                keys.add(current)
+            else:
+                keys |= current
+        found: List[Tuple[int, Any]] = []
+        for key in keys:
+            distance = levenshtein(query, key)
+            if distance <= depth:
+                found.extend((distance, self._docs[doc][0]) for doc in self._keys[key])
+        found.sort(key=lambda item: (item[0], _by_seq(item[1])))
+        return found
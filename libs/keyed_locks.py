@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Iterable
+
+
+class KeyedLocks:
+    """asyncio.Lock на ключ (устройство, пользователь, чат).
+
+    Блокировка существует, пока ее кто-то держит или ждет: словарь хранит
+    слабые ссылки, поэтому число ключей не растет неограниченно.
+    """
+
+    def __init__(self) -> None:
+        self._locks: "weakref.WeakValueDictionary[Any, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def get(self, key: Any) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def ordered(self, keys: Iterable[Any]) -> list:
+        """Блокировки ключей в фиксированном порядке (без взаимных блокировок)."""
+        return [self.get(key) for key in sorted(set(keys), key=repr)]
+
+
+@asynccontextmanager
+async def hold(locks: Iterable[asyncio.Lock]) -> AsyncIterator[None]:
+    """Берет блокировки по порядку и отпускает в обратном."""
+    async with AsyncExitStack() as stack:
+        for lock in locks:
+            await stack.enter_async_context(lock)
+        yield
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from libs.records import json_default
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+UNDATED = "undated"
+
+_ARCHIVE_NAME = re.compile(r"^device_logs-(\d{4}-\d{2}|undated)\.jsonl\.gz$")
+
+
+def entry_time(entry: Any) -> Optional[datetime]:
+    """Время записи лога или None, если timestamp отсутствует или не разбирается."""
+    try:
+        return datetime.strptime(entry.get("timestamp"), TIMESTAMP_FORMAT)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def split_expired(
+    entries: List[Any],
+    cutoff: Optional[datetime] = None,
+    max_entries: int = 0,
+) -> Tuple[List[Any], List[Any]]:
+    """Делит историю SN на (остается, в архив).
+
+    В архив уходят записи старше cutoff и самые старые записи сверх
+    max_entries (история хранится в порядке добавления). Записи без
+    разбираемого timestamp по возрасту не архивируются. Порядок сохраняется.
+    """
+    keep: List[Any] = []
+    expired: List[Any] = []
+    for entry in entries:
+        when = entry_time(entry) if cutoff is not None else None
+        if when is not None and when < cutoff:
+            expired.append(entry)
+        else:
+            keep.append(entry)
+    if max_entries > 0 and len(keep) > max_entries:
+        overflow = len(keep) - max_entries
+        expired.extend(keep[:overflow])
+        keep = keep[overflow:]
+    return keep, expired
+
+
+class LogArchive:
+    """Архив истории устройств: gzip-файлы по месяцам.
+
+    ``DIR/device_logs-YYYY-MM.jsonl.gz`` — строки ``{"sn": ..., "entry": {...}}``
+    за месяц записи. Архив только дописывается: каждая пачка — отдельный
+    gzip-член в конце файла (gzip читает их подряд как один поток), поэтому
+    старые данные не переписываются. Оборванный после сбоя последний член
+    пропускается при чтении.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, month: str) -> str:
+        return os.path.join(self.directory, f"device_logs-{month}.jsonl.gz")
+
+    @staticmethod
+    def month_of(entry: Any) -> str:
+        when = entry_time(entry)
+        return when.strftime("%Y-%m") if when is not None else UNDATED
+
+    def months(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            match = _ARCHIVE_NAME.match(name)
+            if match:
+                found.append(match.group(1))
+        # «undated» — после всех месяцев
+        return sorted(found, key=lambda m: (m == UNDATED, m))
+
+    # ---------- запись ----------
+    # encode() выполняется в потоке вызывающего, write() — в потоке записи.
+
+    def encode(self, records: Iterable[Tuple[str, Any]]) -> Dict[str, bytes]:
+        lines: Dict[str, List[str]] = {}
+        for sn, entry in records:
+            line = json.dumps({"sn": sn, "entry": entry}, ensure_ascii=False, default=json_default)
+            lines.setdefault(self.month_of(entry), []).append(line)
+        return {month: ("\n".join(chunk) + "\n").encode("utf-8") for month, chunk in lines.items()}
+
+    def write(self, payload: Dict[str, bytes]) -> None:
+        if not payload:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            for month, data in sorted(payload.items()):
+                with open(self.path_for(month), "ab") as raw:
+                    with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                        gz.write(data)
+                    raw.flush()
+                    os.fsync(raw.fileno())
+
+    def append(self, records: Iterable[Tuple[str, Any]]) -> None:
+        self.write(self.encode(records))
+
+    # ---------- чтение ----------
+
+    def read(self, months: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Any]]:
+        """Записи архива (sn, entry) по месяцам; файлы читаются потоково."""
+        for month in self.months() if months is None else months:
+            path = self.path_for(month)
+            if not os.path.exists(path):
+                continue
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = self._parse(line, path)
+                        if record is not None:
+                            yield record
+            except (EOFError, OSError, zlib.error):
+                logger.warning("Архив логов оборван, прочитан до места сбоя: %s", path)
+
+    @staticmethod
+    def _parse(line: str, path: str) -> Optional[Tuple[str, Any]]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+            return record["sn"], record["entry"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            logger.warning("Пропущена поврежденная строка архива %s", path)
+            return None
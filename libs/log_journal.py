@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from libs import storage_codecs
+
+logger = logging.getLogger(__name__)
+
+LogIndex = Dict[str, List[Dict[str, Any]]]
+
+
+def atomic_write_bytes(path: str, payload: bytes) -> None:
+    """Атомарная запись файла: временный файл + fsync + os.replace."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class LogJournal:
+    """Журнал действий с устройствами: снапшот + append-only JSON Lines.
+
+    Каждое действие дописывается одной строкой ``{"sn": ..., "entry": {...}}``
+    с fsync, поэтому стоимость записи не зависит от объема истории.
+    Компакция переносит накопленное состояние в снапшот (обычный JSON
+    ``{sn: [entries]}``) и обнуляет журнал. При загрузке снапшот читается
+    целиком, затем поверх него проигрываются строки журнала.
+    """
+
+    def __init__(self, snapshot_path: str, journal_path: Optional[str] = None, codec: Any = None) -> None:
+        self.snapshot_path = snapshot_path
+        # Кодек снапшота (libs/storage_codecs.py); журнал всегда JSON Lines
+        self.codec = codec or storage_codecs.get_codec("json-pretty")
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".jsonl"
+        self._lock = threading.RLock()
+        self._fh = None
+        # Количество строк в журнале после последней компакции
+        self.pending = 0
+
+    # ---------- загрузка ----------
+
+    def load(self) -> LogIndex:
+        """Читает снапшот и проигрывает журнал, восстанавливая индекс по SN."""
+        with self._lock:
+            logs = self._load_snapshot()
+            self.pending = self._replay_journal(logs)
+            return logs
+
+    def _load_snapshot(self) -> LogIndex:
+        if not os.path.exists(self.snapshot_path):
+            return {}
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                data = storage_codecs.loads(f.read())
+        except ValueError:
+            logger.error("Снапшот логов поврежден: %s", self.snapshot_path)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _replay_journal(self, logs: LogIndex) -> int:
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    sn = record["sn"]
+                    entry = record["entry"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # Оборванная последняя строка после сбоя — пропускаем
+                    logger.warning("Пропущена поврежденная строка журнала %s:%s", self.journal_path, line_no)
+                    continue
+                logs.setdefault(sn, []).append(entry)
+                replayed += 1
+        return replayed
+
+    # ---------- запись ----------
+
+    def _journal_handle(self):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._fh = open(self.journal_path, "ab")
+        return self._fh
+
+    @staticmethod
+    def encode_records(records: Iterable[Tuple[str, Dict[str, Any]]]) -> List[bytes]:
+        """Сериализует записи в строки журнала (можно делать вне потока записи)."""
+        return [storage_codecs.dumps_line({"sn": sn, "entry": entry}) + b"\n" for sn, entry in records]
+
+    def encode_snapshot(self, logs: LogIndex) -> bytes:
+        return self.codec.dumps(logs)
+
+    def append(self, sn: str, entry: Dict[str, Any]) -> None:
+        """Дописывает одну запись и сбрасывает ее на диск."""
+        self.append_many([(sn, entry)])
+
+    def append_many(self, records: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Дописывает пачку записей с одним fsync (group commit)."""
+        self.write_lines(self.encode_records(records))
+
+    def write_lines(self, lines: List[bytes]) -> None:
+        if not lines:
+            return
+        with self._lock:
+            fh = self._journal_handle()
+            fh.write(b"".join(lines))
+            fh.flush()
+            os.fsync(fh.fileno())
+            self.pending += len(lines)
+
+    def compact(self, logs: LogIndex) -> None:
+        """Записывает полный снапшот атомарно и очищает журнал."""
+        self.write_snapshot(self.encode_snapshot(logs))
+
+    def write_snapshot(self, payload: bytes) -> None:
+        """Атомарно заменяет снапшот уже сериализованным текстом и обнуляет журнал."""
+        with self._lock:
+            atomic_write_bytes(self.snapshot_path, payload)
+            # Снапшот уже содержит все записи журнала — журнал можно обнулить
+            self.truncate()
+
+    def truncate(self) -> None:
+        with self._lock:
+            self.close()
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from libs import storage_codecs
+from libs.log_journal import LogJournal, atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+Bucket = Any
+BucketLogs = Dict[str, List[Any]]
+
+MANIFEST_FORMAT = "sharded-v1"
+
+
+class ShardedLogFiles:
+    """История устройств на диске, разбитая на бакеты по хешу SN.
+
+    Раскладка в DATA_DIR:
+
+    - ``device_logs/NNNN.json`` — снапшот бакета ``{"lsn": N, "logs": {sn: [...]}}``
+      (формат файла — storage_format);
+    - ``device_logs.json`` — манифест (число бакетов и lsn последней компакции).
+
+    Новые записи лога пишутся в общий WAL хранилища (libs/wal.py), а сюда
+    попадают через add(): записи, еще не свернутые в снапшоты, держатся
+    в памяти по бакетам и добавляются к бакету при загрузке. Снапшот хранит
+    lsn, до которого он включает WAL, поэтому сбой между записью снапшотов
+    и очисткой WAL не дублирует записи.
+
+    Если вместо манифеста лежит прежний единый device_logs.json, при открытии
+    он (вместе с прежним журналом device_logs.jsonl) разносится по бакетам;
+    строки прежнего журнала при уже существующем манифесте дочитываются
+    и удаляются при следующей компакции.
+    """
+
+    def __init__(
+        self,
+        manifest_path: str,
+        journal_path: str,
+        directory: str,
+        buckets: int = 64,
+        codec: Any = None,
+    ) -> None:
+        self.manifest_path = manifest_path
+        self.journal_path = journal_path
+        self.directory = directory
+        self.buckets = max(1, int(buckets))
+        self.codec = codec or storage_codecs.get_codec("json")
+        self._lock = threading.RLock()
+        self._opened = False
+        # lsn последней компакции (или последней строки прежнего журнала)
+        self.lsn = 0
+        # Записи после последней компакции: bucket -> [(lsn, sn, entry)]
+        self._overlay: Dict[int, List[Tuple[int, str, Any]]] = {}
+        # Записи, еще не свернутые в снапшоты
+        self.pending = 0
+
+    # ---------- открытие и миграция ----------
+
+    def open(self) -> "ShardedLogFiles":
+        with self._lock:
+            if self._opened:
+                return self
+            manifest = self._read_manifest()
+            if manifest is not None:
+                self.buckets = int(manifest.get("buckets", self.buckets))
+                self.lsn = int(manifest.get("lsn", 0))
+                self._replay_journal()
+            elif os.path.exists(self.manifest_path) or self._journal_has_lines():
+                self._migrate_legacy()
+            self._opened = True
+            return self
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "rb") as f:
+                data = storage_codecs.loads(f.read())
+        except ValueError:
+            logger.error("Манифест логов поврежден, восстанавливаем по бакетам: %s", self.manifest_path)
+            return self._recover_manifest()
+        if isinstance(data, dict) and data.get("format") == MANIFEST_FORMAT:
+            return data
+        return None
+
+    def _recover_manifest(self) -> Dict[str, Any]:
+        lsn = 0
+        for bucket in self._bucket_files():
+            lsn = max(lsn, self._read_shard(bucket)[0])
+        return {"format": MANIFEST_FORMAT, "buckets": self.buckets, "lsn": lsn}
+
+    def _journal_has_lines(self) -> bool:
+        return os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0
+
+    def _migrate_legacy(self) -> None:
+        """Разносит прежний единый снапшот + журнал по бакетам."""
+        legacy = LogJournal(self.manifest_path, self.journal_path)
+        logs = legacy.load()
+        legacy.close()
+        shards: Dict[int, BucketLogs] = {}
+        for sn, entries in logs.items():
+            shards.setdefault(self.bucket_of(sn), {})[sn] = entries
+        self.lsn = self._max_journal_lsn()
+        self.write_snapshot(self.encode_snapshot(shards, self.lsn))
+        logger.info("Логи перенесены в %s бакетов: %s SN", len(shards), len(logs))
+
+    def _max_journal_lsn(self) -> int:
+        lsn = 0
+        for record in self._journal_records():
+            lsn = max(lsn, record[0])
+        return lsn
+
+    def _journal_records(self) -> Iterator[Tuple[int, str, Any]]:
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    yield int(record.get("lsn", 0)), record["sn"], record["entry"]
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+                    # Оборванная последняя строка после сбоя — пропускаем
+                    logger.warning("Пропущена поврежденная строка журнала %s:%s", self.journal_path, line_no)
+
+    def _replay_journal(self) -> None:
+        for lsn, sn, entry in self._journal_records():
+            if lsn == 0:
+                # Строка прежнего формата уже перенесена в бакеты при миграции
+                continue
+            self.lsn = max(self.lsn, lsn)
+            self.add(lsn, sn, entry)
+
+    # ---------- чтение ----------
+
+    def bucket_of(self, sn: str) -> int:
+        return zlib.crc32(str(sn).encode("utf-8")) % self.buckets
+
+    def _shard_path(self, bucket: int) -> str:
+        return os.path.join(self.directory, f"{bucket:04d}.json")
+
+    def _bucket_files(self) -> Set[int]:
+        if not os.path.isdir(self.directory):
+            return set()
+        result = set()
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".json" and stem.isdigit():
+                result.add(int(stem))
+        return result
+
+    def bucket_ids(self) -> Set[int]:
+        with self._lock:
+            return self._bucket_files() | set(self._overlay)
+
+    def journal_buckets(self) -> Set[int]:
+        """Бакеты, которые нужно переписать, чтобы очистить журнал."""
+        with self._lock:
+            return set(self._overlay)
+
+    def _read_shard(self, bucket: int) -> Tuple[int, BucketLogs]:
+        path = self._shard_path(bucket)
+        if not os.path.exists(path):
+            return 0, {}
+        try:
+            with open(path, "rb") as f:
+                data = storage_codecs.loads(f.read())
+        except ValueError:
+            logger.error("Бакет логов поврежден: %s", path)
+            return 0, {}
+        if not isinstance(data, dict):
+            return 0, {}
+        logs = data.get("logs")
+        return int(data.get("lsn", 0)), logs if isinstance(logs, dict) else {}
+
+    def load_bucket(self, bucket: int) -> BucketLogs:
+        with self._lock:
+            shard_lsn, logs = self._read_shard(bucket)
+            for lsn, sn, entry in self._overlay.get(bucket, ()):
+                if lsn > shard_lsn:
+                    logs.setdefault(sn, []).append(entry)
+            return logs
+
+    def read_all(self) -> BucketLogs:
+        """Вся история целиком (для импорта в другой бэкенд)."""
+        self.open()
+        logs: BucketLogs = {}
+        for bucket in sorted(self.bucket_ids()):
+            logs.update(self.load_bucket(bucket))
+        return logs
+
+    # ---------- запись ----------
+    # encode_* выполняется в потоке вызывающего, write_* — в потоке записи.
+
+    def add(self, lsn: int, sn: str, entry: Any) -> None:
+        """Запись лога из WAL с номером lsn (еще не в снапшоте бакета)."""
+        with self._lock:
+            self._overlay.setdefault(self.bucket_of(sn), []).append((lsn, sn, entry))
+            self.pending += 1
+
+    def encode_snapshot(self, shards: Dict[int, BucketLogs], lsn: int) -> Tuple[List[Tuple[int, bytes]], bytes, bool]:
+        """Сериализует бакеты на момент lsn.
+
+        Третий элемент — переписаны все бакеты с несвернутыми записями
+        (тогда прежний журнал можно удалить, а WAL — обнулить).
+        """
+        with self._lock:
+            self.lsn = max(self.lsn, lsn)
+            files = [(bucket, self.codec.dumps({"lsn": lsn, "logs": logs})) for bucket, logs in shards.items()]
+            manifest = json.dumps(
+                {"format": MANIFEST_FORMAT, "buckets": self.buckets, "lsn": lsn}, indent=4
+            ).encode("utf-8")
+            truncate = set(self._overlay) <= set(shards)
+            if truncate:
+                self._overlay.clear()
+                self.pending = 0
+            return files, manifest, truncate
+
+    def write_snapshot(self, payload: Tuple[List[Tuple[int, bytes]], bytes, bool]) -> None:
+        files, manifest, truncate = payload
+        with self._lock:
+            for bucket, data in files:
+                atomic_write_bytes(self._shard_path(bucket), data)
+            atomic_write_bytes(self.manifest_path, manifest)
+            if truncate and os.path.exists(self.journal_path):
+                # Прежний журнал полностью перенесен в бакеты
+                os.remove(self.journal_path)
+
+
+class LazyLogs(MutableMapping):
+    """Словарь SN -> [записи], который подгружает историю бакетами по требованию.
+
+    Источник (source) отдает номер бакета по SN (bucket_of), список бакетов
+    (bucket_ids) и содержимое бакета (load_bucket). Загруженные бакеты живут
+    в LRU-кэше, ограниченном max_entries записями.
+
+    Бакет с изменениями, которые еще не легли на диск, не вытесняется:
+    для каждого бакета помним номер последнего дописывания/изменения и номер,
+    до которого запись подтверждена (mark_durable). Изменения «на месте»
+    (``logs[sn].append(...)``) кэш не видит — после них сразу вызывайте
+    storage.save_logs().
+    """
+
+    def __init__(self, max_entries: int = 100_000, entry_type: Optional[Callable[[Any], Any]] = None) -> None:
+        self.max_entries = max_entries
+        self._entry_type = entry_type
+        self._lock = threading.RLock()
+        self._source = None
+        self._source_factory: Optional[Callable[[], Any]] = None
+        self._cache: "OrderedDict[Bucket, BucketLogs]" = OrderedDict()
+        self._sizes: Dict[Bucket, int] = {}
+        self._total = 0
+        self._seq = count(1)
+        self._last_seq = 0
+        # bucket -> [append_seq, modified_seq, durable_append_seq, durable_modified_seq]
+        self._state: Dict[Bucket, List[int]] = {}
+
+    # ---------- источник ----------
+
+    def set_source_factory(self, factory: Callable[[], Any]) -> None:
+        """Источник, который открывается при первом обращении (до load_all)."""
+        self._source_factory = factory
+
+    def bind(self, source: Any) -> None:
+        with self._lock:
+            self.reset()
+            self._source = source
+
+    def reset(self) -> None:
+        """Сбрасывает кэш и отвязывает источник (несохраненные изменения теряются)."""
+        with self._lock:
+            self._source = None
+            self._cache.clear()
+            self._sizes.clear()
+            self._state.clear()
+            self._total = 0
+
+    @property
+    def source(self) -> Any:
+        if self._source is None and self._source_factory is not None:
+            self._source = self._source_factory()
+        return self._source
+
+    def bucket_of(self, sn: str) -> Bucket:
+        return self.source.bucket_of(sn)
+
+    # ---------- кэш ----------
+
+    def _convert(self, entries: Any) -> Any:
+        if self._entry_type is None or not isinstance(entries, list):
+            return entries
+        return [self._entry_type(e) if isinstance(e, dict) else e for e in entries]
+
+    def _bucket(self, bucket: Bucket) -> BucketLogs:
+        with self._lock:
+            logs = self._cache.get(bucket)
+            if logs is not None:
+                self._cache.move_to_end(bucket)
+                return logs
+            logs = {sn: self._convert(entries) for sn, entries in self.source.load_bucket(bucket).items()}
+            self._cache[bucket] = logs
+            self._resize(bucket)
+            self._evict(keep=bucket)
+            return logs
+
+    def _resize(self, bucket: Bucket) -> None:
+        size = sum(len(entries) for entries in self._cache[bucket].values())
+        self._total += size - self._sizes.get(bucket, 0)
+        self._sizes[bucket] = size
+
+    def _evictable(self, bucket: Bucket) -> bool:
+        state = self._state.get(bucket)
+        return state is None or (state[2] >= state[0] and state[3] >= state[1])
+
+    def _evict(self, keep: Bucket) -> None:
+        if self._total <= self.max_entries:
+            return
+        for bucket in list(self._cache):
+            if self._total <= self.max_entries:
+                break
+            if bucket == keep or not self._evictable(bucket):
+                continue
+            del self._cache[bucket]
+            self._total -= self._sizes.pop(bucket, 0)
+            self._state.pop(bucket, None)
+
+    def _note(self, bucket: Bucket, kind: int) -> None:
+        self._last_seq = next(self._seq)
+        self._state.setdefault(bucket, [0, 0, 0, 0])[kind] = self._last_seq
+
+    def cached_buckets(self) -> List[Bucket]:
+        with self._lock:
+            return list(self._cache)
+
+    def cached_entries(self) -> int:
+        return self._total
+
+    # ---------- учет записи на диск ----------
+
+    def checkpoint(self) -> int:
+        """Номер последнего изменения: все, что было до него, войдет в подготовленную запись."""
+        return self._last_seq
+
+    def mark_durable(self, buckets: Iterable[Bucket], seq: int, snapshot: bool) -> None:
+        """Запись, подготовленная на checkpoint() == seq, легла на диск."""
+        with self._lock:
+            for bucket in buckets:
+                state = self._state.get(bucket)
+                if state is None:
+                    continue
+                state[2] = max(state[2], seq)
+                if snapshot:
+                    state[3] = max(state[3], seq)
+            if self._cache:
+                self._evict(keep=next(reversed(self._cache)))
+
+    def snapshot(self, extra: Iterable[Bucket] = ()) -> Dict[Bucket, BucketLogs]:
+        """Полное содержимое загруженных бакетов (и бакетов из extra) для записи."""
+        with self._lock:
+            buckets = list(self._cache) + [b for b in extra if b not in self._cache]
+            return {bucket: self._bucket(bucket) for bucket in buckets}
+
+    def peek(self, bucket: Bucket) -> BucketLogs:
+        """Копия содержимого бакета без загрузки в кэш.
+
+        Загруженный бакет копируется (в нем могут быть еще не записанные
+        изменения), остальные читаются из источника. Можно вызывать из
+        другого потока: кэш и лимит max_entries не затрагиваются.
+        """
+        with self._lock:
+            logs = self._cache.get(bucket)
+            if logs is not None:
+                return {sn: list(entries) for sn, entries in logs.items()}
+        return {sn: self._convert(entries) for sn, entries in self.source.load_bucket(bucket).items()}
+
+    def scan(self) -> Iterator[Tuple[Bucket, BucketLogs]]:
+        """(бакет, копия содержимого) по одному бакету за раз, без заполнения кэша."""
+        for bucket in self._all_buckets():
+            yield bucket, self.peek(bucket)
+
+    # ---------- словарь ----------
+
+    def append(self, sn: str, entry: Any) -> None:
+        """Добавляет запись в историю SN (бакет не вытесняется до записи на диск)."""
+        with self._lock:
+            bucket = self.bucket_of(sn)
+            self._bucket(bucket).setdefault(sn, []).append(entry)
+            self._sizes[bucket] = self._sizes.get(bucket, 0) + 1
+            self._total += 1
+            self._note(bucket, 0)
+            self._evict(keep=bucket)
+
+    def __getitem__(self, sn: str) -> List[Any]:
+        return self._bucket(self.bucket_of(sn))[sn]
+
+    def __contains__(self, sn: object) -> bool:
+        return sn in self._bucket(self.bucket_of(sn))  # type: ignore[arg-type]
+
+    def __setitem__(self, sn: str, entries: List[Any]) -> None:
+        with self._lock:
+            bucket = self.bucket_of(sn)
+            self._bucket(bucket)[sn] = self._convert(entries)
+            self._resize(bucket)
+            self._note(bucket, 1)
+
+    def __delitem__(self, sn: str) -> None:
+        with self._lock:
+            bucket = self.bucket_of(sn)
+            del self._bucket(bucket)[sn]
+            self._resize(bucket)
+            self._note(bucket, 1)
+
+    def clear(self) -> None:
+        """Очищает историю целиком (без чтения бакетов с диска)."""
+        with self._lock:
+            for bucket in set(self.source.bucket_ids()) | set(self._cache):
+                self._cache[bucket] = {}
+                self._resize(bucket)
+                self._note(bucket, 1)
+
+    def _all_buckets(self) -> List[Bucket]:
+        with self._lock:
+            buckets = set(self.source.bucket_ids()) | set(self._cache)
+        return sorted(buckets, key=str)
+
+    def __iter__(self) -> Iterator[str]:
+        for bucket in self._all_buckets():
+            yield from list(self._bucket(bucket))
+
+    def __len__(self) -> int:
+        return sum(len(self._bucket(bucket)) for bucket in self._all_buckets())
+
+    def __repr__(self) -> str:
+        return f"LazyLogs(cached_buckets={len(self._cache)}, cached_entries={self._total})"
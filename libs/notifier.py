@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[..., Awaitable[Any]]
+OnDone = Callable[[Optional[BaseException]], Any]
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд.
+
+    reserve() сразу забирает токен (баланс может уйти в минус) и возвращает,
+    сколько секунд нужно подождать до его отправки — поэтому конкурентные
+    вызовы в одном event loop выстраиваются в очередь без блокировок.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._stamp = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд (глобальный flood-wait)."""
+        if self.rate > 0 and seconds > 0:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class Notification(NamedTuple):
+    chat_id: Any
+    text: str
+    kwargs: Dict[str, Any]
+    key: Optional[Hashable]
+    on_done: Optional[OnDone]
+    attempt: int = 0
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """Пауза из ошибки flood control (telegram.error.RetryAfter) в секундах."""
+    value = getattr(error, "retry_after", None)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+class Notifier:
+    """Очередь исходящих сообщений с ограничением скорости.
+
+    Обработчики ставят сообщение в очередь (enqueue) и сразу возвращаются;
+    отправляют его workers фоновых задач:
+
+    - не больше ``concurrency`` одновременных запросов к Telegram;
+    - общее ведро токенов ``rate`` сообщений/с (лимит Telegram ~30/с);
+    - не чаще одного сообщения в ``per_chat_interval`` секунд в один чат:
+      сообщения лежат в очередях по чатам, а чаты — в куче по моменту
+      готовности; worker берет только сообщение чата, в который уже можно
+      писать, поэтому серия сообщений в один чат не задерживает остальные;
+    - при RetryAfter сообщение повторяется после указанной паузы, при
+      ошибках из ``retryable`` — с экспоненциальной задержкой, не больше
+      ``max_retries`` раз;
+    - одинаковые сообщения (тот же чат и key, по умолчанию — текст), еще
+      не взятые в отправку, схлопываются в одно.
+
+    on_done(error) вызывается после отправки (error=None) или окончательной
+    ошибки; может быть корутиной.
+    """
+
+    def __init__(
+        self,
+        rate: float = 30.0,
+        per_chat_interval: float = 1.0,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        retryable: Tuple[type, ...] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.bucket = TokenBucket(rate, clock=clock)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max_retries
+        self.retryable = retryable
+        self._clock = clock
+        self._send: Optional[Send] = None
+        # chat_id -> сообщения чата в порядке постановки
+        self._chats: Dict[Any, Deque[Notification]] = {}
+        # (момент готовности, порядок, chat_id) чатов с сообщениями, которые сейчас не отправляются
+        self._ready: List[Tuple[float, int, Any]] = []
+        self._order = itertools.count()
+        # Чаты, сообщение в которые сейчас отправляется (не больше одного на чат)
+        self._sending: Set[Any] = set()
+        self._pending = 0
+        self._queued: Set[Tuple[Any, Hashable]] = set()
+        # chat_id -> момент, раньше которого в чат нельзя писать
+        self._chat_ready: Dict[Any, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._active = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    # ---------- постановка в очередь ----------
+
+    def enqueue(
+        self,
+        chat_id: Any,
+        text: str,
+        *,
+        key: Optional[Hashable] = None,
+        on_done: Optional[OnDone] = None,
+        **kwargs: Any,
+    ) -> bool:
+        """Ставит сообщение в очередь; False — такое же уже ждет отправки."""
+        dedup = (chat_id, key if key is not None else text)
+        if dedup in self._queued:
+            return False
+        self._queued.add(dedup)
+        self._push(Notification(chat_id, text, kwargs, dedup[1], on_done))
+        return True
+
+    def _push(self, item: Notification, first: bool = False) -> None:
+        """Кладет сообщение в очередь чата (first — в начало, для повтора)."""
+        pending = self._chats.get(item.chat_id)
+        if pending is None:
+            pending = self._chats[item.chat_id] = deque()
+            if item.chat_id not in self._sending:
+                self._schedule(item.chat_id)
+        if first:
+            pending.appendleft(item)
+        else:
+            pending.append(item)
+        self._pending += 1
+
+    def _schedule(self, chat_id: Any) -> None:
+        """Ставит чат в кучу готовности и будит workers."""
+        heapq.heappush(self._ready, (self._chat_ready.get(chat_id, 0.0), next(self._order), chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------- жизненный цикл ----------
+
+    def start(self, send: Send) -> None:
+        """Запускает workers в текущем event loop; send — bot.send_message."""
+        self._send = send
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        if self._ready:
+            self._wakeup.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout) и останавливает workers."""
+        deadline = self._clock() + timeout
+        while (self._pending or self._active) and self._workers and self._clock() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+        if self._pending:
+            logger.warning("Не отправлено уведомлений при остановке: %s", self._pending)
+
+    # ---------- отправка ----------
+
+    def _take(self) -> Tuple[Optional[Notification], Optional[float]]:
+        """Следующее сообщение чата, в который уже можно писать.
+
+        Резервирует слот чата; без готовых чатов возвращает (None, сколько
+        ждать до ближайшего) или (None, None), если ждать нечего.
+        """
+        if not self._ready:
+            return None, None
+        now = self._clock()
+        ready, _, chat_id = self._ready[0]
+        if ready > now:
+            return None, ready - now
+        heapq.heappop(self._ready)
+        pending = self._chats[chat_id]
+        item = pending.popleft()
+        if not pending:
+            del self._chats[chat_id]
+        self._pending -= 1
+        self._queued.discard((item.chat_id, item.key))
+        self._sending.add(chat_id)
+        self._chat_ready[chat_id] = now + self.per_chat_interval
+        self._forget_idle_chats(now)
+        return item, 0.0
+
+    def _release(self, chat_id: Any) -> None:
+        """Отправка в чат завершена: следующее его сообщение — в кучу готовности."""
+        self._sending.discard(chat_id)
+        if chat_id in self._chats:
+            self._schedule(chat_id)
+
+    def _forget_idle_chats(self, now: float) -> None:
+        if len(self._chat_ready) > 4096:
+            self._chat_ready = {
+                chat: t for chat, t in self._chat_ready.items() if t > now or chat in self._chats or chat in self._sending
+            }
+
+    async def _worker(self) -> None:
+        while True:
+            item, wait = self._take()
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._active += 1
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка в обработчике уведомления для чата %s", item.chat_id)
+            finally:
+                self._active -= 1
+                self._release(item.chat_id)
+
+    async def _deliver(self, item: Notification) -> None:
+        # Общий лимит Telegram: ожидание токена одинаково для всех чатов
+        delay = self.bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self._send(chat_id=item.chat_id, text=item.text, **item.kwargs)
+        except Exception as e:
+            if self._retry(item, e):
+                return
+            logger.warning("Не удалось отправить уведомление в чат %s: %s", item.chat_id, e)
+            await self._done(item, e)
+            return
+        await self._done(item, None)
+
+    def _retry(self, item: Notification, error: Exception) -> bool:
+        if item.attempt >= self.max_retries:
+            return False
+        wait = retry_after_of(error)
+        if wait is not None:
+            # Flood control: пауза для чата и общего ведра
+            self._chat_ready[item.chat_id] = self._clock() + wait
+            self.bucket.pause(wait)
+        elif isinstance(error, self.retryable):
+            self._chat_ready[item.chat_id] = self._clock() + 2 ** item.attempt
+        else:
+            return False
+        # Повтор — первым в очереди чата; в кучу чат вернет _release
+        self._push(item._replace(attempt=item.attempt + 1), first=True)
+        return True
+
+    @staticmethod
+    async def _done(item: Notification, error: Optional[BaseException]) -> None:
+        if item.on_done is None:
+            return
+        result = item.on_done(error)
+        if inspect.isawaitable(result):
+            await result
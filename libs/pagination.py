@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple, Tuple
+
+# Номер страницы дописывается к callback_data экрана: "1:at:Phone#3".
+# Суффикс пишется всегда (и "#0"), иначе тип "Rack#2" без него читался бы как страница 2.
+PAGE_SEPARATOR = "#"
+
+
+class Page(NamedTuple):
+    """Страница number (с 0) из count; элементы [start, stop) списка."""
+
+    number: int
+    count: int
+    start: int
+    stop: int
+    total: int
+
+
+def page_of(total: int, number: int, size: int) -> Page:
+    """Страница number списка из total элементов (номер приводится к допустимому)."""
+    size = max(1, size)
+    count = max(1, -(-total // size))
+    number = min(max(0, number), count - 1)
+    start = number * size
+    return Page(number, count, start, min(start + size, total), total)
+
+
+def with_page(base: str, number: int) -> str:
+    """callback_data экрана base на странице number (суффикс есть и у первой)."""
+    return f"{base}{PAGE_SEPARATOR}{max(0, number)}"
+
+
+def split_page(data: str) -> Tuple[str, int]:
+    """("1:at:Phone", 3) из "1:at:Phone#3"; без суффикса — страница 0.
+
+    Снимается только последний суффикс: "1:at:Rack#2#0" -> ("1:at:Rack#2", 0).
+    """
+    base, separator, number = data.rpartition(PAGE_SEPARATOR)
+    if separator and number.isdigit():
+        return base, int(number)
+    return data, 0
+
+
+def page_buttons(base: str, page: Page) -> List[Tuple[str, str]]:
+    """(текст, callback_data) кнопок навигации: в начало, назад, текущая, вперед, в конец.
+
+    Для единственной страницы — пустой список.
+    """
+    if page.count <= 1:
+        return []
+    buttons: List[Tuple[str, str]] = []
+    if page.number > 1:
+        buttons.append(("⏮ 1", with_page(base, 0)))
+    if page.number > 0:
+        buttons.append(("◀️", with_page(base, page.number - 1)))
+    # Текущая страница: нажатие просто обновляет экран
+    buttons.append((f"{page.number + 1}/{page.count}", with_page(base, page.number)))
+    if page.number < page.count - 1:
+        buttons.append(("▶️", with_page(base, page.number + 1)))
+    if page.number < page.count - 2:
+        buttons.append((f"{page.count} ⏭", with_page(base, page.count - 1)))
+    return buttons
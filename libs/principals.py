@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Any, Dict, FrozenSet, Iterable, NamedTuple, Optional
+
+# Статусы, при которых роль пользователя действует (см. utils.get_user_role)
+ACTIVE_STATUSES = ("active", "approved")
+
+
+class Principal(NamedTuple):
+    """Пользователь, выполняющий запрос, и его права."""
+
+    user_id: Any
+    user: Optional[Any] = None  # запись users; None — не зарегистрирован
+    status: Optional[str] = None
+    role: Optional[str] = None
+    is_admin: bool = False
+    group: Optional[Any] = None  # запись groups (None — группы нет или она удалена)
+
+    @property
+    def group_id(self) -> Optional[Any]:
+        return self.group.get("id") if self.group else None
+
+
+class PrincipalCache:
+    """Права пользователей по user_id: запись, статус, роль, признак администратора.
+
+    Подписывается на коллекции пользователей и групп (Collection.add_listener):
+    любое изменение записи пользователя (одобрение, блокировка, смена роли
+    или группы, удаление) сбрасывает его элемент, изменение групп — весь кэш.
+    admin_ids (config.json) хранится как frozenset; при замене кэш сбрасывается.
+    Незарегистрированные пользователи не кэшируются.
+    """
+
+    def __init__(self, users: Any, groups: Any, key: str = "user_id", admin_ids: Iterable[Any] = ()) -> None:
+        self._users = users
+        self._groups = groups
+        self.key = key
+        self._admin_ids: FrozenSet[Any] = frozenset(admin_ids)
+        self._cache: Dict[Any, Principal] = {}
+        # id(запись) -> user_id, под которым она закэширована (user_id может смениться)
+        self._docs: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def admin_ids(self) -> FrozenSet[Any]:
+        return self._admin_ids
+
+    @admin_ids.setter
+    def admin_ids(self, values: Iterable[Any]) -> None:
+        admin_ids = frozenset(values)
+        if admin_ids != self._admin_ids:
+            self._admin_ids = admin_ids
+            self.clear()
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._docs.clear()
+
+    # ---------- подписка на коллекции ----------
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        cached = self._docs.pop(id(record), None)
+        if cached is not None:
+            self._cache.pop(cached, None)
+        self._cache.pop(record.get(self.key), None)
+
+    def observe_group(self, record: Any, removed: bool = False) -> None:
+        if self._cache:
+            self.clear()
+
+    # ---------- чтение ----------
+
+    def get(self, user_id: Any) -> Principal:
+        principal = self._cache.get(user_id)
+        if principal is None:
+            principal = self._resolve(user_id)
+            if principal.user is not None:
+                self._cache[user_id] = principal
+                self._docs[id(principal.user)] = user_id
+        return principal
+
+    def _resolve(self, user_id: Any) -> Principal:
+        listed = user_id in self._admin_ids
+        user = self._users.get_by(self.key, user_id)
+        if user is None:
+            return Principal(user_id, is_admin=listed)
+        status = user.get("status")
+        role = user.get("role")
+        group_id = user.get("group_id")
+        return Principal(
+            user_id,
+            user,
+            status,
+            role,
+            listed or (role == "Admin" and status in ACTIVE_STATUSES),
+            self._groups.get_by("id", group_id) if group_id else None,
+        )
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import sys
+from collections.abc import Mapping, MutableMapping
+from enum import Enum
+from typing import Any, ClassVar, Dict, FrozenSet, Iterator, Optional, Tuple
+
+
+class _Missing:
+    """Значение незаполненного поля: ложно и не равно ничему, кроме себя."""
+
+    __slots__ = ()
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class DeviceStatus(str, Enum):
+    """Статус устройства. Сравнивается со строками: DeviceStatus.FREE == "free"."""
+
+    FREE = "free"
+    BOOKED = "booked"
+
+    # str()/format() дают само значение, как у исходных строк
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+
+_STATUSES = {status.value: status for status in DeviceStatus}
+
+
+def intern_status(value: Any) -> Any:
+    """Известные статусы — члены DeviceStatus, прочие строки интернируются."""
+    if isinstance(value, str):
+        return _STATUSES.get(value) or sys.intern(value)
+    return value
+
+
+def intern_str(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class Record(MutableMapping):
+    """Запись с __slots__ вместо dict.
+
+    Известные поля (FIELDS) лежат в слотах, незнакомые — в словаре _extra,
+    поэтому JSON проходит через запись без потерь. Снаружи запись ведет себя
+    как dict (get, [], pop, in, items, ==), так что код, работающий со
+    словарями, менять не нужно. Незаполненное поле хранит MISSING: ключа
+    «нет» (``"user_id" not in device``), а атрибут ложен.
+
+    Слоты _owner/_seq/_keys использует Collection (libs/repository.py):
+    при изменении поля запись сообщает коллекции, и та обновляет индексы.
+    """
+
+    __slots__ = ("_extra", "_owner", "_seq", "_keys")
+
+    FIELDS: ClassVar[Tuple[str, ...]] = ()
+    _FIELD_SET: ClassVar[FrozenSet[str]] = frozenset()
+    # Поля, значения которых приводятся при записи (интернирование и т.п.)
+    COERCE: ClassVar[Dict[str, Any]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, data: Any = (), **kwargs: Any) -> None:
+        for field in self.FIELDS:
+            setattr(self, field, MISSING)
+        self._extra: Optional[Dict[str, Any]] = None
+        self._owner = None
+        self._seq = 0
+        self._keys: tuple = ()
+        items = data.items() if isinstance(data, Mapping) else data
+        for key, value in items:
+            self._set(key, value)
+        for key, value in kwargs.items():
+            self._set(key, value)
+
+    # ---------- доступ к полям ----------
+
+    def _set(self, key: str, value: Any) -> None:
+        coerce = self.COERCE.get(key)
+        if coerce is not None:
+            value = coerce(value)
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def _changed(self) -> None:
+        if self._owner is not None:
+            self._owner._reindex(self)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is MISSING:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not MISSING  # type: ignore[arg-type]
+        return self._extra is not None and key in self._extra
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._set(key, value)
+        self._changed()
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._FIELD_SET:
+            if getattr(self, key) is MISSING:
+                raise KeyError(key)
+            setattr(self, key, MISSING)
+        else:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+        self._changed()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        # Одна переиндексация на весь набор изменений
+        for key, value in dict(*args, **kwargs).items():
+            self._set(key, value)
+        self._changed()
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.FIELDS:
+            if getattr(self, field) is not MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        count = sum(1 for field in self.FIELDS if getattr(self, field) is not MISSING)
+        return count + (len(self._extra) if self._extra else 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # Копия — отдельная запись, не привязанная к коллекции
+        return (type(self), (self.to_dict(),))
+
+
+class Device(Record):
+    __slots__ = ("id", "name", "sn", "type", "status", "group_id", "user_id", "booking_expiration")
+    FIELDS = __slots__
+    COERCE = {"type": intern_str, "status": intern_status}
+
+
+class User(Record):
+    __slots__ = (
+        "user_id",
+        "username",
+        "first_name",
+        "last_name",
+        "display_name",
+        "phone",
+        "role",
+        "status",
+        "group_id",
+    )
+    FIELDS = __slots__
+    COERCE = {"role": intern_str, "status": intern_str}
+
+
+class Group(Record):
+    __slots__ = ("id", "name")
+    FIELDS = __slots__
+
+
+class LogEntry(Record):
+    __slots__ = ("timestamp", "action")
+    FIELDS = __slots__
+
+
+def json_default(value: Any) -> Any:
+    """Хук default для json.dumps: записи сериализуются как обычные объекты."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Type
+
+Normalizer = Callable[[Any], Any]
+
+# Значение поля, которое нельзя положить в индекс (нехешируемое)
+_UNINDEXED = object()
+
+
+def casefold_key(value: Any) -> Any:
+    """Нормализация строковых ключей без учета регистра (SN и т.п.)."""
+    return value.casefold() if isinstance(value, str) else value
+
+
+def empty_to_none(value: Any) -> Any:
+    """Пустые значения (None, 0, "") попадают в один бакет None."""
+    return value or None
+
+
+class Changes(NamedTuple):
+    """Изменения коллекции с последнего drain_changes().
+
+    upserts — добавленные/измененные записи (в порядке списка), deletes —
+    ключи удаленных записей. full=True — изменился порядок или ключи
+    неоднозначны: коллекцию нужно записать целиком (upserts = весь список).
+    """
+
+    upserts: List[Any]
+    deletes: List[Any]
+    full: bool
+
+    def __bool__(self) -> bool:
+        return self.full or bool(self.upserts) or bool(self.deletes)
+
+
+class TrackedRecord(dict):
+    """Запись коллекции: обычный dict, который сообщает коллекции о своих изменениях.
+
+    Любое изменение полей переиндексирует запись, поэтому индексы остаются
+    актуальными и при правке записи «на месте» (``device["status"] = "free"``).
+    """
+
+    __slots__ = ("_owner", "_seq", "_keys")
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._owner: Optional[Collection] = None
+        self._seq = 0
+        self._keys: tuple = ()
+
+    def _changed(self) -> None:
+        if self._owner is not None:
+            self._owner._reindex(self)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other: Any) -> "TrackedRecord":
+        super().update(other)
+        self._changed()
+        return self
+
+    def pop(self, *args: Any) -> Any:
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self) -> Any:
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return super().__getitem__(key)
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def clear(self) -> None:
+        super().clear()
+        self._changed()
+
+    def __reduce__(self):
+        # Копии (copy/deepcopy/pickle) — обычные dict, не привязанные к коллекции
+        return (dict, (dict(self),))
+
+
+class Collection(list):
+    """Список записей с хеш-индексами по полям.
+
+    Ведет себя как обычный list (его по-прежнему можно перебирать, сохранять
+    и сравнивать со списком dict'ов), но каждая добавленная запись
+    оборачивается в record_type и индексируется. Индексы обновляются при
+    любой мутации списка или записи, поэтому поиск по индексу — O(1)
+    вместо линейного прохода.
+
+    Индексы не уникальны: get_by() возвращает первую запись в порядке списка
+    (как ``next(...)`` по списку), find_by() — все записи в порядке списка.
+
+    record_type — класс записей: TrackedRecord или типизированная запись из
+    libs/records.py (любой класс с тем же протоколом _owner/_seq/_keys).
+
+    key — поле-ключ записи (должно быть среди indexes). Коллекция запоминает
+    измененные и удаленные записи, drain_changes() отдает их для записи
+    только изменений (O(изменения) вместо O(коллекции)).
+    """
+
+    def __init__(
+        self,
+        indexes: Sequence[str],
+        normalizers: Optional[Dict[str, Normalizer]] = None,
+        records: Iterable[Any] = (),
+        record_type: Type[Any] = TrackedRecord,
+        key: Optional[str] = None,
+    ) -> None:
+        super().__init__()
+        self._record_type = record_type
+        self._fields = tuple(indexes)
+        normalizers = normalizers or {}
+        self._normalizers = tuple(normalizers.get(field) for field in self._fields)
+        self._positions = {field: i for i, field in enumerate(self._fields)}
+        # index -> key -> {id(record): record}
+        self._buckets: List[Dict[Any, Dict[int, Any]]] = [{} for _ in self._fields]
+        self._counter = count()
+        self.key = key
+        self._key_position = self._positions.get(key) if key is not None else None
+        # Изменения с последнего drain_changes()
+        self._touched: Dict[int, Any] = {}
+        self._deleted: Dict[Any, None] = {}
+        self._full = False
+        # Подписчики: listener(record, removed) на каждое изменение записи
+        self._listeners: List[Callable[[Any, bool], None]] = []
+        self.extend(records)
+
+    def add_listener(self, listener: Callable[[Any, bool], None]) -> None:
+        """Подписка на изменения: вызывается после добавления/изменения записи
+        (removed=False) и после ее удаления из коллекции (removed=True)."""
+        self._listeners.append(listener)
+
+    def _notify(self, record: Any, removed: bool) -> None:
+        for listener in self._listeners:
+            listener(record, removed)
+
+    # ---------- индексы ----------
+
+    def _key(self, position: int, value: Any) -> Any:
+        normalize = self._normalizers[position]
+        if normalize is not None:
+            value = normalize(value)
+        try:
+            hash(value)
+        except TypeError:
+            return _UNINDEXED
+        return value
+
+    def _record_keys(self, record: Any) -> tuple:
+        return tuple(self._key(i, record.get(field)) for i, field in enumerate(self._fields))
+
+    def _index(self, record: Any) -> None:
+        record._keys = self._record_keys(record)
+        for bucket_map, key in zip(self._buckets, record._keys):
+            if key is not _UNINDEXED:
+                bucket_map.setdefault(key, {})[id(record)] = record
+
+    def _unindex(self, record: Any) -> None:
+        for bucket_map, key in zip(self._buckets, record._keys):
+            if key is _UNINDEXED:
+                continue
+            bucket = bucket_map.get(key)
+            if bucket is None:
+                continue
+            bucket.pop(id(record), None)
+            if not bucket:
+                del bucket_map[key]
+        record._keys = ()
+
+    def _reindex(self, record: Any) -> None:
+        self._touched[id(record)] = record
+        keys = self._record_keys(record)
+        if keys != record._keys:
+            if self._key_position is not None and keys[self._key_position] != record._keys[self._key_position]:
+                # Сменился ключ: запись под старым ключом не найти — пишем целиком
+                self._full = True
+            self._unindex(record)
+            self._index(record)
+        if self._listeners:
+            self._notify(record, False)
+
+    def _adopt(self, record: Any) -> Any:
+        if type(record) is not self._record_type or record._owner is not None:
+            record = self._record_type(record)
+        record._owner = self
+        record._seq = next(self._counter)
+        self._index(record)
+        self._touched[id(record)] = record
+        if self._listeners:
+            self._notify(record, False)
+        return record
+
+    def _release(self, record: Any) -> None:
+        self._touched.pop(id(record), None)
+        if self.key is not None:
+            self._deleted[record.get(self.key)] = None
+        self._unindex(record)
+        record._owner = None
+        if self._listeners:
+            self._notify(record, True)
+
+    def _renumber(self) -> None:
+        self._full = True
+        for record in self:
+            record._seq = next(self._counter)
+
+    # ---------- учет изменений ----------
+
+    def drain_changes(self) -> Changes:
+        """Изменения с прошлого вызова; счетчики изменений сбрасываются."""
+        touched, deleted, full = self._touched, self._deleted, self._full
+        self.mark_clean()
+        if not full and self.key is not None:
+            full = None in deleted
+            for record in touched.values():
+                value = record.get(self.key)
+                # Запись без ключа или с неуникальным ключом не адресовать;
+                # удаленный и заново добавленный ключ меняет позицию записи
+                if value is None or self.count_by(self.key, value) != 1 or value in deleted:
+                    full = True
+                    break
+        if full or (self.key is None and (touched or deleted)):
+            return Changes(list(self), [], True)
+        upserts = sorted(touched.values(), key=lambda r: r._seq)
+        return Changes(upserts, list(deleted), False)
+
+    def mark_changed(self) -> None:
+        """Следующий drain_changes() вернет коллекцию целиком."""
+        self._full = True
+
+    def mark_clean(self) -> None:
+        """Текущее состояние совпадает с сохраненным (после загрузки/полной записи)."""
+        self._touched = {}
+        self._deleted = {}
+        self._full = False
+
+    def _bucket(self, field: str, value: Any) -> Dict[int, Any]:
+        position = self._positions[field]
+        key = self._key(position, value)
+        if key is _UNINDEXED:
+            return {}
+        return self._buckets[position].get(key, {})
+
+    def get_by(self, field: str, value: Any) -> Optional[Any]:
+        """Первая запись (в порядке списка), у которой поле field равно value."""
+        bucket = self._bucket(field, value)
+        if not bucket:
+            return None
+        if len(bucket) == 1:
+            return next(iter(bucket.values()))
+        return min(bucket.values(), key=lambda r: r._seq)
+
+    def find_by(self, field: str, *values: Any) -> List[Any]:
+        """Все записи (в порядке списка), у которых поле field равно одному из values."""
+        found: Dict[int, Any] = {}
+        for value in values:
+            found.update(self._bucket(field, value))
+        return sorted(found.values(), key=lambda r: r._seq)
+
+    def count_by(self, field: str, value: Any) -> int:
+        return len(self._bucket(field, value))
+
+    # ---------- мутации списка ----------
+
+    def append(self, record: Any) -> None:
+        super().append(self._adopt(record))
+
+    def extend(self, records: Iterable[Any]) -> None:
+        super().extend([self._adopt(record) for record in records])
+
+    def __iadd__(self, records: Iterable[Any]) -> "Collection":
+        self.extend(records)
+        return self
+
+    def __imul__(self, n: int) -> "Collection":
+        raise TypeError("Collection не поддерживает *=")
+
+    def insert(self, index: int, record: Any) -> None:
+        super().insert(index, self._adopt(record))
+        self._renumber()
+
+    def remove(self, record: Any) -> None:
+        # Сначала ищем тот же объект: сравнение записей по значению дороже
+        for position, item in enumerate(self):
+            if item is record:
+                del self[position]
+                return
+        del self[self.index(record)]
+
+    def pop(self, index: int = -1) -> Any:
+        record = super().pop(index)
+        self._release(record)
+        return record
+
+    def clear(self) -> None:
+        for record in self:
+            self._release(record)
+        super().clear()
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        if isinstance(index, slice):
+            for record in super().__getitem__(index):
+                self._release(record)
+            super().__setitem__(index, [self._adopt(record) for record in value])
+            self._renumber()
+            return
+        self._release(super().__getitem__(index))
+        super().__setitem__(index, self._adopt(value))
+        self._renumber()
+
+    def __delitem__(self, index: Any) -> None:
+        removed = super().__getitem__(index)
+        for record in removed if isinstance(index, slice) else [removed]:
+            self._release(record)
+        super().__delitem__(index)
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        super().sort(*args, **kwargs)
+        self._renumber()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._renumber()
+
+    def __reduce__(self):
+        return (list, (list(self),))
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import itertools
+from typing import Any, Iterable, Iterator, List, Optional
+
+_tokens = itertools.count(1)
+
+
+class ResultCursor:
+    """Постраничный курсор по ленивой последовательности результатов.
+
+    Элементы вычисляются только по мере запроса страниц и запоминаются,
+    поэтому повторный показ уже просмотренной страницы ничего не
+    пересчитывает. token отличает курсор от предыдущих (кнопки старых
+    сообщений с другим token считаются устаревшими).
+    """
+
+    def __init__(self, items: Iterable[Any], page_size: int = 10) -> None:
+        self.page_size = max(1, int(page_size))
+        self.token = next(_tokens)
+        self._source: Optional[Iterator[Any]] = iter(items)
+        self._buffer: List[Any] = []
+
+    def _fill(self, count: int) -> None:
+        """Добирает из источника, пока в буфере меньше count элементов."""
+        source = self._source
+        if source is None:
+            return
+        buffer = self._buffer
+        while len(buffer) < count:
+            try:
+                buffer.append(next(source))
+            except StopIteration:
+                self._source = None
+                return
+
+    @property
+    def exhausted(self) -> bool:
+        return self._source is None
+
+    @property
+    def loaded(self) -> int:
+        """Сколько элементов уже вычислено."""
+        return len(self._buffer)
+
+    def page(self, number: int) -> List[Any]:
+        """Элементы страницы number (с 0); пустой список — страницы нет."""
+        if number < 0:
+            return []
+        start = number * self.page_size
+        self._fill(start + self.page_size)
+        return self._buffer[start:start + self.page_size]
+
+    def has_page(self, number: int) -> bool:
+        if number < 0:
+            return False
+        self._fill(number * self.page_size + 1)
+        return len(self._buffer) > number * self.page_size
+
+    def total(self) -> Optional[int]:
+        """Общее число элементов, если источник уже исчерпан (иначе None)."""
+        return len(self._buffer) if self._source is None else None
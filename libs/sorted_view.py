@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+
+class _Top:
+    """Больше любого значения: верхняя граница диапазона ключей с префиксом."""
+
+    __slots__ = ()
+
+    def __lt__(self, other: Any) -> bool:
+        return False
+
+    def __gt__(self, other: Any) -> bool:
+        return True
+
+
+_TOP = _Top()
+
+
+class SortedView:
+    """Записи коллекции, упорядоченные по key(record) (кортеж).
+
+    Список (ключ, _seq, id) поддерживается отсортированным по подписке на
+    коллекцию (Collection.add_listener), поэтому страница экрана — это срез
+    за O(log n + размер страницы), без сортировки всех записей на каждое
+    нажатие. Записи с равным ключом идут в порядке коллекции.
+    """
+
+    def __init__(self, key: Callable[[Any], Tuple[Any, ...]]) -> None:
+        self.key = key
+        self._entries: List[Tuple[Tuple[Any, ...], int, int]] = []
+        # id(record) -> (запись, ее элемент в _entries)
+        self._docs: Dict[int, Tuple[Any, Tuple[Tuple[Any, ...], int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- подписка на коллекцию ----------
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        doc = id(record)
+        known = self._docs.get(doc)
+        entry = None if removed else (self.key(record), record._seq, doc)
+        if known is not None:
+            if entry is not None and known[1][0] == entry[0] and known[0] is record:
+                return
+            position = bisect_left(self._entries, known[1])
+            if position < len(self._entries) and self._entries[position] == known[1]:
+                del self._entries[position]
+        if entry is None:
+            self._docs.pop(doc, None)
+            return
+        self._docs[doc] = (record, entry)
+        insort(self._entries, entry)
+
+    def rebuild(self, records: Iterable[Any]) -> None:
+        self._docs = {id(record): (record, (self.key(record), record._seq, id(record))) for record in records}
+        self._entries = sorted(entry for _, entry in self._docs.values())
+
+    # ---------- чтение ----------
+
+    def bounds(self, *prefix: Any) -> Tuple[int, int]:
+        """Позиции [start, stop) записей, ключ которых начинается с prefix."""
+        if not prefix:
+            return 0, len(self._entries)
+        start = bisect_left(self._entries, (prefix,))
+        stop = bisect_right(self._entries, (prefix + (_TOP,),))
+        return start, stop
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        docs = self._docs
+        return [docs[doc][0] for _, _, doc in self._entries[start:stop]]
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from libs.records import json_default
+
+# Ключевое поле для каждой коллекции-списка
+COLLECTION_KEYS = {
+    "devices": "id",
+    "users": "user_id",
+    "groups": "id",
+}
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=json_default)
+
+
+class SqliteStore:
+    """Хранилище коллекций бота в SQLite (режим WAL).
+
+    Каждая запись коллекции хранится отдельной строкой (JSON в колонке data),
+    поэтому сохранение списка после бронирования превращается в обновление
+    одной строки: сравниваем сериализацию записи с последней сохраненной и
+    пишем только изменившиеся записи. Порядок списка — порядок вставки (rowid).
+    Логи хранятся построчно и дописываются только новыми записями.
+    """
+
+    def __init__(self, path: str, synchronous: str = "FULL") -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        for name in COLLECTION_KEYS:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, data TEXT NOT NULL)'
+            )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS logs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, sn TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS logs_sn ON logs (sn, seq)")
+        # Последние сохраненные сериализации: collection -> key -> json
+        self._saved: Dict[str, Dict[str, str]] = {name: {} for name in COLLECTION_KEYS}
+        # Количество сохраненных записей лога по SN
+        self._saved_log_counts: Dict[str, int] = {}
+
+    # ---------- служебное ----------
+
+    @staticmethod
+    def _record_key(collection: str, record: Dict[str, Any], position: int) -> str:
+        value = record.get(COLLECTION_KEYS[collection]) if isinstance(record, Mapping) else None
+        if value is None:
+            # Записи без ключа адресуем по позиции, чтобы не потерять их
+            return f"#pos:{position}"
+        return json.dumps(value, ensure_ascii=False)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            for name in list(COLLECTION_KEYS) + ["logs"]:
+                row = self._conn.execute(f'SELECT 1 FROM "{name}" LIMIT 1').fetchone()
+                if row:
+                    return False
+            return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------- загрузка ----------
+
+    def load(self, collection: str, default: Any) -> Any:
+        with self._lock:
+            if collection == "logs":
+                return self._load_logs()
+            if collection not in COLLECTION_KEYS:
+                return default
+            rows = self._conn.execute(f'SELECT key, data FROM "{collection}" ORDER BY rowid').fetchall()
+            saved = self._saved[collection]
+            saved.clear()
+            result: List[Any] = []
+            for key, data in rows:
+                try:
+                    record = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                saved[key] = data
+                result.append(record)
+            return result
+
+    def _load_logs(self) -> Dict[str, List[Dict[str, Any]]]:
+        logs: Dict[str, List[Dict[str, Any]]] = {}
+        for sn, data in self._conn.execute("SELECT sn, data FROM logs ORDER BY seq"):
+            try:
+                entry = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            logs.setdefault(sn, []).append(entry)
+        self._saved_log_counts = {sn: len(entries) for sn, entries in logs.items()}
+        return logs
+
+    def log_sns(self) -> List[str]:
+        with self._lock:
+            return [sn for (sn,) in self._conn.execute("SELECT DISTINCT sn FROM logs")]
+
+    def load_sn_logs(self, sn: str) -> List[Dict[str, Any]]:
+        """Логи одного SN (по индексу logs_sn), без чтения всей таблицы."""
+        with self._lock:
+            entries: List[Dict[str, Any]] = []
+            for (data,) in self._conn.execute("SELECT data FROM logs WHERE sn = ? ORDER BY seq", (sn,)):
+                try:
+                    entries.append(json.loads(data))
+                except json.JSONDecodeError:
+                    continue
+            self._saved_log_counts[sn] = len(entries)
+            return entries
+
+    # ---------- сохранение ----------
+    # Сериализация (serialize_*) не трогает базу и может выполняться в другом
+    # потоке, чем запись (write_*): так снимок данных фиксируется в момент вызова.
+
+    def serialize(self, collection: str, data: Any) -> Any:
+        if collection == "logs":
+            return {sn: [_dumps(e) for e in entries] for sn, entries in data.items()}
+        if collection not in COLLECTION_KEYS:
+            raise ValueError(f"Неизвестная коллекция: {collection}")
+        return [(self._record_key(collection, record, pos), _dumps(record)) for pos, record in enumerate(data)]
+
+    @staticmethod
+    def serialize_log_records(records: Iterable[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, str]]:
+        return [(sn, _dumps(entry)) for sn, entry in records]
+
+    def serialize_changes(self, collection: str, changes: Any) -> tuple:
+        """Изменения коллекции (libs/repository.Changes) для write_tx()."""
+        if changes.full:
+            return ("all", self.serialize(collection, changes.upserts))
+        upserts = self.serialize(collection, changes.upserts)
+        deletes = [json.dumps(key, ensure_ascii=False) for key in changes.deletes]
+        return ("delta", upserts, deletes)
+
+    def save(self, collection: str, data: Any) -> None:
+        self.write(collection, self.serialize(collection, data))
+
+    def write(self, collection: str, rows: Any) -> None:
+        if collection == "logs":
+            self.write_tx(logs=rows)
+        else:
+            self.write_tx({collection: ("all", rows)})
+
+    def write_tx(
+        self,
+        collections: Optional[Dict[str, tuple]] = None,
+        log_rows: List[Tuple[str, str]] = (),
+        logs: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """Одна транзакция SQLite: изменения коллекций, новые строки лога и
+        (logs) полная история перечисленных SN.
+
+        collections — collection -> ("all", rows) или ("delta", upserts, deletes).
+        """
+        with self._lock:
+            statements: List[Tuple[str, List[tuple]]] = []
+            after_commit: List[Callable[[], None]] = []
+            for collection, change in (collections or {}).items():
+                self._plan_collection(collection, change, statements, after_commit)
+            if logs is not None:
+                self._plan_logs(logs, statements, after_commit)
+            if log_rows:
+                statements.append(("INSERT INTO logs (sn, data) VALUES (?, ?)", list(log_rows)))
+                after_commit.append(lambda: self._count_log_rows(log_rows))
+            if statements:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for sql, params in statements:
+                        self._conn.executemany(sql, params)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            for apply in after_commit:
+                apply()
+
+    def _plan_collection(
+        self,
+        collection: str,
+        change: tuple,
+        statements: List[Tuple[str, List[tuple]]],
+        after_commit: List[Callable[[], None]],
+    ) -> None:
+        if collection not in COLLECTION_KEYS:
+            raise ValueError(f"Неизвестная коллекция: {collection}")
+        saved = self._saved[collection]
+        upsert_sql = (
+            f'INSERT INTO "{collection}" (key, data) VALUES (?, ?) '
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data"
+        )
+        delete_sql = f'DELETE FROM "{collection}" WHERE key = ?'
+        if change[0] == "all":
+            current = dict(change[1])
+            removed = [key for key in saved if key not in current]
+        else:
+            _, upserts, removed = change
+            current = dict(upserts)
+            removed = [key for key in removed if key not in current]
+        changed = [(key, data) for key, data in current.items() if saved.get(key) != data]
+        if removed:
+            statements.append((delete_sql, [(key,) for key in removed]))
+        if changed:
+            statements.append((upsert_sql, changed))
+
+        def apply() -> None:
+            if change[0] == "all":
+                self._saved[collection] = current
+                return
+            for key in removed:
+                saved.pop(key, None)
+            saved.update(current)
+
+        after_commit.append(apply)
+
+    def _plan_logs(
+        self,
+        logs: Dict[str, List[str]],
+        statements: List[Tuple[str, List[tuple]]],
+        after_commit: List[Callable[[], None]],
+    ) -> None:
+        """Логи только дописываются: вставляем хвост, которого еще нет в базе.
+
+        Если список SN стал короче сохраненного (очистка/перезапись), строки этого
+        SN переписываются целиком. SN, которых нет в logs, не трогаются: логи
+        загружаются лениво, и в снимок попадают только загруженные SN
+        (удаленный SN приходит пустым списком).
+        """
+        inserts: List[tuple] = []
+        rewrite: List[str] = []
+        for sn, entries in logs.items():
+            saved_count = self._saved_log_counts.get(sn, 0)
+            if len(entries) < saved_count:
+                rewrite.append(sn)
+                inserts.extend((sn, e) for e in entries)
+            elif len(entries) > saved_count:
+                inserts.extend((sn, e) for e in entries[saved_count:])
+        if rewrite:
+            statements.append(("DELETE FROM logs WHERE sn = ?", [(sn,) for sn in rewrite]))
+        if inserts:
+            statements.append(("INSERT INTO logs (sn, data) VALUES (?, ?)", inserts))
+
+        def apply() -> None:
+            for sn, entries in logs.items():
+                self._saved_log_counts[sn] = len(entries)
+
+        after_commit.append(apply)
+
+    def _count_log_rows(self, rows: Iterable[Tuple[str, str]]) -> None:
+        for sn, _ in rows:
+            self._saved_log_counts[sn] = self._saved_log_counts.get(sn, 0) + 1
+
+    def append_logs(self, records: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Дописывает записи лога одной транзакцией (по строке на запись)."""
+        self.write_log_rows(self.serialize_log_records(records))
+
+    def write_log_rows(self, rows: List[Tuple[str, str]]) -> None:
+        self.write_tx(log_rows=rows)
+
+    def count_rows(self, collection: str) -> int:
+        with self._lock:
+            row: Optional[tuple] = self._conn.execute(f'SELECT COUNT(*) FROM "{collection}"').fetchone()
+            return int(row[0]) if row else 0
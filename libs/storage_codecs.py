@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+from libs.records import json_default
+
+try:  # необязательные ускорители
+    import orjson
+except ImportError:  # pragma: no cover - зависит от окружения
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgpack = None
+
+
+class JsonCodec:
+    """JSON через стандартный модуль: pretty (indent=4, исходный формат) или компактный."""
+
+    binary = False
+
+    def __init__(self, pretty: bool = False) -> None:
+        self.pretty = pretty
+        self.name = "json-pretty" if pretty else "json"
+
+    def dumps(self, data: Any) -> bytes:
+        if self.pretty:
+            text = json.dumps(data, ensure_ascii=False, indent=4, default=json_default)
+        else:
+            text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=json_default)
+        return text.encode("utf-8")
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw.decode("utf-8-sig"))
+
+
+class OrjsonCodec:
+    """Компактный JSON через orjson: тот же формат файла, но в разы быстрее."""
+
+    name = "orjson"
+    binary = False
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=json_default)
+
+    def loads(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgpackCodec:
+    """Бинарный msgpack: самый компактный вариант, файл уже не читается глазами."""
+
+    name = "msgpack"
+    binary = True
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True, default=json_default)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+CODECS: Dict[str, Any] = {
+    "json-pretty": JsonCodec(pretty=True),
+    "json": JsonCodec(),
+}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+
+def available() -> List[str]:
+    return list(CODECS)
+
+
+def get_codec(name: Optional[str]) -> Any:
+    """Кодек по имени из config (storage_format).
+
+    Если нужный пакет не установлен, используется компактный JSON —
+    файлы в этом случае остаются читаемыми любым кодеком.
+    """
+    name = (name or "json").lower()
+    codec = CODECS.get(name)
+    if codec is None:
+        if name in ("orjson", "msgpack"):
+            return CODECS["json"]
+        raise ValueError(f"Неизвестный формат хранения: {name}")
+    return codec
+
+
+def dumps_line(data: Any) -> bytes:
+    """Компактный JSON в одну строку (для JSON Lines журналов)."""
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+# Первые байты JSON-документа (после BOM/пробелов): объект, массив, строка,
+# число, true/false/null. Все они вне диапазонов msgpack-маркеров map/array.
+_JSON_START = frozenset(b'{["-0123456789tfn')
+
+
+def detect(raw: bytes) -> str:
+    """Определяет формат сохраненного файла по первому значимому байту."""
+    data = raw[3:] if raw.startswith(b"\xef\xbb\xbf") else raw
+    data = data.lstrip()
+    if not data or data[0] in _JSON_START:
+        return "json"
+    return "msgpack"
+
+
+def loads(raw: bytes) -> Any:
+    """Читает файл в любом поддерживаемом формате (pretty/compact JSON, msgpack)."""
+    if detect(raw) == "msgpack":
+        if msgpack is None:
+            raise ValueError("Файл сохранен в msgpack, но пакет msgpack не установлен")
+        return CODECS["msgpack"].loads(raw)
+    if orjson is not None:
+        data = raw[3:] if raw.startswith(b"\xef\xbb\xbf") else raw
+        return orjson.loads(data)
+    return CODECS["json"].loads(raw)
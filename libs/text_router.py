@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Pattern, Tuple, Union
+
+Handler = Callable[[Any, Any], Awaitable[Any]]
+
+
+class TextRouter:
+    """Выбор обработчика текстового сообщения (кнопки reply-клавиатуры).
+
+    Надписи кнопок ищутся в словаре за одно обращение, затем — в изменяемых
+    наборах (members: типы устройств, которые меняются без перезапуска);
+    короткий список настоящих шаблонов (re.search, как filters.Regex)
+    проверяется по порядку, только если надпись не нашлась. При совпадении надписи у двух
+    обработчиков остается зарегистрированный первым — как при проверке
+    MessageHandler по очереди.
+    """
+
+    def __init__(self) -> None:
+        self._exact: Dict[str, Handler] = {}
+        self._members: List[Tuple[Callable[[str], bool], Handler]] = []
+        self._patterns: List[Tuple[Pattern[str], Handler]] = []
+
+    def __len__(self) -> int:
+        return len(self._exact) + len(self._members) + len(self._patterns)
+
+    def exact(self, *labels: str, handler: Handler) -> None:
+        """Обработчик для сообщений, текст которых в точности равен одной из labels."""
+        for label in labels:
+            self._exact.setdefault(label, handler)
+
+    def members(self, contains: Callable[[str], bool], handler: Handler) -> None:
+        """Обработчик для текстов, входящих в изменяемый набор (contains(text) — O(1)).
+
+        Набор не копируется: contains проверяется на каждом сообщении, поэтому
+        новые значения начинают распознаваться сразу.
+        """
+        self._members.append((contains, handler))
+
+    def pattern(self, pattern: Union[str, Pattern[str]], handler: Handler) -> None:
+        """Обработчик для сообщений, в которых найден pattern (re.search)."""
+        self._patterns.append((re.compile(pattern) if isinstance(pattern, str) else pattern, handler))
+
+    def resolve(self, text: Optional[str]) -> Optional[Tuple[Handler, Optional[re.Match]]]:
+        """(обработчик, совпадение шаблона или None); None — сообщение не для кнопок."""
+        if not text:
+            return None
+        handler = self._exact.get(text)
+        if handler is not None:
+            return handler, None
+        for contains, handler in self._members:
+            if contains(text):
+                return handler, None
+        for pattern, handler in self._patterns:
+            match = pattern.search(text)
+            if match:
+                return handler, match
+        return None
+
+    def routes(self) -> Iterator[Tuple[str, Any, Handler]]:
+        """("exact", надпись, обработчик), ("members", contains, обработчик) и
+        ("pattern", шаблон, обработчик) в порядке проверки."""
+        for label, handler in self._exact.items():
+            yield "exact", label, handler
+        for contains, handler in self._members:
+            yield "members", contains, handler
+        for pattern, handler in self._patterns:
+            yield "pattern", pattern, handler
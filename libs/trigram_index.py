@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# Длины n-грамм: запросы из 2 символов ищутся по биграммам, длиннее — по триграммам
+GRAM_SIZES = (2, 3)
+# Разделитель полей в общем тексте записи (не встречается в запросах)
+_SEPARATOR = "\x00"
+_by_seq = attrgetter("_seq")
+
+
+def normalize(value: Any) -> str:
+    """Текст поля для поиска: без учета регистра (как .upper() в поиске)."""
+    if value is None:
+        return ""
+    return (value if isinstance(value, str) else str(value)).upper()
+
+
+def grams(text: str, size: int) -> Set[str]:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class TrigramIndex:
+    """Инвертированный n-граммный индекс для поиска подстроки по полям записей.
+
+    Для каждой биграммы и триграммы текста полей хранится множество записей,
+    в которых она встречается (posting list). Запрос разбивается на
+    n-граммы, их множества пересекаются начиная с самого короткого, и только
+    оставшиеся кандидаты проверяются на вхождение подстроки. Результат — в
+    порядке коллекции (по record._seq), как при проходе по списку.
+
+    Подписывается на коллекцию (Collection.add_listener): при изменении
+    записи пересчитываются только n-граммы, которые появились или исчезли.
+    """
+
+    def __init__(self, fields: Sequence[str]) -> None:
+        self.fields = tuple(fields)
+        # n-грамма -> id записей
+        self._postings: Dict[str, Set[int]] = {}
+        # id(record) -> (record, тексты полей, тексты через разделитель)
+        self._docs: Dict[int, Tuple[Any, Tuple[str, ...], str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ---------- подписка на коллекцию ----------
+
+    def _texts(self, record: Any) -> Tuple[str, ...]:
+        return tuple(normalize(record.get(field)) for field in self.fields)
+
+    @staticmethod
+    def _grams_of(texts: Iterable[str]) -> Set[str]:
+        result: Set[str] = set()
+        for text in texts:
+            for size in GRAM_SIZES:
+                result |= grams(text, size)
+        return result
+
+    def observe(self, record: Any, removed: bool = False) -> None:
+        doc = id(record)
+        known = self._docs.get(doc)
+        texts = None if removed else self._texts(record)
+        if known is not None and known[1] == texts and known[0] is record:
+            return
+        old = self._grams_of(known[1]) if known is not None else set()
+        new = self._grams_of(texts) if texts is not None else set()
+        postings = self._postings
+        for gram in old - new:
+            posting = postings.get(gram)
+            if posting is not None:
+                posting.discard(doc)
+                if not posting:
+                    del postings[gram]
+        for gram in new - old if old else new:
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = {doc}
+            else:
+                posting.add(doc)
+        if texts is None:
+            self._docs.pop(doc, None)
+        else:
+            self._docs[doc] = (record, texts, _SEPARATOR.join(texts))
+
+    def rebuild(self, records: Iterable[Any]) -> None:
+        self._postings = {}
+        self._docs = {}
+        for record in records:
+            self.observe(record)
+
+    # ---------- поиск ----------
+
+    def candidates(self, query: str) -> Optional[Set[int]]:
+        """id записей, содержащих все n-граммы запроса (None — запрос короче биграммы)."""
+        size = 3 if len(query) >= 3 else 2
+        if len(query) < size:
+            return None
+        postings = []
+        for gram in grams(query, size):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, fields: Optional[Sequence[str]] = None) -> List[Any]:
+        """Записи, у которых хотя бы одно из полей fields (по умолчанию все) содержит query."""
+        query = normalize(query)
+        if not query or _SEPARATOR in query:
+            return []
+        docs = self.candidates(query)
+        entries = self._docs.values() if docs is None else [self._docs[doc] for doc in docs]
+        if fields is None:
+            found = [entry[0] for entry in entries if query in entry[2]]
+        else:
+            positions = [self.fields.index(field) for field in fields]
+            found = [entry[0] for entry in entries if any(query in entry[1][i] for i in positions)]
+        found.sort(key=_by_seq)
+        return found
+
+    def ranked(
+        self,
+        query: str,
+        exact: Sequence[str] = (),
+        prefix: Sequence[str] = (),
+    ) -> Iterator[Any]:
+        """Записи с query по релевантности: сначала точное совпадение поля из
+        exact, затем начало поля из prefix (в порядке перечисления), затем
+        вхождение подстроки в любое поле. Внутри уровня — порядок коллекции.
+
+        Генератор: кандидаты из индекса раскладываются по уровням при первом
+        обращении, а записи отдаются по одной, поэтому первые страницы
+        результата не требуют сортировки всех совпадений.
+        """
+        query = normalize(query)
+        if not query or _SEPARATOR in query:
+            return
+        docs = self.candidates(query)
+        entries = list(self._docs.values()) if docs is None else [self._docs[doc] for doc in docs]
+        exact_positions = [self.fields.index(field) for field in exact]
+        prefix_positions = [self.fields.index(field) for field in prefix]
+        tiers: List[List[Any]] = [[] for _ in range(len(exact_positions) + len(prefix_positions) + 1)]
+        substring_tier = len(tiers) - 1
+        for record, texts, joined in entries:
+            if query not in joined:
+                continue
+            tier = substring_tier
+            for i, position in enumerate(exact_positions):
+                if texts[position] == query:
+                    tier = i
+                    break
+            else:
+                for i, position in enumerate(prefix_positions, len(exact_positions)):
+                    if texts[position].startswith(query):
+                        tier = i
+                        break
+            tiers[tier].append(record)
+        for records in tiers:
+            records.sort(key=_by_seq)
+            yield from records
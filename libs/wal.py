@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+from libs import storage_codecs
+
+logger = logging.getLogger(__name__)
+
+Op = Dict[str, Any]
+
+
+class WriteAheadLog:
+    """Журнал изменений (WAL) всех коллекций: одна строка — одна транзакция.
+
+    Строка ``{"lsn": N, "ops": [...]}``, операции:
+
+    - ``{"c": "devices", "put": {...}}`` — добавить/заменить запись по ключу;
+    - ``{"c": "devices", "del": key}`` — удалить запись по ключу;
+    - ``{"c": "devices", "all": [...]}`` — коллекция целиком;
+    - ``{"c": "logs", "sn": ..., "entry": {...}}`` — дописать запись в историю SN.
+
+    Транзакция пишется одной строкой и одним fsync: после сбоя она либо
+    применяется целиком, либо (оборванная последняя строка) отбрасывается.
+    Снапшоты коллекций делаются при checkpoint, после чего журнал обнуляется;
+    lsn монотонен и между checkpoint'ами не сбрасывается.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._fh = None
+        # Последний выданный lsn
+        self.lsn = 0
+        # Транзакции в журнале с последнего checkpoint
+        self.pending = 0
+
+    # ---------- восстановление ----------
+
+    def replay(self) -> List[Tuple[int, List[Op]]]:
+        """Читает журнал; оборванный хвост после сбоя отрезается."""
+        with self._lock:
+            self.close()
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            transactions: List[Tuple[int, List[Op]]] = []
+            good = 0
+            position = 0
+            for line in raw.splitlines(keepends=True):
+                position += len(line)
+                if not line.endswith(b"\n"):
+                    break
+                good = position
+                try:
+                    record = json.loads(line)
+                    lsn, ops = int(record["lsn"]), record["ops"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Пропущена поврежденная транзакция WAL: %s", self.path)
+                    continue
+                if isinstance(ops, list):
+                    transactions.append((lsn, ops))
+                    self.lsn = max(self.lsn, lsn)
+            if good < len(raw):
+                logger.warning("WAL оборван, отрезано байт: %s", len(raw) - good)
+                with open(self.path, "r+b") as f:
+                    f.truncate(good)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.pending = len(transactions)
+            return transactions
+
+    # ---------- запись ----------
+    # encode() выполняется в потоке вызывающего, write() — в потоке записи.
+
+    def encode(self, ops: List[Op]) -> Tuple[int, bytes]:
+        with self._lock:
+            self.lsn += 1
+            self.pending += 1
+            return self.lsn, storage_codecs.dumps_line({"lsn": self.lsn, "ops": ops}) + b"\n"
+
+    def write(self, payload: bytes) -> None:
+        if not payload:
+            return
+        with self._lock:
+            if self._fh is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._fh = open(self.path, "ab")
+            self._fh.write(payload)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def truncate(self) -> None:
+        """Обнуляет журнал (все транзакции уже в снапшотах)."""
+        with self._lock:
+            self.close()
+            with open(self.path, "wb") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def apply_ops(records: List[Any], key: str, ops: List[Op]) -> List[Any]:
+    """Применяет операции одной коллекции к списку записей (при восстановлении)."""
+    positions: Dict[Any, int] = {}
+    stale = True
+    for op in ops:
+        if "all" in op:
+            records = list(op["all"])
+            stale = True
+            continue
+        if stale:
+            positions = {r.get(key): i for i, r in enumerate(records) if isinstance(r, dict)}
+            stale = False
+        if "put" in op:
+            record = op["put"]
+            position = positions.get(record.get(key))
+            if position is None:
+                positions[record.get(key)] = len(records)
+                records.append(record)
+            else:
+                records[position] = record
+        elif "del" in op:
+            position = positions.get(op["del"])
+            if position is not None:
+                del records[position]
+                stale = True
+    return records
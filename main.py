@@ -9,12 +9,15 @@ from telegram.ext import (
     Application,
     CallbackQueryHandler,
     CommandHandler,
+    ContextTypes,
     MessageHandler,
     filters,
 )
 from telegram.ext.filters import MessageFilter
 
 import storage
+from callbacks import router as callback_router
+from concurrency import build_update_processor
 from handlers import (
     add_device_callback,
     add_group_callback,
@@ -70,20 +73,26 @@ from handlers import (
     manage_users_admin_callback,
     manage_users_callback,
     my_devices,
+    notifier,
     process_devices_csv,
     register_group_select_callback,
     register_user,
+    reload_config_command,
+    reload_settings,
     release_all_user_devices,
     release_device_callback,
     release_device_text,
     reject_user_callback,
     rename_group_callback,
+    schedule_expiration_job,
+    schedule_reminder_job,
     scan_book_callback,
     scan_cancel_callback,
     scan_code_menu,
     scan_release_callback,
     scan_transfer_callback,
     search_devices,
+    search_page_callback,
     set_name_command,
     select_device_type,
     select_device_type_callback,
@@ -98,6 +107,7 @@ from handlers import (
     view_all_booked,
     view_booked_admin_callback,
 )
+from libs.text_router import TextRouter
 
 
 def _setup_logging() -> None:
@@ -136,6 +146,75 @@ class _HasWebAppData(MessageFilter):
         return getattr(message, "web_app_data", None) is not None
 
 
+class _TextRoute(MessageFilter):
+    """Пропускает текст, для которого в TextRouter есть обработчик.
+
+    Выбранный обработчик и совпадение шаблона передаются в context
+    (text_handler, matches), поэтому текст разбирается один раз.
+    """
+
+    data_filter = True
+
+    def __init__(self, router: TextRouter):
+        super().__init__(name="TextRoute")
+        self.router = router
+
+    def filter(self, message):
+        resolved = self.router.resolve(message.text)
+        if resolved is None:
+            return False
+        handler, match = resolved
+        return {"text_handler": handler, "matches": [match] if match else []}
+
+
+async def _dispatch_text(update: Update, context):
+    return await context.text_handler(update, context)
+
+
+def _build_text_router() -> TextRouter:
+    """Надписи кнопок reply-клавиатуры и текстовые команды -> обработчики."""
+    router = TextRouter()
+    # Навигация и пользовательские действия
+    router.exact("Назад", handler=go_back)
+    router.exact("Главное меню", handler=start_menu)
+    router.exact("Список устройств", handler=list_devices)
+    router.exact("Бронирование", handler=book_device_menu)
+    # Типы устройств: набор читается на каждом сообщении (config.json перечитывается
+    # без перезапуска, новые типы приходят и с импортом устройств)
+    router.members(storage.is_device_type, handler=select_device_type)
+    router.exact("Мои устройства", handler=my_devices)
+    router.exact("Освободить все устройства", handler=release_all_user_devices)
+
+    # Админ-панель
+    router.exact("Администрирование", handler=admin_panel)
+    router.exact("Просмотр забронированных устройств", handler=view_all_booked)
+    router.exact("Управление устройствами", handler=manage_devices)
+    router.exact("Импортировать устройства", handler=import_devices_csv)
+    router.exact("Админ: Управление устройствами", handler=manage_devices_admin_callback)
+    router.exact("Админ: Управление пользователями", handler=manage_users_admin_callback)
+    router.exact("Админ: Управление группами", handler=manage_groups_admin)
+    router.exact("Админ: Просмотр забронированных", handler=view_booked_admin_callback)
+    router.exact("Админ: Импорт устройств", handler=import_devices_csv)
+    router.exact("Админ: Экспорт устройств", handler=export_devices_callback)
+    router.exact("Админ: Экспорт пользователей", handler=export_users_callback)
+    router.exact("Админ: Экспорт логов", handler=export_logs_callback)
+    router.exact("Админ: Переключить регистрацию", handler=toggle_registration)
+    router.exact("Управление пользователями", handler=manage_users)
+    router.exact("Управление группами", handler=manage_groups_admin)
+    router.exact("Включить регистрацию", "Выключить регистрацию", handler=toggle_registration)
+    router.exact("Экспорт устройств CSV", handler=export_devices)
+    router.exact("Экспорт пользователей CSV", handler=export_users)
+    router.exact("Экспорт логов CSV", handler=export_logs)
+
+    # Надписи с данными и текстовые команды администратора
+    router.pattern(r".* - ID \d+$", book_specific_device)
+    router.pattern(r"^Освободить .* \(SN: .*?\)$", release_device_text)
+    router.pattern(r"^.*Сканирование$", scan_code_menu)
+    router.pattern(r"^(add|del|rename).*$", admin_devices_text)
+    router.pattern(r"^(approve|reject|adduser|edituser|deluser).*$", admin_users_text)
+    return router
+
+
 async def _log_raw_update(update: Update, context):
     """Логирует любое входящее обновление целиком (для диагностики)."""
     try:
@@ -165,92 +244,73 @@ def _register_handlers(app: Application) -> None:
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("register", register_user))
     app.add_handler(CommandHandler("set_name", set_name_command))
+    app.add_handler(CommandHandler("reload_config", reload_config_command))
 
-    # Кнопки навигации
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Назад$"), go_back))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Главное меню$"), start_menu))
+    # Inline-кнопки: один обработчик, действие выбирается по callback_data
+    # словарем (callbacks.py); обработчики действий назначаются ниже
+    app.add_handler(CallbackQueryHandler(callback_router.dispatch))
 
-    # Пользовательские действия
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Список устройств$"), list_devices))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Бронирование$"), book_device_menu))
-    app.add_handler(
-        MessageHandler(
-            filters.TEXT & filters.Regex("^(" + "|".join(storage.config["device_types"]) + ")$"),
-            select_device_type,
-        )
-    )
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r".* - ID \d+$"), book_specific_device))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Мои устройства$"), my_devices))
-    app.add_handler(
-        MessageHandler(filters.TEXT & filters.Regex(r"^Освободить .* \(SN: .*?\)$"), release_device_text)
-    )
-    app.add_handler(
-        MessageHandler(filters.TEXT & filters.Regex("^Освободить все устройства$"), release_all_user_devices)
-    )
+    # Кнопки reply-клавиатуры: один обработчик, надпись ищется в словаре
+    # (_build_text_router); остальной текст проходит к FSM-обработчикам ниже
+    app.add_handler(MessageHandler(filters.TEXT & _TextRoute(_build_text_router()), _dispatch_text))
 
     # Сканирование QR/штрих-кодов
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"^.*Сканирование$"), scan_code_menu))
-    app.add_handler(CallbackQueryHandler(scan_book_callback, pattern="^scan_book_.*"))
-    app.add_handler(CallbackQueryHandler(scan_release_callback, pattern="^scan_release_.*"))
-    app.add_handler(CallbackQueryHandler(scan_transfer_callback, pattern="^scan_transfer_.*"))
-    app.add_handler(CallbackQueryHandler(transfer_confirm_callback, pattern="^transfer_confirm_.*"))
-    app.add_handler(CallbackQueryHandler(transfer_reject_callback, pattern="^transfer_reject_.*"))
-    app.add_handler(CallbackQueryHandler(scan_cancel_callback, pattern="^scan_cancel$"))
+    callback_router.route("scan_book", scan_book_callback)
+    callback_router.route("scan_release", scan_release_callback)
+    callback_router.route("scan_transfer", scan_transfer_callback)
+    callback_router.route("transfer_confirm", transfer_confirm_callback)
+    callback_router.route("transfer_reject", transfer_reject_callback)
+    callback_router.route("scan_cancel", scan_cancel_callback)
 
     # Обработчики кнопок устройств
-    app.add_handler(CallbackQueryHandler(book_device_callback, pattern="^book_dev_.*"))
-    app.add_handler(CallbackQueryHandler(admin_book_device_callback, pattern="^admin_book_dev_.*"))
-    app.add_handler(CallbackQueryHandler(admin_book_select_user_callback, pattern="^admin_book_select_.*"))
-    app.add_handler(CallbackQueryHandler(admin_book_cancel_callback, pattern="^admin_book_cancel$"))
-    app.add_handler(CallbackQueryHandler(release_device_callback, pattern="^release_dev_.*"))
-    app.add_handler(CallbackQueryHandler(info_device_callback, pattern="^info_dev_.*"))
-    app.add_handler(CallbackQueryHandler(back_to_types_callback, pattern="^back_to_types$"))
-    app.add_handler(CallbackQueryHandler(back_to_main_callback, pattern="^back_to_main$"))
-    app.add_handler(CallbackQueryHandler(select_device_type_callback, pattern="^type_.*"))
-    app.add_handler(CallbackQueryHandler(register_group_select_callback, pattern="^reg_group_.*"))
+    callback_router.route("book_dev", book_device_callback)
+    callback_router.route("admin_book_dev", admin_book_device_callback)
+    callback_router.route("admin_book_select", admin_book_select_user_callback)
+    callback_router.route("admin_book_cancel", admin_book_cancel_callback)
+    callback_router.route("release_dev", release_device_callback)
+    callback_router.route("info_dev", info_device_callback)
+    callback_router.route("search_page", search_page_callback)
+    callback_router.route("back_to_types", back_to_types_callback)
+    callback_router.route("back_to_main", back_to_main_callback)
+    callback_router.route("type", select_device_type_callback, rest=True)
+    callback_router.route("reg_group", register_group_select_callback)
 
     # Админ-панель
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Администрирование$"), admin_panel))
-    app.add_handler(
-        MessageHandler(filters.TEXT & filters.Regex("^Просмотр забронированных устройств$"), view_all_booked)
-    )
-    app.add_handler(CallbackQueryHandler(admin_release_callback, pattern="^adm_rel_.*"))
-    app.add_handler(CallbackQueryHandler(manage_devices_admin_callback, pattern="^manage_devices_admin$"))
-    app.add_handler(CallbackQueryHandler(admin_type_callback, pattern="^admin_type_.*"))
-    app.add_handler(CallbackQueryHandler(admin_all_devices_callback, pattern="^admin_all_devices$"))
-    app.add_handler(CallbackQueryHandler(manage_users_admin_callback, pattern="^manage_users_admin$"))
-    app.add_handler(CallbackQueryHandler(manage_users_callback, pattern="^manage_users$"))
-    app.add_handler(CallbackQueryHandler(view_booked_admin_callback, pattern="^view_booked_admin$"))
-    app.add_handler(CallbackQueryHandler(add_device_callback, pattern="^add_device$"))
-    app.add_handler(CallbackQueryHandler(edit_device_callback, pattern="^edit_device_.*"))
-    app.add_handler(CallbackQueryHandler(delete_device_callback, pattern="^delete_device_.*"))
-    app.add_handler(CallbackQueryHandler(export_devices_callback, pattern="^export_devices_admin$"))
-    app.add_handler(CallbackQueryHandler(export_users_callback, pattern="^export_users_admin$"))
-    app.add_handler(CallbackQueryHandler(export_logs_callback, pattern="^export_logs_admin$"))
-    app.add_handler(CallbackQueryHandler(manage_groups_admin, pattern="^manage_groups_admin$"))
-    app.add_handler(CallbackQueryHandler(toggle_registration, pattern="^toggle_registration$"))
-    app.add_handler(CallbackQueryHandler(import_devices_csv, pattern="^import_devices_admin$"))
-    app.add_handler(CallbackQueryHandler(approve_user_callback, pattern="^approve_user_.*"))
-    app.add_handler(CallbackQueryHandler(reject_user_callback, pattern="^reject_user_.*"))
-    app.add_handler(CallbackQueryHandler(block_user_callback, pattern="^block_user_.*"))
-    app.add_handler(CallbackQueryHandler(unblock_user_callback, pattern="^unblock_user_.*"))
-    app.add_handler(CallbackQueryHandler(add_user_callback, pattern="^add_user$"))
-    app.add_handler(CallbackQueryHandler(edit_user_callback, pattern="^edit_user_.*"))
-    app.add_handler(CallbackQueryHandler(delete_user_callback, pattern="^delete_user_.*"))
-    app.add_handler(CallbackQueryHandler(list_all_users_callback, pattern="^list_all_users$"))
-    app.add_handler(CallbackQueryHandler(back_to_admin_callback, pattern="^back_to_admin$"))
-    app.add_handler(CallbackQueryHandler(add_group_callback, pattern="^add_group$"))
-    app.add_handler(CallbackQueryHandler(edit_group_callback, pattern="^edit_group_.*"))
-    app.add_handler(CallbackQueryHandler(delete_group_callback, pattern="^delete_group_.*"))
-    app.add_handler(CallbackQueryHandler(rename_group_callback, pattern="^rename_group_.*"))
-    app.add_handler(CallbackQueryHandler(assign_group_users_callback, pattern="^assign_group_users_.*"))
-    app.add_handler(CallbackQueryHandler(assign_group_devices_callback, pattern="^assign_group_devices_.*"))
-    app.add_handler(CallbackQueryHandler(toggle_group_user_callback, pattern="^toggle_group_user_.*"))
-    app.add_handler(CallbackQueryHandler(toggle_group_device_callback, pattern="^toggle_group_device_.*"))
-
-    # Управление устройствами
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Управление устройствами$"), manage_devices))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^(add|del|rename).*$"), admin_devices_text))
+    callback_router.route("adm_rel", admin_release_callback)
+    callback_router.route("manage_devices_admin", manage_devices_admin_callback)
+    callback_router.route("admin_type", admin_type_callback, rest=True, paged=True)
+    callback_router.route("admin_all_devices", admin_all_devices_callback, paged=True)
+    callback_router.route("manage_users_admin", manage_users_admin_callback)
+    callback_router.route("manage_users", manage_users_callback)
+    callback_router.route("view_booked_admin", view_booked_admin_callback)
+    callback_router.route("add_device", add_device_callback)
+    callback_router.route("edit_device", edit_device_callback)
+    callback_router.route("delete_device", delete_device_callback)
+    callback_router.route("export_devices_admin", export_devices_callback)
+    callback_router.route("export_users_admin", export_users_callback)
+    callback_router.route("export_logs_admin", export_logs_callback)
+    callback_router.route("manage_groups_admin", manage_groups_admin)
+    callback_router.route("toggle_registration", toggle_registration)
+    callback_router.route("import_devices_admin", import_devices_csv)
+    callback_router.route("approve_user", approve_user_callback)
+    callback_router.route("reject_user", reject_user_callback)
+    callback_router.route("block_user", block_user_callback)
+    callback_router.route("unblock_user", unblock_user_callback)
+    callback_router.route("add_user", add_user_callback)
+    callback_router.route("edit_user", edit_user_callback)
+    callback_router.route("delete_user", delete_user_callback)
+    callback_router.route("list_all_users", list_all_users_callback, paged=True)
+    callback_router.route("back_to_admin", back_to_admin_callback)
+    callback_router.route("add_group", add_group_callback)
+    callback_router.route("edit_group", edit_group_callback)
+    callback_router.route("delete_group", delete_group_callback)
+    callback_router.route("rename_group", rename_group_callback)
+    callback_router.route("assign_group_users", assign_group_users_callback, paged=True)
+    callback_router.route("assign_group_devices", assign_group_devices_callback, paged=True)
+    callback_router.route("toggle_group_user", toggle_group_user_callback, paged=True)
+    callback_router.route("toggle_group_device", toggle_group_device_callback, paged=True)
+
+    # Импорт устройств из файла
     app.add_handler(
         MessageHandler(
             filters.Document.FileExtension("csv")
@@ -259,34 +319,6 @@ def _register_handlers(app: Application) -> None:
             process_devices_csv,
         )
     )
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Импортировать устройства$"), import_devices_csv))
-    # Админ reply-кнопки
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Управление устройствами$"), manage_devices_admin_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Управление пользователями$"), manage_users_admin_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Управление группами$"), manage_groups_admin))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Просмотр забронированных$"), view_booked_admin_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Импорт устройств$"), import_devices_csv))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Экспорт устройств$"), export_devices_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Экспорт пользователей$"), export_users_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Экспорт логов$"), export_logs_callback))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Админ: Переключить регистрацию$"), toggle_registration))
-
-    # Управление пользователями
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Управление пользователями$"), manage_users))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Управление группами$"), manage_groups_admin))
-    app.add_handler(
-        MessageHandler(filters.TEXT & filters.Regex("^(approve|reject|adduser|edituser|deluser).*$"), admin_users_text)
-    )
-
-    # Переключение регистрации
-    app.add_handler(
-        MessageHandler(filters.TEXT & filters.Regex("^(Включить|Выключить) регистрацию$"), toggle_registration)
-    )
-
-    # Экспорт
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Экспорт устройств CSV$"), export_devices))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Экспорт пользователей CSV$"), export_users))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex("^Экспорт логов CSV$"), export_logs))
 
     # FSM-сообщения
     app.add_handler(MessageHandler(non_command_text, handle_state_message))
@@ -299,6 +331,58 @@ def _register_handlers(app: Application) -> None:
     app.add_handler(MessageHandler(filters.ALL, unknown_message))
 
 
+async def log_retention_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодический перенос старых записей истории в архив."""
+    try:
+        await storage.apply_log_retention_async()
+    except Exception:  # noqa: BLE001
+        logging.exception("Log retention failed")
+
+
+async def config_reload_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перечитывает config.json, если файл изменился на диске."""
+    if not storage.config_changed_on_disk():
+        return
+    try:
+        reload_settings()
+    except (OSError, ValueError):
+        logging.exception("Config reload failed, keeping current settings")
+
+
+def _schedule_jobs(app: Application) -> None:
+    if app.job_queue is None:
+        logging.warning("JobQueue is not available, install python-telegram-bot[job-queue]")
+        return
+    # Сроки броней: задание на ближайший срок, переставляется при более раннем
+    storage.expirations.on_earlier = lambda _deadline: schedule_expiration_job(app.job_queue)
+    schedule_expiration_job(app.job_queue)
+    # Напоминания: восстанавливаются из броней при загрузке, одно задание на ближайшее
+    storage.reminders.on_earlier = lambda _deadline: schedule_reminder_job(app.job_queue)
+    schedule_reminder_job(app.job_queue)
+
+    hours = float(storage.config.get("log_retention_interval_hours") or 0)
+    if hours > 0:
+        app.job_queue.run_repeating(log_retention_job, interval=hours * 3600, first=60, name="log_retention")
+
+    seconds = float(storage.config.get("config_reload_interval_seconds") or 0)
+    if seconds > 0:
+        app.job_queue.run_repeating(config_reload_job, interval=seconds, first=seconds, name="config_reload")
+
+
+async def _on_startup(app: Application) -> None:
+    """Запускает очередь исходящих уведомлений."""
+    notifier.start(app.bot.send_message)
+
+
+async def _on_shutdown(app: Application) -> None:
+    """Досылает уведомления и сбрасывает отложенные записи хранилища при остановке бота."""
+    await notifier.stop()
+    storage.shutdown()
+    # Статистика нажатий inline-кнопок по действиям
+    for line in callback_router.report():
+        logging.info("Callback %s", line)
+
+
 def _build_app() -> Application:
     storage.load_all()
     token = storage.config.get("bot_token")
@@ -306,7 +390,8 @@ def _build_app() -> Application:
         raise RuntimeError("Bot token is not configured in config.json")
     logging.info(
         "Config loaded: admins=%s, device_types=%s, registration_enabled=%s, default_booking_period_days=%s, "
-        "max_devices_per_user=%s, notify_before_minutes=%s, webapp_url=%s",
+        "max_devices_per_user=%s, notify_before_minutes=%s, webapp_url=%s, storage_backend=%s, "
+        "storage_durability=%s, concurrent_updates=%s",
         storage.config.get("admin_ids"),
         storage.config.get("device_types"),
         storage.config.get("registration_enabled"),
@@ -314,9 +399,18 @@ def _build_app() -> Application:
         storage.config.get("max_devices_per_user"),
         storage.config.get("notify_before_minutes"),
         storage.config.get("webapp_url"),
+        storage.config.get("storage_backend"),
+        storage.config.get("storage_durability"),
+        storage.config.get("concurrent_updates"),
     )
-    app = Application.builder().token(token).build()
+    builder = Application.builder().token(token).post_init(_on_startup).post_shutdown(_on_shutdown)
+    # Обновления разных чатов — параллельно, одного чата — по порядку
+    processor = build_update_processor(storage.config)
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    app = builder.build()
     _register_handlers(app)
+    _schedule_jobs(app)
     return app
 
 
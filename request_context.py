@@ -0,0 +1,72 @@
+"""Данные пользователя на время обработки одного обновления.
+
+access_control создает RequestContext один раз на обновление и кладет его в
+context.request (PTB создает один CallbackContext на обновление). Обработчики
+берут из него права и группу, а помощники utils, получив request=, кэшируют в
+нем производные значения (видимые группы, имя, брони пользователя), чтобы не
+вычислять их повторно в пределах обновления.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import storage
+from libs.principals import Principal
+
+T = TypeVar("T")
+
+
+class RequestContext:
+    """Пользователь, выполняющий запрос, и значения, вычисленные для него за обновление."""
+
+    __slots__ = ("principal", "_memo")
+
+    def __init__(self, principal: Principal) -> None:
+        self.principal = principal
+        self._memo: Dict[str, Any] = {}
+
+    @property
+    def user_id(self) -> Any:
+        return self.principal.user_id
+
+    @property
+    def user(self) -> Optional[Any]:
+        return self.principal.user
+
+    @property
+    def is_admin(self) -> bool:
+        return self.principal.is_admin
+
+    @property
+    def group(self) -> Optional[Any]:
+        return self.principal.group
+
+    @property
+    def group_id(self) -> Optional[Any]:
+        return self.principal.group_id
+
+    def memo(self, key: str, compute: Callable[[], T]) -> T:
+        """Значение key, вычисленное compute() при первом обращении за обновление."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = compute()
+            return value
+
+    def forget(self, *keys: str) -> None:
+        """Сбрасывает запомненные значения (все, если keys не заданы) после изменений."""
+        if not keys:
+            self._memo.clear()
+        for key in keys:
+            self._memo.pop(key, None)
+
+
+def for_update(update: Any, context: Any) -> RequestContext:
+    """RequestContext обновления: из context.request или новый (обработчик без access_control)."""
+    user_id = update.effective_user.id
+    request = getattr(context, "request", None)
+    if request is None or request.user_id != user_id:
+        request = RequestContext(storage.principals.get(user_id))
+        context.request = request
+    return request
@@ -1,10 +1,33 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
 import json
+import logging
 import os
 import tempfile
 import threading
-from typing import Any, Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from libs.records import Device, Group, LogEntry, User, json_default
+from libs import storage_codecs
+from libs.expiration import ExpirationScheduler, ReminderScheduler
+from libs.facet_counters import FacetCounters
+from libs.fuzzy_sn import FuzzySerialIndex
+from libs.log_archive import LogArchive, split_expired
+from libs.log_shards import LazyLogs, ShardedLogFiles
+from libs.principals import PrincipalCache
+from libs.repository import Changes, Collection, casefold_key, empty_to_none
+from libs.sorted_view import SortedView
+from libs.sqlite_store import COLLECTION_KEYS
+from libs.trigram_index import TrigramIndex
+from libs.wal import WriteAheadLog, apply_ops
+
+logger = logging.getLogger(__name__)
 
 # Базовая директория для файлов данных (можно переопределить через переменную окружения)
 DATA_DIR = os.getenv("DATA_DIR", ".")
@@ -13,15 +36,94 @@ CONFIG_FILE = os.path.join(DATA_DIR, "config.json")
 DEVICES_FILE = os.path.join(DATA_DIR, "devices.json")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 LOGS_FILE = os.path.join(DATA_DIR, "device_logs.json")
+LOGS_JOURNAL_FILE = os.path.join(DATA_DIR, "device_logs.jsonl")
+LOGS_SHARDS_DIR = os.path.join(DATA_DIR, "device_logs")
+LOGS_ARCHIVE_DIR = os.path.join(DATA_DIR, "log_archive")
 GROUPS_FILE = os.path.join(DATA_DIR, "groups.json")
+SQLITE_FILE = os.path.join(DATA_DIR, "storage.sqlite3")
+WAL_FILE = os.path.join(DATA_DIR, "storage.wal")
+
+# Бэкенд хранения коллекций: "json" (файлы *.json) или "sqlite".
+# Переменная окружения имеет приоритет над ключом storage_backend в config.json.
+STORAGE_BACKEND_ENV = "STORAGE_BACKEND"
+
+# Режимы записи: strict — каждое save_*() сразу пишется и fsync'ится;
+# batched — коллекции помечаются «грязными» и сбрасываются пачкой по таймеру.
+DURABILITY_STRICT = "strict"
+DURABILITY_BATCHED = "batched"
+
+# Индексируемые поля коллекций (см. libs/repository.py): поиск по ним — O(1)
+DEVICE_INDEXES = ("id", "sn", "user_id", "group_id", "type", "status")
+USER_INDEXES = ("user_id", "status", "group_id")
+GROUP_INDEXES = ("id", "name")
 
 config: Dict[str, Any] = {}
-devices: List[Dict[str, Any]] = []
-users: List[Dict[str, Any]] = []
-logs: Dict[str, List[Dict[str, Any]]] = {}
-groups: List[Dict[str, Any]] = []
+# Настройки, которые действуют только с запуска: при перечитывании config.json
+# (reload_config) их новые значения не применяются до перезапуска
+RESTART_ONLY_SETTINGS = (
+    "bot_token",
+    "storage_backend",
+    "storage_format",
+    "storage_durability",
+    "log_shards",
+    "concurrent_updates",
+)
+# Типы из config["device_types"] (обновляется в apply_config)
+_device_types: FrozenSet[str] = frozenset()
+# (mtime, размер) config.json на момент последнего чтения
+_config_stamp: Optional[Tuple[int, int]] = None
+devices: Collection = Collection(
+    DEVICE_INDEXES, {"sn": casefold_key, "group_id": empty_to_none}, record_type=Device, key="id"
+)
+users: Collection = Collection(USER_INDEXES, {"group_id": empty_to_none}, record_type=User, key="user_id")
+# История SN -> [LogEntry]; бакеты подгружаются с диска по требованию
+logs: LazyLogs = LazyLogs(entry_type=LogEntry)
+groups: Collection = Collection(GROUP_INDEXES, record_type=Group, key="id")
+
+# Сроки брони и напоминаний (мин-кучи); обновляются при любом изменении devices
+expirations = ExpirationScheduler()
+reminders = ReminderScheduler()
+devices.add_listener(expirations.observe)
+devices.add_listener(reminders.observe)
+
+# Поиск подстроки по названию, типу и SN (n-граммный индекс)
+device_search = TrigramIndex(("name", "type", "sn"))
+devices.add_listener(device_search.observe)
+# Нечеткий поиск SN с ошибками OCR (индекс удалений по нормализованным SN)
+sn_fuzzy = FuzzySerialIndex("sn")
+devices.add_listener(sn_fuzzy.observe)
+# Количество устройств по (группа, тип, статус) для меню
+device_counts = FacetCounters(normalizers={"group_id": empty_to_none}, default_type="Неизвестно")
+devices.add_listener(device_counts.observe)
+# Порядок записей на постраничных экранах администратора: страница — срез
+devices_by_id = SortedView(lambda d: (d.get("id") or 0,))
+devices_by_type = SortedView(lambda d: (d.get("type") or "Неизвестно", d.get("id") or 0))
+devices_for_groups = SortedView(
+    lambda d: (str(d.get("type") or ""), str(d.get("name") or ""), str(d.get("sn") or ""))
+)
+users_by_name = SortedView(
+    lambda u: (str(u.get("first_name") or ""), str(u.get("last_name") or ""), u.get("user_id") or 0)
+)
+devices.add_listener(devices_by_id.observe)
+devices.add_listener(devices_by_type.observe)
+devices.add_listener(devices_for_groups.observe)
+users.add_listener(users_by_name.observe)
+# Права пользователей по user_id для access_control (сбрасываются при изменении записи)
+principals = PrincipalCache(users, groups)
+users.add_listener(principals.observe)
+groups.add_listener(principals.observe_group)
 
 _write_lock = threading.RLock()
+_backend = None
+
+# Все файловые операции выполняются в одном потоке записи: event loop только
+# сериализует снимок данных, а порядок записей совпадает с порядком вызовов.
+_writer: Optional[ThreadPoolExecutor] = None
+
+# Write-behind: грязные коллекции, отложенные записи лога и запланированный сброс
+_dirty: set = set()
+_pending_logs: List[Tuple[str, Dict[str, Any]]] = []
+_flush_handle = None
 
 
 def _ensure_data_dir() -> None:
@@ -30,95 +132,927 @@ def _ensure_data_dir() -> None:
 
 
 def _load_json(path: str, default: Any):
+    """Читает файл данных в любом формате хранения (формат определяется по содержимому)."""
     if not os.path.exists(path):
         return default
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        with open(path, "rb") as f:
+            return storage_codecs.loads(f.read())
+    except ValueError:
         # Возвращаем default, если файл поврежден
         return default
 
 
-def _atomic_write_json(path: str, data: Any) -> None:
-    """Пишем данные атомарно, чтобы избежать частично записанных файлов."""
+def _atomic_write_bytes(path: str, payload: bytes) -> None:
+    """Пишем данные атомарно, чтобы избежать частично записанных файлов.
+
+    Вызывается только из потока записи, поэтому блокировок не берет.
+    """
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def _dump_json(data: Any) -> bytes:
+    """Человекочитаемый JSON (config.json редактируется руками)."""
+    return json.dumps(data, ensure_ascii=False, indent=4, default=json_default).encode("utf-8")
+
+
+def _save_json(path: str, data: Any) -> None:
+    _run_in_writer(_atomic_write_bytes, path, _dump_json(data))
+
+
+def _storage_codec():
+    return storage_codecs.get_codec(config.get("storage_format"))
+
+
+class JsonBackend:
+    """Исходный формат: каждая коллекция целиком в своем файле + общий WAL.
+
+    Формат файлов задается storage_format (см. libs/storage_codecs.py):
+    компактный JSON, pretty JSON, orjson или msgpack. Чтение определяет формат
+    по содержимому, поэтому смена формата не требует миграции: файл
+    перезаписывается в новом формате при следующем checkpoint.
+
+    Каждое сохранение — одна транзакция в WAL (storage.wal, см. libs/wal.py):
+    измененные записи коллекций и новые записи лога одной строкой с одним
+    fsync. Файлы коллекций и бакеты логов переписываются только при
+    checkpoint (раз в log_compact_every транзакций и при запуске), после
+    чего WAL обнуляется. При загрузке WAL применяется поверх снапшотов.
+
+    Логи разбиты на бакеты по хешу SN (device_logs/, см. libs/log_shards.py)
+    и подгружаются по требованию.
+
+    Запись разделена на два шага: prepare_*() сериализует данные в потоке
+    вызывающего (снимок на момент вызова), write_*() выполняет файловые
+    операции в потоке записи.
+    """
+
+    name = "json"
+
+    def __init__(self) -> None:
+        self.paths = {
+            "devices": DEVICES_FILE,
+            "users": USERS_FILE,
+            "groups": GROUPS_FILE,
+        }
+        self.codec = _storage_codec()
+        self.log_files = ShardedLogFiles(
+            LOGS_FILE,
+            LOGS_JOURNAL_FILE,
+            LOGS_SHARDS_DIR,
+            buckets=config.get("log_shards", 64),
+            codec=self.codec,
+        )
+        self.wal = WriteAheadLog(WAL_FILE)
+        # Операции коллекций из WAL, которые применяются при загрузке
+        self._replayed: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    def _recover(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Открывает логи и читает WAL (один раз за время жизни бэкенда)."""
+        if self._replayed is None:
+            self.log_files.open()
+            replayed: Dict[str, List[Dict[str, Any]]] = {}
+            for lsn, ops in self.wal.replay():
+                for op in ops:
+                    if op.get("c") != "logs":
+                        replayed.setdefault(op.get("c"), []).append(op)
+                    elif lsn > self.log_files.lsn:
+                        # Записи с меньшим lsn уже в снапшотах бакетов
+                        self.log_files.add(lsn, op["sn"], op["entry"])
+            self.wal.lsn = max(self.wal.lsn, self.log_files.lsn)
+            self._replayed = replayed
+        return self._replayed
+
+    def load(self, collection: str, default: Any) -> Any:
+        replayed = self._recover()
+        if collection == "logs":
+            return self.log_files.read_all()
+        data = _load_json(self.paths[collection], default)
+        ops = replayed.get(collection)
+        if ops and isinstance(data, list):
+            data = apply_ops(data, COLLECTION_KEYS[collection], ops)
+        return data
+
+    def log_source(self) -> ShardedLogFiles:
+        self._recover()
+        return self.log_files
+
+    def snapshot_buckets(self) -> Any:
+        """Бакеты, которые обязательно переписать при checkpoint."""
+        return self.log_files.journal_buckets()
+
+    def prepare_tx(self, changes: Dict[str, Changes], records: List[Tuple[str, Any]]) -> bytes:
+        self._recover()
+        ops: List[Dict[str, Any]] = []
+        for collection, change in changes.items():
+            if change.full:
+                ops.append({"c": collection, "all": change.upserts})
+                continue
+            ops.extend({"c": collection, "del": key} for key in change.deletes)
+            ops.extend({"c": collection, "put": record} for record in change.upserts)
+        ops.extend({"c": "logs", "sn": sn, "entry": entry} for sn, entry in records)
+        if not ops:
+            return b""
+        lsn, payload = self.wal.encode(ops)
+        for sn, entry in records:
+            self.log_files.add(lsn, sn, entry)
+        return payload
+
+    def write_tx(self, payload: bytes) -> None:
+        self.wal.write(payload)
+
+    def prepare_checkpoint(self, collections: Dict[str, Any], shards: Dict[Any, Any]) -> Any:
+        self._recover()
+        files = [(self.paths[name], self.codec.dumps(data)) for name, data in collections.items()]
+        # shards — {bucket: {sn: [записи]}} из LazyLogs.snapshot()
+        logs_payload = self.log_files.encode_snapshot(shards, self.wal.lsn)
+        truncate = logs_payload[2]
+        if truncate:
+            self.wal.pending = 0
+        return files, logs_payload, truncate
+
+    def write_checkpoint(self, payload: Any) -> None:
+        files, logs_payload, truncate = payload
+        for path, data in files:
+            _atomic_write_bytes(path, data)
+        self.log_files.write_snapshot(logs_payload)
+        if truncate:
+            # Все транзакции WAL уже в снапшотах
+            self.wal.truncate()
+
+    def pending_entries(self) -> int:
+        return max(self.wal.pending, self.log_files.pending)
+
+    def close(self) -> None:
+        self.wal.close()
+
+
+class SqliteBackend:
+    """Коллекции в SQLite (WAL): сохранение пишет только изменившиеся записи.
+
+    Транзакция хранилища (изменения коллекций + записи лога) — одна
+    транзакция SQLite.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = None) -> None:
+        from libs.sqlite_store import SqliteStore
+
+        self.path = path or SQLITE_FILE
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.store = SqliteStore(self.path)
+        if self.store.is_empty():
+            self._import_json_files()
+
+    def _import_json_files(self) -> None:
+        """Первый запуск на SQLite: переносим данные из существующих JSON-файлов."""
+        legacy = JsonBackend()
+        for collection, default in (("devices", []), ("users", []), ("groups", []), ("logs", {})):
+            data = legacy.load(collection, default)
+            if data:
+                self.store.save(collection, data)
+
+    def load(self, collection: str, default: Any) -> Any:
+        return self.store.load(collection, default)
+
+    # Источник для LazyLogs: бакет — это сам SN (строки лога индексированы по sn)
+
+    def log_source(self) -> "SqliteBackend":
+        return self
+
+    def bucket_of(self, sn: str) -> str:
+        return sn
+
+    def bucket_ids(self) -> List[str]:
+        return self.store.log_sns()
+
+    def load_bucket(self, sn: str) -> Dict[str, List[Any]]:
+        entries = self.store.load_sn_logs(sn)
+        return {sn: entries} if entries else {}
+
+    def snapshot_buckets(self) -> Any:
+        return ()
+
+    def prepare_tx(self, changes: Dict[str, Changes], records: List[Tuple[str, Any]]) -> Any:
+        rows = {collection: self.store.serialize_changes(collection, change) for collection, change in changes.items()}
+        return rows, self.store.serialize_log_records(records)
+
+    def write_tx(self, payload: Any) -> None:
+        rows, log_rows = payload
+        self.store.write_tx(rows, log_rows)
+
+    def prepare_checkpoint(self, collections: Dict[str, Any], shards: Dict[Any, Any]) -> Any:
+        rows = {collection: ("all", self.store.serialize(collection, data)) for collection, data in collections.items()}
+        # Пустой бакет — история SN удалена
+        logs_data = {sn: bucket.get(sn, []) for sn, bucket in shards.items()}
+        return rows, self.store.serialize("logs", logs_data)
+
+    def write_checkpoint(self, payload: Any) -> None:
+        rows, logs_rows = payload
+        self.store.write_tx(rows, logs=logs_rows)
+
+    def pending_entries(self) -> int:
+        # В SQLite каждая запись уже лежит в своей строке, checkpoint не нужен
+        return 0
+
+    def close(self) -> None:
+        self.store.close()
+
+
+BACKENDS = {
+    JsonBackend.name: JsonBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+
+def _create_backend():
+    name = (os.getenv(STORAGE_BACKEND_ENV) or config.get("storage_backend") or "json").lower()
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Неизвестный бэкенд хранения: {name}")
+    return backend_cls()
+
+
+def _get_writer() -> ThreadPoolExecutor:
+    global _writer
     with _write_lock:
-        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        return _writer
+
+
+def _submit(fn: Callable[..., Any], *args: Any) -> Future:
+    """Ставит операцию в очередь потока записи (FIFO)."""
+    try:
+        return _get_writer().submit(fn, *args)
+    except RuntimeError:
+        # Интерпретатор завершается (atexit): пул уже остановлен и дождался
+        # своих задач, поэтому выполняем операцию прямо в текущем потоке.
+        future: Future = Future()
         try:
-            with os.fdopen(fd, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(tmp_path, path)
-        finally:
-            if os.path.exists(tmp_path):
-                try:
-                    os.remove(tmp_path)
-                except OSError:
-                    pass
+            future.set_result(fn(*args))
+        except Exception as exc:  # noqa: BLE001
+            future.set_exception(exc)
+        return future
 
 
-def _save_json(path: str, data: Any) -> None:
-    _atomic_write_json(path, data)
+def _run_in_writer(fn: Callable[..., Any], *args: Any) -> Any:
+    """Синхронная обертка: выполняет операцию в потоке записи и ждет ее."""
+    return _submit(fn, *args).result()
+
+
+async def _await_writer(future: Future) -> Any:
+    return await asyncio.wrap_future(future)
+
+
+def _get_backend():
+    global _backend
+    with _write_lock:
+        if _backend is None:
+            _backend = _create_backend()
+        return _backend
+
+
+logs.set_source_factory(lambda: _get_backend().log_source())
+
+
+def close() -> None:
+    """Закрывает текущий бэкенд (следующее обращение откроет его заново).
+
+    Закрытие идет через поток записи, поэтому все ранее поставленные
+    записи успевают выполниться.
+    """
+    global _backend
+    with _write_lock:
+        backend, _backend = _backend, None
+        if backend is None:
+            return
+        future = _submit(backend.close)
+        # Кэш логов привязан к закрываемому бэкенду
+        logs.reset()
+    future.result()
+
+
+def _durability() -> str:
+    return config.get("storage_durability", DURABILITY_STRICT)
+
+
+def _collections() -> Dict[str, Any]:
+    return {"devices": devices, "users": users, "logs": logs, "groups": groups}
+
+
+def _discard_pending() -> None:
+    global _flush_handle
+    with _write_lock:
+        if _flush_handle is not None:
+            _flush_handle.cancel()
+            _flush_handle = None
+        _dirty.clear()
+        _pending_logs.clear()
+
+
+def _config_defaults(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Проставляет значения по умолчанию для отсутствующих ключей config."""
+    settings.setdefault("bot_token", "PUT_YOUR_TOKEN_HERE")
+    settings.setdefault("admin_ids", [])
+    settings.setdefault("device_types", ["Phone", "Tablet", "PC", "RKBoard"])
+    settings.setdefault("registration_enabled", False)
+    settings.setdefault("default_booking_period_days", 1)
+    settings.setdefault("max_devices_per_user", 2)
+    settings.setdefault("notify_before_minutes", 60)
+    settings.setdefault("webapp_url", "")
+    settings.setdefault("storage_backend", "json")
+    settings.setdefault("log_compact_every", 1000)
+    settings.setdefault("storage_durability", DURABILITY_STRICT)
+    settings.setdefault("storage_flush_interval", 0.5)
+    settings.setdefault("storage_format", "json")
+    settings.setdefault("log_shards", 64)
+    settings.setdefault("log_cache_entries", 100_000)
+    # Архивирование истории включается явно: 0 — правило выключено
+    settings.setdefault("log_retention_days", 0)
+    settings.setdefault("max_entries_per_device", 0)
+    settings.setdefault("log_retention_interval_hours", 24)
+    settings.setdefault("concurrent_updates", 32)
+    settings.setdefault("sn_fuzzy_max_distance", 1)
+    settings.setdefault("config_reload_interval_seconds", 30)
+    settings.setdefault("heavy_handler_limits", {"ocr": 2, "import": 1, "export": 2})
+    return settings
 
 
 def load_all() -> None:
-    """Загружаем config, devices, users, logs, groups и проставляем дефолты."""
-    global config, devices, users, logs, groups
+    """Загружаем config, devices, users, logs, groups и проставляем дефолты.
+
+    Несброшенные отложенные записи отбрасываются: состояние читается с диска
+    (снапшоты + транзакции из WAL).
+    """
+    global config, _config_stamp
 
     _ensure_data_dir()
+    _discard_pending()
 
-    config = _load_json(CONFIG_FILE, {})
-    config.setdefault("bot_token", "PUT_YOUR_TOKEN_HERE")
-    config.setdefault("admin_ids", [])
-    config.setdefault("device_types", ["Phone", "Tablet", "PC", "RKBoard"])
-    config.setdefault("registration_enabled", False)
-    config.setdefault("default_booking_period_days", 1)
-    config.setdefault("max_devices_per_user", 2)
-    config.setdefault("notify_before_minutes", 60)
-    config.setdefault("webapp_url", "")
-
-    devices_data = _load_json(DEVICES_FILE, [])
+    config = _config_defaults(_load_json(CONFIG_FILE, {}))
+    _config_stamp = _file_stamp(CONFIG_FILE)
+
+    close()
+    backend = _get_backend()
+    apply_config()
+
+    devices_data = backend.load("devices", [])
     if not isinstance(devices_data, list):
         devices_data = []
     devices.clear()
     devices.extend(devices_data)
 
-    users_data = _load_json(USERS_FILE, [])
+    users_data = backend.load("users", [])
     if not isinstance(users_data, list):
         users_data = []
     users.clear()
     users.extend(users_data)
 
-    logs_data = _load_json(LOGS_FILE, {})
-    if not isinstance(logs_data, dict):
-        logs_data = {}
-    logs.clear()
-    logs.update(logs_data)
+    # Логи не читаются целиком: бакеты подгружаются при первом обращении
+    logs.bind(backend.log_source())
 
-    groups_data = _load_json(GROUPS_FILE, [])
+    groups_data = backend.load("groups", [])
     if not isinstance(groups_data, list):
         groups_data = []
     groups.clear()
     groups.extend(groups_data)
 
+    # Загруженное состояние совпадает с диском
+    for collection in (devices, users, groups):
+        collection.mark_clean()
+
+    # WAL, накопленный с прошлого запуска, сразу сворачиваем в снапшоты
+    if backend.pending_entries():
+        checkpoint()
+
+
+def _submit_config() -> Future:
+    with _write_lock:
+        return _submit(_atomic_write_bytes, CONFIG_FILE, _dump_json(config))
+
 
 def save_config() -> None:
-    _save_json(CONFIG_FILE, config)
+    _submit_config().result()
+
+
+async def save_config_async() -> None:
+    await _await_writer(_submit_config())
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def apply_config() -> None:
+    """Применяет настройки config к индексам и планировщикам.
+
+    Пересчитывается только то, что изменилось (при запуске коллекции еще
+    пусты, и пересчет ничего не стоит).
+    """
+    global _device_types
+    _device_types = frozenset(str(name) for name in config.get("device_types") or ())
+    principals.admin_ids = config.get("admin_ids") or ()
+
+    lead = timedelta(minutes=float(config.get("notify_before_minutes") or 0))
+    if lead != reminders.lead:
+        reminders.lead = lead
+        reminders.rebuild(devices)
+        deadline = reminders.next_deadline()
+        if deadline is not None and reminders.on_earlier is not None:
+            reminders.on_earlier(deadline)
+
+    depth = max(0, int(config.get("sn_fuzzy_max_distance") or 0))
+    if depth != sn_fuzzy.max_distance:
+        sn_fuzzy.max_distance = depth
+        sn_fuzzy.rebuild(devices)
+
+    logs.max_entries = int(config.get("log_cache_entries", 100_000))
+
+
+def config_changed_on_disk() -> bool:
+    """config.json изменился после последнего чтения (load_all/reload_config)."""
+    return _file_stamp(CONFIG_FILE) != _config_stamp
+
+
+def reload_config() -> Tuple[List[str], List[str]]:
+    """Перечитывает config.json и подменяет настройки целиком, без перезапуска.
+
+    Новый словарь собирается и проверяется отдельно, затем заменяет config
+    одним присваиванием: обработчики видят либо старые, либо новые
+    настройки. Ключи из RESTART_ONLY_SETTINGS сохраняют текущие значения.
+    Возвращает (примененные ключи, ключи, ждущие перезапуска). Если файл не
+    читается или поврежден — ValueError/OSError, настройки не меняются.
+    """
+    global config, _config_stamp
+
+    stamp = _file_stamp(CONFIG_FILE)
+    with open(CONFIG_FILE, "rb") as f:
+        loaded = storage_codecs.loads(f.read())
+    if not isinstance(loaded, dict):
+        raise ValueError("config.json должен содержать объект")
+    loaded = _config_defaults(loaded)
+
+    pending = []
+    for key in RESTART_ONLY_SETTINGS:
+        if key in config and loaded.get(key) != config[key]:
+            pending.append(key)
+            loaded[key] = config[key]
+    changed = sorted(key for key in set(config) | set(loaded) if config.get(key) != loaded.get(key))
+
+    with _write_lock:
+        config = loaded
+        _config_stamp = stamp
+    apply_config()
+    return changed, pending
+
+
+def is_device_type(name: str) -> bool:
+    """Тип из config["device_types"] или тип хотя бы одного устройства (например, после импорта)."""
+    return name in _device_types or devices.count_by("type", name) > 0
+
+
+def _submit_collection(collection: str) -> List[Future]:
+    """Запись коллекции: сразу (strict) или отложенно пачкой (batched).
+
+    В режиме strict изменения сериализуются здесь же, а запись уходит в поток
+    записи; возвращаются future этих записей. Внутри transaction() запись
+    откладывается до конца транзакции.
+    """
+    with _write_lock:
+        tx = _transaction.get()
+        if tx is not None:
+            tx.collections.add(collection)
+            return []
+        if _durability() == DURABILITY_BATCHED:
+            _dirty.add(collection)
+            _schedule_flush()
+            return []
+        return _submit_commit([collection], [])
+
+
+def _track_durable(future: Future, buckets: Any, seq: int, snapshot: bool) -> Future:
+    """После записи разрешаем вытеснять бакеты логов из кэша."""
+    buckets = list(buckets)
+
+    def _done(done: Future) -> None:
+        if done.exception() is None:
+            logs.mark_durable(buckets, seq, snapshot)
+
+    future.add_done_callback(_done)
+    return future
+
+
+def _submit_commit(collections: Any, records: List[Tuple[str, Any]]) -> List[Future]:
+    """Одна транзакция: изменения коллекций collections и записи лога records.
+
+    Пишутся только изменившиеся записи (Collection.drain_changes()), все
+    вместе — одной строкой WAL (или одной транзакцией SQLite). Полная запись
+    логов (save_logs) — это checkpoint, он включает и все остальное.
+    """
+    with _write_lock:
+        if "logs" in collections:
+            return [_submit_checkpoint()]
+        backend = _get_backend()
+        named = _collections()
+        changes: Dict[str, Changes] = {}
+        for name in ("devices", "users", "groups"):
+            if name in collections:
+                change = named[name].drain_changes()
+                if change:
+                    changes[name] = change
+        if not changes and not records:
+            return []
+        buckets = {logs.bucket_of(sn) for sn, _ in records}
+        seq = logs.checkpoint()
+        payload = backend.prepare_tx(changes, records)
+        future = _track_durable(_submit(backend.write_tx, payload), buckets, seq, snapshot=False)
+        if changes:
+            future.add_done_callback(lambda done: _restore_changes(done, list(changes)))
+        futures = [future]
+        futures.extend(_submit_checkpoint_if_needed())
+        return futures
+
+
+def _restore_changes(future: Future, names: List[str]) -> None:
+    # Запись не удалась: изменения больше не отслеживаются по отдельности,
+    # поэтому следующая запись этих коллекций будет полной
+    if future.exception() is not None:
+        named = _collections()
+        for name in names:
+            named[name].mark_changed()
+
+
+def _submit_checkpoint() -> Future:
+    """Checkpoint: коллекции и загруженные бакеты логов целиком, WAL обнуляется."""
+    with _write_lock:
+        backend = _get_backend()
+        named = _collections()
+        collections = {}
+        for name in ("devices", "users", "groups"):
+            named[name].mark_clean()
+            collections[name] = named[name]
+        shards = logs.snapshot(backend.snapshot_buckets())
+        seq = logs.checkpoint()
+        payload = backend.prepare_checkpoint(collections, shards)
+        # Снапшот включает все грязные коллекции и отложенные записи лога
+        _dirty.clear()
+        _pending_logs.clear()
+        future = _submit(backend.write_checkpoint, payload)
+        return _track_durable(future, shards, seq, snapshot=True)
+
+
+def _submit_checkpoint_if_needed() -> List[Future]:
+    threshold = config.get("log_compact_every", 1000)
+    if threshold and _get_backend().pending_entries() >= threshold:
+        return [_submit_checkpoint()]
+    return []
+
+
+def _mark_dirty(collection: str) -> None:
+    for future in _submit_collection(collection):
+        future.result()
+
+
+async def _mark_dirty_async(collection: str) -> None:
+    for future in _submit_collection(collection):
+        await _await_writer(future)
+
+
+def _schedule_flush() -> None:
+    """Планирует сброс через storage_flush_interval секунд (если еще не запланирован).
+
+    Внутри event loop таймер ставится через loop.call_later, чтобы снимок
+    снимался между обработчиками и не видел данные в середине изменения.
+    """
+    global _flush_handle
+    if _flush_handle is not None:
+        return
+    delay = float(config.get("storage_flush_interval", 0.5))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        _flush_handle = loop.call_later(delay, _flush_from_timer)
+    else:
+        timer = threading.Timer(delay, _flush_from_timer)
+        timer.daemon = True
+        _flush_handle = timer
+        timer.start()
+
+
+def _log_write_error(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error("Ошибка отложенной записи хранилища", exc_info=error)
+
+
+def _flush_from_timer() -> None:
+    # Таймер не ждет записи: файловые операции идут в потоке записи
+    try:
+        futures = _submit_flush()
+    except Exception:  # noqa: BLE001
+        logger.exception("Ошибка отложенной записи хранилища")
+        return
+    for future in futures:
+        future.add_done_callback(_log_write_error)
+
+
+def _submit_flush() -> List[Future]:
+    """Снимает грязные коллекции и отложенные логи и пишет их одной транзакцией."""
+    global _flush_handle
+    with _write_lock:
+        if _flush_handle is not None:
+            _flush_handle.cancel()
+            _flush_handle = None
+        dirty = [name for name in ("devices", "users", "groups", "logs") if name in _dirty]
+        pending = list(_pending_logs)
+        _dirty.clear()
+        _pending_logs.clear()
+        if not dirty and not pending:
+            return []
+        return _submit_commit(dirty, pending)
+
+
+def flush() -> None:
+    """Барьер: записывает все грязные коллекции и отложенные логи одной пачкой."""
+    for future in _submit_flush():
+        future.result()
+
+
+async def flush_async() -> None:
+    """Асинхронный барьер: то же, что flush(), но без блокировки event loop."""
+    for future in _submit_flush():
+        await _await_writer(future)
+
+
+def shutdown() -> None:
+    """Сбрасывает отложенные записи и закрывает бэкенд (вызывается при остановке)."""
+    flush()
+    close()
+
+
+atexit.register(shutdown)
 
 
 def save_devices() -> None:
-    _save_json(DEVICES_FILE, devices)
+    _mark_dirty("devices")
 
 
 def save_users() -> None:
-    _save_json(USERS_FILE, users)
+    _mark_dirty("users")
 
 
 def save_logs() -> None:
-    _save_json(LOGS_FILE, logs)
+    """Полная запись логов (checkpoint: снапшоты коллекций и бакетов, WAL обнуляется)."""
+    _mark_dirty("logs")
 
 
 def save_groups() -> None:
-    _save_json(GROUPS_FILE, groups)
+    _mark_dirty("groups")
+
+
+async def save_devices_async() -> None:
+    await _mark_dirty_async("devices")
+
+
+async def save_users_async() -> None:
+    await _mark_dirty_async("users")
+
+
+async def save_logs_async() -> None:
+    await _mark_dirty_async("logs")
+
+
+async def save_groups_async() -> None:
+    await _mark_dirty_async("groups")
+
+
+def _log_entry(entry: Any) -> Any:
+    return LogEntry(entry) if isinstance(entry, dict) else entry
+
+
+def _submit_log(sn: str, entry: Dict[str, Any]) -> List[Future]:
+    entry = _log_entry(entry)
+    with _write_lock:
+        logs.append(sn, entry)
+        tx = _transaction.get()
+        if tx is not None:
+            tx.records.append((sn, entry))
+            return []
+        if _durability() == DURABILITY_BATCHED:
+            _pending_logs.append((sn, entry))
+            _schedule_flush()
+            return []
+        return _submit_commit((), [(sn, entry)])
+
+
+def append_log(sn: str, entry: Dict[str, Any]) -> None:
+    """Добавляет запись в историю устройства и дописывает ее в WAL.
+
+    Стоимость записи — одна строка, а не вся история. Когда в WAL
+    накапливается log_compact_every транзакций, делается checkpoint.
+    """
+    for future in _submit_log(sn, entry):
+        future.result()
+
+
+async def append_log_async(sn: str, entry: Dict[str, Any]) -> None:
+    for future in _submit_log(sn, entry):
+        await _await_writer(future)
+
+
+def checkpoint() -> None:
+    """Сворачивает WAL в снапшоты коллекций и логов (сразу, независимо от режима записи)."""
+    _submit_checkpoint().result()
+
+
+def compact_logs() -> None:
+    """Прежнее имя checkpoint(): журнал логов теперь часть WAL."""
+    checkpoint()
+
+
+# ---------- транзакции ----------
+
+
+class _Transaction:
+    __slots__ = ("collections", "records")
+
+    def __init__(self) -> None:
+        self.collections: set = set()
+        self.records: List[Tuple[str, Any]] = []
+
+
+_transaction: ContextVar[Optional[_Transaction]] = ContextVar("storage_transaction", default=None)
+
+
+def _submit_transaction(tx: _Transaction) -> List[Future]:
+    with _write_lock:
+        if _durability() == DURABILITY_BATCHED:
+            # Сброс пишет все отложенное одной транзакцией WAL
+            _dirty.update(tx.collections)
+            _pending_logs.extend(tx.records)
+            if tx.collections or tx.records:
+                _schedule_flush()
+            return []
+        return _submit_commit(tx.collections, tx.records)
+
+
+@contextmanager
+def transaction() -> Iterator[None]:
+    """Группирует save_*() и append_log() в одну запись на диск.
+
+    Изменение устройства и запись в его историю ложатся одной транзакцией
+    WAL: после сбоя нельзя получить бронь без записи в логе. Вложенная
+    транзакция присоединяется к внешней. Изменения в памяти не
+    откатываются, поэтому при исключении накопленное все равно пишется.
+    """
+    if _transaction.get() is not None:
+        yield
+        return
+    tx = _Transaction()
+    token = _transaction.set(tx)
+    try:
+        yield
+    finally:
+        _transaction.reset(token)
+        futures = _submit_transaction(tx)
+    for future in futures:
+        future.result()
+
+
+@asynccontextmanager
+async def transaction_async() -> AsyncIterator[None]:
+    """Асинхронный вариант transaction() для обработчиков."""
+    if _transaction.get() is not None:
+        yield
+        return
+    tx = _Transaction()
+    token = _transaction.set(tx)
+    try:
+        yield
+    finally:
+        _transaction.reset(token)
+        futures = _submit_transaction(tx)
+    for future in futures:
+        await _await_writer(future)
+
+
+# ---------- хранение истории ----------
+
+log_archive = LogArchive(LOGS_ARCHIVE_DIR)
+
+
+def _retention_limits() -> Optional[Tuple[Optional[datetime], int]]:
+    """(граница возраста, лимит записей на SN); None — хранение не ограничено."""
+    days = int(config.get("log_retention_days") or 0)
+    limit = int(config.get("max_entries_per_device") or 0)
+    if days <= 0 and limit <= 0:
+        return None
+    return (datetime.now() - timedelta(days=days) if days > 0 else None), limit
+
+
+def _collect_expired(
+    cutoff: Optional[datetime], limit: int
+) -> Tuple[Dict[str, Tuple[int, List[Any]]], Dict[str, bytes], int]:
+    """Проход по истории: что остается и что уходит в архив. История не меняется.
+
+    Бакеты читаются по одному и не попадают в кэш logs, поэтому проход можно
+    выполнять вне event loop. Возвращает (SN -> (длина истории при проходе,
+    остающиеся записи), закодированный архив, число записей для архива).
+    """
+    trimmed: Dict[str, Tuple[int, List[Any]]] = {}
+    expired: List[Tuple[str, Any]] = []
+    for _, bucket_logs in logs.scan():
+        for sn, entries in bucket_logs.items():
+            keep, old = split_expired(entries, cutoff, limit)
+            if old:
+                trimmed[sn] = (len(entries), keep)
+                expired.extend((sn, entry) for entry in old)
+    return trimmed, log_archive.encode(expired) if expired else {}, len(expired)
+
+
+def _submit_trim(trimmed: Dict[str, Tuple[int, List[Any]]]) -> Future:
+    """Урезает историю (архив уже записан) и делает checkpoint.
+
+    Записи, добавленные к SN во время прохода, сохраняются: история только
+    дописывается, поэтому они — хвост после запомненной длины.
+    """
+    with _write_lock:
+        for sn, (seen, keep) in trimmed.items():
+            current = logs.get(sn) or []
+            if len(current) < seen:
+                # История SN переписана во время прохода: урезать нечего
+                continue
+            logs[sn] = keep + list(current[seen:])
+        return _submit_checkpoint()
+
+
+def apply_log_retention() -> int:
+    """Переносит в архив записи старше log_retention_days и сверх max_entries_per_device.
+
+    Архив — gzip-файлы по месяцам в log_archive/ (см. libs/log_archive.py);
+    история урезается только после записи архива: если архив не записался,
+    исключение пробрасывается, а история остается целой. Возвращает число
+    перенесенных записей.
+    """
+    limits = _retention_limits()
+    if limits is None:
+        return 0
+    trimmed, archived, moved = _collect_expired(*limits)
+    if not moved:
+        return 0
+    _run_in_writer(log_archive.write, archived)
+    _submit_trim(trimmed).result()
+    logger.info("В архив логов перенесено записей: %s", moved)
+    return moved
+
+
+async def apply_log_retention_async() -> int:
+    """Как apply_log_retention; проход по истории выполняется в отдельном потоке."""
+    limits = _retention_limits()
+    if limits is None:
+        return 0
+    trimmed, archived, moved = await asyncio.to_thread(_collect_expired, *limits)
+    if not moved:
+        return 0
+    await _await_writer(_submit(log_archive.write, archived))
+    await _await_writer(_submit_trim(trimmed))
+    logger.info("В архив логов перенесено записей: %s", moved)
+    return moved
+
+
+def read_all_logs() -> List[Tuple[str, Any]]:
+    """Вся текущая история (sn, запись) для экспорта.
+
+    Бакеты читаются по одному и не попадают в кэш logs (см. LazyLogs.scan),
+    поэтому функцию можно вызывать из отдельного потока.
+    """
+    return [(sn, entry) for _, bucket_logs in logs.scan() for sn, entries in bucket_logs.items() for entry in entries]
+
+
+def read_log_archive(sn: Optional[str] = None) -> List[Tuple[str, Any]]:
+    """Записи из архива (для экспорта), при необходимости — только одного SN."""
+    return [
+        (entry_sn, _log_entry(entry))
+        for entry_sn, entry in log_archive.read()
+        if sn is None or entry_sn == sn
+    ]
@@ -0,0 +1,90 @@
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import booking
+import storage
+import utils
+
+
+def reload_modules(tmp_path: Path):
+    import os
+
+    os.environ["DATA_DIR"] = str(tmp_path)
+    importlib.reload(storage)
+    importlib.reload(utils)
+    storage.load_all()
+    storage.config["max_devices_per_user"] = 1
+    storage.devices.extend(
+        [
+            {"id": 1, "sn": "A1", "name": "Phone", "status": "free"},
+            {"id": 2, "sn": "A2", "name": "Tablet", "status": "free"},
+        ]
+    )
+
+
+async def _slow_log(sn, action):
+    # Запись в журнал уступает управление — как реальный await в обработчике
+    await asyncio.sleep(0.01)
+
+
+def test_concurrent_bookings_do_not_double_book(tmp_path: Path, monkeypatch):
+    reload_modules(tmp_path)
+    monkeypatch.setattr(utils, "log_action_async", _slow_log)
+    expiration = datetime.now() + timedelta(days=1)
+
+    async def scenario():
+        return await asyncio.gather(
+            booking.book(1, 100, expiration, "book"),
+            booking.book(1, 200, expiration, "book"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(r, booking.DeviceUnavailable) for r in results) == 1
+    device = utils.get_device_by_id(1)
+    assert device["status"] == "booked"
+    assert device["user_id"] in (100, 200)
+    storage.close()
+
+
+def test_booking_limit_is_checked_under_lock(tmp_path: Path, monkeypatch):
+    reload_modules(tmp_path)
+    monkeypatch.setattr(utils, "log_action_async", _slow_log)
+    expiration = datetime.now() + timedelta(days=1)
+
+    async def scenario():
+        return await asyncio.gather(
+            booking.book(1, 100, expiration, "book"),
+            booking.book(2, 100, expiration, "book"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(r, booking.BookingLimitReached) for r in results) == 1
+    assert len(utils.get_user_booked_devices(100)) == 1
+    storage.close()
+
+
+def test_release_and_transfer_compare_owner(tmp_path: Path):
+    reload_modules(tmp_path)
+    expiration = datetime.now() + timedelta(days=1)
+
+    async def scenario():
+        await booking.book(1, 100, expiration, "book")
+        with pytest.raises(booking.DeviceUnavailable):
+            await booking.release(1, "release", owner_id=200)
+        with pytest.raises(booking.DeviceUnavailable):
+            await booking.transfer(1, 200, 300, "transfer")
+        await booking.transfer(1, 100, 300, "transfer")
+        assert await booking.release_many([utils.get_device_by_id(1)], "release", owner_id=100) == []
+        await booking.release(1, "release", owner_id=300)
+
+    asyncio.run(scenario())
+    device = utils.get_device_by_id(1)
+    assert device["status"] == "free"
+    assert "user_id" not in device
+    storage.close()
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from libs.callback_router import CallbackData, CallbackRouter
+from libs.pagination import with_page
+
+CODES = {
+    "book_dev": "bd",
+    "admin_book_dev": "abd",
+    "admin_book_select": "abs",
+    "type": "ty",
+    "admin_type": "at",
+    "list_all_users": "lu",
+    "back_to_main": "bm",
+}
+
+
+def test_encode_and_parse_both_formats():
+    router = CallbackRouter(CODES)
+    router.route("type", None, rest=True)
+    assert router.encode("admin_book_select", 5, 7) == "1:abs:5:7"
+    assert router.parse("1:abs:5:7") == CallbackData("admin_book_select", ("5", "7"))
+    assert router.parse("1:bm") == CallbackData("back_to_main")
+    assert router.parse(router.encode("type", "Phone:Pro")) == CallbackData("type", ("Phone:Pro",))
+    with pytest.raises(ValueError):
+        router.encode("book_dev", "1:2")
+
+    # Старые кнопки: самый длинный известный префикс
+    assert router.parse("admin_book_select_5_7") == CallbackData("admin_book_select", ("5", "7"))
+    assert router.parse("admin_book_dev_9").action == "admin_book_dev"
+    assert router.parse("type_Smart_Watch") == CallbackData("type", ("Smart_Watch",))
+    assert router.parse("back_to_main") == CallbackData("back_to_main")
+    assert router.parse("1:zz:1") is None and router.parse("unknown_1") is None
+    assert router.parse("book_dev_12").ints() == (12,)
+    assert router.parse("book_dev_x").ints() is None
+
+
+def test_page_suffix_only_for_paged_actions():
+    router = CallbackRouter(CODES)
+    router.route("type", None, rest=True)
+    router.route("admin_type", None, rest=True, paged=True)
+    router.route("list_all_users", None, paged=True)
+
+    # "#" в имени типа — часть аргумента, а не номер страницы
+    rack = with_page(router.encode("admin_type", "Rack#2"), 0)
+    assert rack == "1:at:Rack#2#0"
+    assert router.parse(rack) == CallbackData("admin_type", ("Rack#2",), 0)
+    assert router.parse(with_page(router.encode("admin_type", "Rack#2"), 3)) == CallbackData(
+        "admin_type", ("Rack#2",), 3
+    )
+    assert router.parse(router.encode("type", "Rack#2")) == CallbackData("type", ("Rack#2",))
+    assert router.parse("1:lu#4") == CallbackData("list_all_users", (), 4)
+    # Кнопки, отправленные без суффикса, — первая страница
+    assert router.parse("1:at:Phone") == CallbackData("admin_type", ("Phone",), 0)
+    assert router.parse("1:lu") == CallbackData("list_all_users")
+
+
+def test_dispatch_sets_context_and_counts_calls():
+    ticks = iter([0.0, 0.5, 1.0, 1.25])
+    router = CallbackRouter(CODES, clock=lambda: next(ticks))
+    seen = []
+
+    async def book(update, context):
+        seen.append(context.callback)
+        if context.callback.args == ("0",):
+            raise RuntimeError("boom")
+
+    router.route("book_dev", book)
+    answered = []
+
+    async def answer():
+        answered.append(True)
+
+    def update(data):
+        return SimpleNamespace(callback_query=SimpleNamespace(data=data, answer=answer))
+
+    async def scenario():
+        await router.dispatch(update("1:bd:42"), SimpleNamespace())
+        with pytest.raises(RuntimeError):
+            await router.dispatch(update("book_dev_0"), SimpleNamespace())
+        await router.dispatch(update("1:bm"), SimpleNamespace())
+
+    asyncio.run(scenario())
+    assert seen[0] == CallbackData("book_dev", ("42",))
+    stats = router.stats["book_dev"]
+    assert (stats.calls, stats.errors, stats.total, stats.slowest) == (2, 1, 0.75, 0.5)
+    # Действие без обработчика: нажатие подтверждается, считается неизвестным
+    assert answered == [True] and router.unknown == 1
+    assert router.report()[0].startswith("book_dev: 2")
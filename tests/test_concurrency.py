@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import concurrency
+import storage
+
+
+def _update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_updates_are_parallel_across_chats_and_ordered_within_chat():
+    events = []
+    running = {"now": 0, "peak": 0}
+
+    async def handle(chat_id, seq):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        events.append((chat_id, seq))
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+
+    async def scenario():
+        processor = concurrency.ChatOrderedUpdateProcessor(4)
+        async with processor:
+            await asyncio.gather(
+                *(
+                    processor.process_update(_update(chat_id), handle(chat_id, seq))
+                    for seq in range(3)
+                    for chat_id in range(6)
+                )
+            )
+
+    asyncio.run(scenario())
+    assert running["peak"] == 4
+    for chat_id in range(6):
+        assert [seq for chat, seq in events if chat == chat_id] == [0, 1, 2]
+
+
+def test_heavy_limits_from_config():
+    storage.config["heavy_handler_limits"] = {"ocr": 1}
+    concurrency.reset_heavy_limits()
+    running = {"now": 0, "peak": 0}
+
+    async def ocr():
+        async with concurrency.heavy("ocr"):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(ocr() for _ in range(3)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        storage.config.pop("heavy_handler_limits", None)
+        concurrency.reset_heavy_limits()
+    assert running["peak"] == 1
@@ -0,0 +1,33 @@
+from libs.facet_counters import FacetCounters
+from libs.records import Device
+from libs.repository import Collection, empty_to_none
+
+
+def test_counters_follow_bookings_group_changes_and_removal():
+    counters = FacetCounters(normalizers={"group_id": empty_to_none}, default_type="Неизвестно")
+    devices = Collection(["id"], record_type=Device, key="id")
+    devices.add_listener(counters.observe)
+    devices.extend(
+        [
+            {"id": 1, "type": "Phone", "status": "free", "group_id": 1},
+            {"id": 2, "type": "Phone", "status": "free", "group_id": ""},
+            {"id": 3, "type": "Tablet", "status": "booked", "group_id": 2},
+            {"id": 4, "status": "free"},
+        ]
+    )
+    assert counters.by_type() == {"Phone": 2, "Tablet": 1, "Неизвестно": 1}
+    assert counters.by_type((None, 1)) == {"Phone": 2, "Неизвестно": 1}
+    assert counters.by_type((None, 2), status="free") == {"Phone": 1, "Неизвестно": 1}
+
+    first, third = devices.get_by("id", 1), devices.get_by("id", 3)
+    first["status"] = "booked"
+    third["group_id"] = 1
+    assert counters.by_type((1,), status="booked") == {"Phone": 1, "Tablet": 1}
+    assert counters.by_type((2,)) == {}
+    assert counters.total(status="free") == 2
+
+    devices.remove(third)
+    devices.extend([{"id": 5, "type": "Tablet", "status": "free", "group_id": 2}])
+    assert counters.by_type() == {"Phone": 2, "Tablet": 1, "Неизвестно": 1}
+    devices.clear()
+    assert counters.by_type() == {} and len(counters) == 0
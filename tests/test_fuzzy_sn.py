@@ -0,0 +1,36 @@
+from libs.fuzzy_sn import FuzzySerialIndex, levenshtein, sn_key
+from libs.repository import Collection
+
+
+def test_sn_key_and_levenshtein():
+    assert sn_key("sn-0O1 I5/b") == "5N001158"
+    assert sn_key(None) == ""
+    assert levenshtein("KITTEN", "SITTING") == 3
+    assert levenshtein("ABC", "ABC") == 0
+    assert levenshtein("", "ABC") == 3
+    assert levenshtein("ABCD", "ACD") == 1
+
+
+def test_lookup_ranks_and_follows_changes():
+    devices = Collection(("id",), key="id")
+    index = FuzzySerialIndex("sn", max_distance=1)
+    devices.add_listener(index.observe)
+    devices.extend(
+        [
+            {"id": 1, "sn": "R58N123ABC"},
+            {"id": 2, "sn": "R58N123AB"},
+            {"id": 3, "sn": "X99Q000111"},
+        ]
+    )
+
+    # OCR: 5->S, 8->B, пропущен символ
+    found = index.lookup("RSBN123ABC")
+    assert [(distance, device["id"]) for distance, device in found] == [(0, 1), (1, 2)]
+    assert [device["id"] for _, device in index.lookup("R58N12ABC")] == [1]
+    assert index.lookup("R58N99ABC") == []
+
+    first, second = devices.get_by("id", 1), devices.get_by("id", 2)
+    first["sn"] = "ZZZ"
+    assert [device["id"] for _, device in index.lookup("R58N123ABC")] == [2]
+    devices.remove(second)
+    assert index.lookup("R58N123ABC") == []
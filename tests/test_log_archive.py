@@ -0,0 +1,104 @@
+import gzip
+import importlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from libs.log_archive import LogArchive, split_expired
+
+
+def _entry(when: datetime, action: str = "book") -> dict:
+    return {"timestamp": when.strftime("%Y-%m-%d %H:%M:%S"), "action": action}
+
+
+def test_split_expired_by_age_and_count():
+    now = datetime(2024, 6, 1)
+    entries = [_entry(now - timedelta(days=d)) for d in (400, 100, 10, 1)] + [{"action": "no timestamp"}]
+
+    keep, old = split_expired(entries, cutoff=now - timedelta(days=365))
+    assert old == entries[:1]
+    assert keep == entries[1:]
+
+    keep, old = split_expired(entries, cutoff=now - timedelta(days=365), max_entries=2)
+    assert old == entries[:3]
+    assert keep == entries[3:]
+
+
+def test_archive_appends_monthly_gzip_and_skips_torn_tail(tmp_path: Path):
+    archive = LogArchive(str(tmp_path))
+    archive.append([("SN1", _entry(datetime(2024, 1, 5))), ("SN2", _entry(datetime(2024, 2, 5)))])
+    archive.append([("SN1", _entry(datetime(2024, 1, 6), "release"))])
+
+    assert archive.months() == ["2024-01", "2024-02"]
+    with gzip.open(tmp_path / "device_logs-2024-01.jsonl.gz", "rt", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+
+    with open(tmp_path / "device_logs-2024-01.jsonl.gz", "ab") as f:
+        f.write(gzip.compress(b'{"sn": "SN1"}\n')[:12])
+    assert [(sn, e["action"]) for sn, e in archive.read(["2024-01"])] == [("SN1", "book"), ("SN1", "release")]
+
+
+def test_retention_moves_old_entries_to_archive(tmp_path: Path, monkeypatch):
+    import storage
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    storage.load_all()
+
+    now = datetime.now()
+    storage.append_log("SN1", _entry(now - timedelta(days=90), "old"))
+    storage.append_log("SN1", _entry(now, "new"))
+    # По умолчанию архивирование выключено
+    assert storage.apply_log_retention() == 0
+    assert len(storage.logs["SN1"]) == 2
+
+    storage.config["log_retention_days"] = 30
+    assert storage.apply_log_retention() == 1
+    assert storage.apply_log_retention() == 0
+
+    storage.load_all()
+    assert [e["action"] for e in storage.logs["SN1"]] == ["new"]
+    assert [(sn, e["action"]) for sn, e in storage.read_log_archive()] == [("SN1", "old")]
+    storage.close()
+
+
+def test_failed_archive_write_keeps_history(tmp_path: Path, monkeypatch):
+    import asyncio
+
+    import pytest
+    import storage
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    storage.load_all()
+    storage.config["log_retention_days"] = 30
+    storage.config["max_entries_per_device"] = 0
+
+    now = datetime.now()
+    storage.append_log("SN1", _entry(now - timedelta(days=90), "old"))
+    storage.append_log("SN1", _entry(now, "new"))
+    for i in range(20):
+        storage.append_log(f"SN{i + 2}", _entry(now, "fresh"))
+    storage._submit_checkpoint().result()
+
+    def broken_write(payload):
+        raise OSError("disk full")
+
+    real_write = storage.log_archive.write
+    monkeypatch.setattr(storage.log_archive, "write", broken_write)
+    with pytest.raises(OSError):
+        storage.apply_log_retention()
+    storage._submit_checkpoint().result()
+    storage.load_all()
+    assert [e["action"] for e in storage.logs["SN1"]] == ["old", "new"]
+    assert storage.read_log_archive() == []
+
+    # Проход по истории не заполняет кэш: загружается только урезанный бакет
+    monkeypatch.setattr(storage.log_archive, "write", real_write)
+    storage.load_all()
+    storage.config["log_retention_days"] = 30
+    assert asyncio.run(storage.apply_log_retention_async()) == 1
+    assert storage.logs.cached_buckets() == [storage.logs.bucket_of("SN1")]
+    storage.load_all()
+    assert [e["action"] for e in storage.logs["SN1"]] == ["new"]
+    assert [(sn, e["action"]) for sn, e in storage.read_log_archive()] == [("SN1", "old")]
+    storage.close()
@@ -0,0 +1,65 @@
+import importlib
+import json
+from pathlib import Path
+
+from libs.log_journal import LogJournal
+
+
+def test_journal_append_and_replay(tmp_path: Path):
+    journal = LogJournal(str(tmp_path / "device_logs.json"))
+    journal.append("SN1", {"action": "book"})
+    journal.append("SN2", {"action": "book"})
+    journal.append("SN1", {"action": "release"})
+    journal.close()
+
+    lines = (tmp_path / "device_logs.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3
+
+    reloaded = LogJournal(str(tmp_path / "device_logs.json"))
+    assert reloaded.load() == {
+        "SN1": [{"action": "book"}, {"action": "release"}],
+        "SN2": [{"action": "book"}],
+    }
+    assert reloaded.pending == 3
+
+
+def test_journal_compaction_and_torn_tail(tmp_path: Path):
+    journal = LogJournal(str(tmp_path / "device_logs.json"))
+    journal.append("SN1", {"action": "book"})
+    journal.compact({"SN1": [{"action": "book"}]})
+    assert (tmp_path / "device_logs.jsonl").read_text(encoding="utf-8") == ""
+    assert json.loads((tmp_path / "device_logs.json").read_text(encoding="utf-8")) == {"SN1": [{"action": "book"}]}
+
+    journal.append("SN1", {"action": "release"})
+    journal.close()
+    # Имитируем обрыв записи после сбоя
+    with open(tmp_path / "device_logs.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"sn": "SN1", "ent')
+
+    assert LogJournal(str(tmp_path / "device_logs.json")).load() == {
+        "SN1": [{"action": "book"}, {"action": "release"}]
+    }
+
+
+def test_log_action_appends_one_line(tmp_path: Path, monkeypatch):
+    import storage
+    import utils
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    importlib.reload(utils)
+    storage.load_all()
+
+    utils.log_action("SN1", "Забронировано")
+    utils.log_action("SN1", "Освобождено")
+
+    assert not (tmp_path / "device_logs.json").exists()
+    assert len((tmp_path / "storage.wal").read_text(encoding="utf-8").splitlines()) == 2
+
+    storage.logs.clear()
+    storage.load_all()
+    assert [e["action"] for e in storage.logs["SN1"]] == ["Забронировано", "Освобождено"]
+    # WAL свернут в снапшоты при загрузке
+    assert (tmp_path / "device_logs.json").exists()
+    assert (tmp_path / "storage.wal").read_text(encoding="utf-8") == ""
+    storage.close()
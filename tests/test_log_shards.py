@@ -0,0 +1,85 @@
+import importlib
+import json
+from pathlib import Path
+
+from libs.log_shards import LazyLogs, ShardedLogFiles
+
+
+def _files(tmp_path: Path, buckets: int = 8) -> ShardedLogFiles:
+    return ShardedLogFiles(
+        str(tmp_path / "device_logs.json"),
+        str(tmp_path / "device_logs.jsonl"),
+        str(tmp_path / "device_logs"),
+        buckets=buckets,
+    ).open()
+
+
+def test_legacy_snapshot_is_split_into_buckets(tmp_path: Path):
+    legacy = {f"SN{i}": [{"action": "book"}] for i in range(20)}
+    (tmp_path / "device_logs.json").write_text(json.dumps(legacy), encoding="utf-8")
+    (tmp_path / "device_logs.jsonl").write_text(
+        json.dumps({"sn": "SN1", "entry": {"action": "release"}}) + "\n", encoding="utf-8"
+    )
+
+    files = _files(tmp_path)
+    manifest = json.loads((tmp_path / "device_logs.json").read_text(encoding="utf-8"))
+    assert manifest["format"] == "sharded-v1"
+    assert not (tmp_path / "device_logs.jsonl").exists()
+    assert files.read_all()["SN1"] == [{"action": "book"}, {"action": "release"}]
+    assert len(files.read_all()) == 20
+
+
+def test_lazy_logs_load_on_demand_and_evict(tmp_path: Path):
+    files = _files(tmp_path)
+    shards = {}
+    for i in range(40):
+        shards.setdefault(files.bucket_of(f"SN{i}"), {})[f"SN{i}"] = [{"action": "book"}] * 10
+    files.write_snapshot(files.encode_snapshot(shards, 0))
+
+    logs = LazyLogs(max_entries=100)
+    logs.bind(_files(tmp_path))
+    assert logs.cached_entries() == 0
+    assert len(logs["SN3"]) == 10
+    assert len(logs.cached_buckets()) == 1
+
+    for i in range(40):
+        assert len(logs[f"SN{i}"]) == 10
+    assert logs.cached_entries() <= 100
+
+    # Бакет с несохраненной записью не вытесняется
+    logs.append("SN0", {"action": "release"})
+    pinned = logs.bucket_of("SN0")
+    for i in range(40):
+        logs[f"SN{i}"]
+    assert pinned in logs.cached_buckets()
+    logs.mark_durable([pinned], logs.checkpoint(), snapshot=False)
+    for i in range(40):
+        if logs.bucket_of(f"SN{i}") != pinned:
+            logs[f"SN{i}"]
+    assert pinned not in logs.cached_buckets()
+
+
+def test_storage_reads_logs_lazily(tmp_path: Path, monkeypatch):
+    import storage
+    import utils
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    importlib.reload(utils)
+    storage.load_all()
+    storage.config["log_compact_every"] = 0
+
+    for i in range(30):
+        utils.log_action(f"SN{i}", "Забронировано")
+    storage.compact_logs()
+    assert (tmp_path / "device_logs").is_dir()
+
+    storage.load_all()
+    assert storage.logs.cached_buckets() == []
+    assert [e["action"] for e in storage.logs["SN7"]] == ["Забронировано"]
+    assert len(storage.logs.cached_buckets()) == 1
+    # Экспорт читает всю историю, не заполняя кэш
+    assert sorted(sn for sn, _ in storage.read_all_logs()) == sorted(f"SN{i}" for i in range(30))
+    assert len(storage.logs.cached_buckets()) == 1
+    assert sorted(storage.logs) == sorted(f"SN{i}" for i in range(30))
+    storage.close()
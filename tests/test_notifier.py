@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from libs.notifier import Notifier, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RetryAfter(Exception):
+    def __init__(self, seconds: float) -> None:
+        super().__init__(f"retry after {seconds}")
+        self.retry_after = seconds
+
+
+def test_token_bucket_spaces_out_bursts():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now = 10.0
+    assert bucket.reserve() == 0.0
+    bucket.pause(3)
+    assert bucket.reserve() == 3.5
+
+
+def test_notifier_coalesces_and_limits_per_chat():
+    clock = FakeClock()
+    notifier = Notifier(rate=100, per_chat_interval=1.0, clock=clock)
+    assert notifier.enqueue(1, "hello")
+    assert not notifier.enqueue(1, "hello")
+    assert notifier.enqueue(2, "hello")
+    assert notifier.enqueue(1, "other", key="k")
+    assert not notifier.enqueue(1, "changed", key="k")
+    assert len(notifier) == 3
+
+    # Слоты в один чат — через per_chat_interval, в разные чаты — сразу
+    first, _ = notifier._take()
+    second, _ = notifier._take()
+    assert [(first.chat_id, first.text), (second.chat_id, second.text)] == [(1, "hello"), (2, "hello")]
+    assert notifier._take() == (None, None)  # чат 1 занят отправкой
+    notifier._release(1)
+    assert notifier._take() == (None, 1.0)
+    clock.now = 1.0
+    third, _ = notifier._take()
+    assert (third.chat_id, third.text) == (1, "other")
+    assert len(notifier) == 0
+
+
+def test_notifier_retries_after_flood_wait_and_reports():
+    sent = []
+    failures = {"flaky": 1}
+    done = []
+
+    async def send(chat_id, text, **kwargs):
+        if failures.get(text):
+            failures[text] -= 1
+            raise RetryAfter(0.01)
+        if text == "broken":
+            raise ValueError("chat not found")
+        sent.append((chat_id, text, kwargs))
+
+    async def scenario():
+        notifier = Notifier(rate=1000, per_chat_interval=0, concurrency=2)
+        notifier.enqueue(1, "flaky", on_done=done.append)
+        notifier.enqueue(2, "plain", parse_mode="Markdown")
+        notifier.enqueue(3, "broken", on_done=done.append)
+        notifier.start(send)
+        await notifier.stop(timeout=2)
+
+    asyncio.run(scenario())
+    assert sorted(sent) == [(1, "flaky", {}), (2, "plain", {"parse_mode": "Markdown"})]
+    assert len(done) == 2
+    assert None in done
+    assert any(isinstance(error, ValueError) for error in done)
+
+
+def test_burst_to_one_chat_does_not_delay_other_chats():
+    sent = []
+
+    async def send(chat_id, text, **kwargs):
+        sent.append((chat_id, text, time.monotonic()))
+
+    async def scenario():
+        notifier = Notifier(rate=1000, per_chat_interval=0.1, concurrency=2)
+        for number in range(5):
+            notifier.enqueue("A", f"a{number}")
+        notifier.enqueue("B", "b")
+        started = time.monotonic()
+        notifier.start(send)
+        await notifier.stop(timeout=3)
+        return started
+
+    started = asyncio.run(scenario())
+    assert [text for _, text, _ in sent] == ["a0", "b", "a1", "a2", "a3", "a4"]
+    # Сообщение в чат B уходит сразу, серия в чат A — с интервалом чата
+    assert sent[1][2] - started < 0.05
+    times_a = [at for chat, _, at in sent if chat == "A"]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times_a, times_a[1:]))
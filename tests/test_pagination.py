@@ -0,0 +1,43 @@
+from libs.pagination import page_buttons, page_of, split_page, with_page
+from libs.repository import Collection
+from libs.sorted_view import SortedView
+
+
+def test_page_math_and_callback_encoding():
+    page = page_of(45, 2, 20)
+    assert (page.number, page.count, page.start, page.stop) == (2, 3, 40, 45)
+    assert page_of(45, 99, 20).number == 2
+    assert page_of(0, 0, 20).count == 1
+
+    assert with_page("1:at:Phone", 0) == "1:at:Phone#0"
+    assert split_page(with_page("1:at:Rack#2", 0)) == ("1:at:Rack#2", 0)
+    assert split_page(with_page("admin_type_Phone", 3)) == ("admin_type_Phone", 3)
+    assert split_page("toggle_group_user_1_2") == ("toggle_group_user_1_2", 0)
+
+    assert page_buttons("x", page_of(10, 0, 20)) == []
+    assert [data for _, data in page_buttons("x", page_of(100, 2, 20))] == ["x#0", "x#1", "x#2", "x#3", "x#4"]
+    assert [data for _, data in page_buttons("x", page_of(100, 0, 20))] == ["x#0", "x#1", "x#4"]
+
+
+def test_sorted_view_follows_collection_and_slices_by_prefix():
+    devices = Collection(["id"], key="id")
+    view = SortedView(lambda d: (d.get("type") or "", d.get("id") or 0))
+    devices.add_listener(view.observe)
+    devices.extend(
+        [
+            {"id": 3, "type": "Phone"},
+            {"id": 1, "type": "Tab"},
+            {"id": 2, "type": "Phone"},
+            {"id": 4, "type": "Phone"},
+        ]
+    )
+    start, stop = view.bounds("Phone")
+    assert [d["id"] for d in view.slice(start, stop)] == [2, 3, 4]
+    assert [d["id"] for d in view.slice(start + 1, start + 2)] == [3]
+
+    devices.get_by("id", 3)["type"] = "Tab"
+    devices.remove(devices.get_by("id", 4))
+    assert [d["id"] for d in view.slice(*view.bounds("Phone"))] == [2]
+    assert [d["id"] for d in view.slice(*view.bounds("Tab"))] == [1, 3]
+    assert view.bounds("Watch")[0] == view.bounds("Watch")[1]
+    assert len(view) == 3
@@ -0,0 +1,50 @@
+from libs.principals import PrincipalCache
+from libs.records import Group, User
+from libs.repository import Collection
+
+
+def _cache():
+    users = Collection(["user_id", "group_id"], record_type=User, key="user_id")
+    groups = Collection(["id"], record_type=Group, key="id")
+    cache = PrincipalCache(users, groups, admin_ids=[100])
+    users.add_listener(cache.observe)
+    groups.add_listener(cache.observe_group)
+    groups.extend([{"id": 1, "name": "QA"}])
+    users.extend(
+        [
+            {"user_id": 1, "role": "User", "status": "pending", "group_id": 1},
+            {"user_id": 2, "role": "Admin", "status": "active"},
+        ]
+    )
+    return cache, users, groups
+
+
+def test_principal_follows_user_changes():
+    cache, users, _ = _cache()
+    first = cache.get(1)
+    assert first.status == "pending" and not first.is_admin and first.group_id == 1
+    assert cache.get(1) is first and cache.get(2).is_admin
+
+    # Одобрение, смена роли и удаление сбрасывают элемент кэша
+    users.get_by("user_id", 1)["status"] = "active"
+    assert cache.get(1).status == "active"
+    users.get_by("user_id", 1)["role"] = "Admin"
+    assert cache.get(1).is_admin
+    users.remove(users.get_by("user_id", 2))
+    assert cache.get(2).user is None and not cache.get(2).is_admin
+
+    # Незарегистрированный из admin_ids — администратор, но не кэшируется
+    assert cache.get(100).is_admin and cache.get(100).user is None
+    assert set(cache._cache) == {1}
+
+
+def test_admin_ids_and_group_changes_reset_cache():
+    cache, users, groups = _cache()
+    assert not cache.get(1).is_admin
+    cache.admin_ids = [1]
+    assert cache.admin_ids == frozenset({1}) and cache.get(1).is_admin
+
+    groups.remove(groups.get_by("id", 1))
+    assert cache.get(1).group is None and cache.get(1).group_id is None
+    users.get_by("user_id", 1)["user_id"] = 3
+    assert cache.get(1).user is None and cache.get(3).user_id == 3
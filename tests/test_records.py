@@ -0,0 +1,50 @@
+import importlib
+import json
+from pathlib import Path
+
+from libs.records import MISSING, Device, DeviceStatus, LogEntry, json_default
+
+
+def reload_storage(tmp_path: Path, monkeypatch):
+    import storage
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    return storage
+
+
+def test_device_behaves_like_dict():
+    device = Device({"id": 1, "sn": "SN1", "status": "free", "custom": [1, 2]})
+
+    assert device == {"id": 1, "sn": "SN1", "status": "free", "custom": [1, 2]}
+    assert device.status is DeviceStatus.FREE
+    assert f"{device.status}" == "free"
+    assert "user_id" not in device and device.user_id is MISSING and not device.user_id
+    assert device.get("user_id", 5) == 5
+
+    device["user_id"] = 7
+    assert device.pop("user_id") == 7
+    assert "user_id" not in device
+    assert not hasattr(device, "__dict__")
+    assert json.loads(json.dumps(device, default=json_default)) == device.to_dict()
+
+
+def test_records_roundtrip_through_storage(tmp_path: Path, monkeypatch):
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+
+    raw = {"id": 1, "name": "Pixel", "sn": "A1", "type": "Phone", "status": "booked", "user_id": 3, "note": "x"}
+    storage.devices.append(raw)
+    storage.users.append({"user_id": 3, "role": "User", "status": "active", "phone": ""})
+    storage.save_devices()
+    storage.save_users()
+    storage.append_log("A1", {"timestamp": "2024-01-01 10:00:00", "action": "book"})
+
+    storage.load_all()
+    assert storage.devices == [raw]
+    assert isinstance(storage.devices[0], Device)
+    assert storage.devices.get_by("status", "booked")["id"] == 1
+    assert storage.users[0]["phone"] == ""
+    assert isinstance(storage.logs["A1"][0], LogEntry)
+    assert json.loads((tmp_path / "devices.json").read_text(encoding="utf-8")) == [raw]
+    storage.close()
@@ -0,0 +1,80 @@
+import copy
+import json
+
+from libs.repository import Collection, casefold_key, empty_to_none
+
+
+def make_devices():
+    return Collection(
+        ("id", "sn", "user_id", "group_id", "status"),
+        {"sn": casefold_key, "group_id": empty_to_none},
+        [
+            {"id": 1, "sn": "Ab1", "status": "free", "group_id": 1},
+            {"id": 2, "sn": "CD2", "status": "booked", "user_id": 7},
+            {"id": 3, "sn": "ef3", "status": "booked", "user_id": 7, "group_id": 1},
+        ],
+    )
+
+
+def test_lookups_follow_in_place_mutations():
+    devices = make_devices()
+
+    assert devices.get_by("id", 2)["sn"] == "CD2"
+    assert devices.get_by("sn", "ab1")["id"] == 1
+    assert [d["id"] for d in devices.find_by("user_id", 7)] == [2, 3]
+    assert [d["id"] for d in devices.find_by("group_id", None)] == [2]
+
+    device = devices.get_by("id", 2)
+    device["status"] = "free"
+    device.pop("user_id")
+    assert [d["id"] for d in devices.find_by("status", "free")] == [1, 2]
+    assert [d["id"] for d in devices.find_by("user_id", 7)] == [3]
+
+    devices.get_by("id", 1).update(sn="NEW")
+    assert devices.get_by("sn", "ab1") is None
+    assert devices.get_by("sn", "new")["id"] == 1
+
+
+def test_list_mutations_keep_indexes():
+    devices = make_devices()
+
+    removed = devices.get_by("id", 1)
+    devices.remove(removed)
+    removed["status"] = "booked"
+    assert devices.get_by("id", 1) is None
+    assert devices.count_by("status", "booked") == 2
+
+    devices.append({"id": 4, "sn": "X", "status": "free"})
+    del devices[0]
+    assert devices.get_by("id", 2) is None
+    assert [d["id"] for d in devices] == [3, 4]
+
+    devices.clear()
+    assert devices.find_by("status", "booked", "free") == []
+
+
+def test_collection_stays_plain_json():
+    devices = make_devices()
+
+    assert devices == json.loads(json.dumps(devices))
+    snapshot = copy.deepcopy(devices)
+    assert type(snapshot) is list and type(snapshot[0]) is dict
+    snapshot[0]["id"] = 100
+    assert devices.get_by("id", 1) is not None
+
+
+def test_drain_changes_tracks_touched_and_deleted_records():
+    devices = Collection(["id", "sn"], key="id", records=[{"id": 1, "sn": "A"}, {"id": 2, "sn": "B"}])
+    devices.mark_clean()
+    assert not devices.drain_changes()
+
+    devices.get_by("id", 2)["sn"] = "C"
+    devices.append({"id": 3, "sn": "D"})
+    devices.remove(devices.get_by("id", 1))
+    changes = devices.drain_changes()
+    assert not changes.full
+    assert [r["id"] for r in changes.upserts] == [2, 3]
+    assert changes.deletes == [1]
+
+    devices.sort(key=lambda r: r["sn"], reverse=True)
+    assert devices.drain_changes().full
@@ -0,0 +1,26 @@
+from libs.result_cursor import ResultCursor
+
+
+def test_pages_are_computed_lazily_and_cached():
+    pulled = []
+
+    def source():
+        for i in range(25):
+            pulled.append(i)
+            yield i
+
+    cursor = ResultCursor(source(), page_size=10)
+    assert cursor.page(0) == list(range(10))
+    assert len(pulled) == 10
+    assert cursor.total() is None
+    assert cursor.has_page(1)
+    assert len(pulled) == 11
+
+    assert cursor.page(2) == [20, 21, 22, 23, 24]
+    assert not cursor.has_page(3)
+    assert cursor.total() == 25
+    # Уже вычисленные страницы не пересчитываются
+    assert cursor.page(1) == list(range(10, 20))
+    assert len(pulled) == 25
+    assert cursor.page(5) == [] and cursor.page(-1) == []
+    assert ResultCursor([]).token != cursor.token
@@ -0,0 +1,59 @@
+import importlib
+import json
+from pathlib import Path
+
+from libs.sqlite_store import SqliteStore
+
+
+def reload_storage(tmp_path: Path, monkeypatch):
+    """Reload storage module with isolated DATA_DIR and SQLite backend."""
+    import storage
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    importlib.reload(storage)
+    return storage
+
+
+def test_sqlite_roundtrip_through_storage(tmp_path: Path, monkeypatch):
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+
+    storage.devices.append({"id": 1, "sn": "SN1", "status": "free"})
+    storage.logs["SN1"] = [{"timestamp": "2024-01-01 10:00:00", "action": "test"}]
+    storage.save_devices()
+    storage.save_logs()
+
+    storage.devices.clear()
+    storage.logs.clear()
+    storage.load_all()
+    assert storage.devices == [{"id": 1, "sn": "SN1", "status": "free"}]
+    assert storage.logs == {"SN1": [{"timestamp": "2024-01-01 10:00:00", "action": "test"}]}
+    assert (tmp_path / "storage.sqlite3").exists()
+    assert not (tmp_path / "devices.json").exists()
+    storage.close()
+
+
+def test_sqlite_store_writes_only_changed_rows(tmp_path: Path):
+    store = SqliteStore(str(tmp_path / "db.sqlite3"))
+    devices = [{"id": i, "sn": f"SN{i}", "status": "free"} for i in range(100)]
+    store.save("devices", devices)
+
+    devices[42]["status"] = "booked"
+    before = store._conn.total_changes
+    store.save("devices", devices)
+    assert store._conn.total_changes - before == 1
+
+    del devices[0]
+    store.save("devices", devices)
+    assert store.count_rows("devices") == 99
+    assert store.load("devices", [])[41] == {"id": 42, "sn": "SN42", "status": "booked"}
+    store.close()
+
+
+def test_sqlite_backend_imports_existing_json(tmp_path: Path, monkeypatch):
+    (tmp_path / "devices.json").write_text(json.dumps([{"id": 7, "sn": "OLD"}]), encoding="utf-8")
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+    assert storage.devices == [{"id": 7, "sn": "OLD"}]
+    storage.close()
@@ -20,8 +20,9 @@ def test_storage_roundtrip(tmp_path: Path):
     storage.devices.clear()
     storage.devices.append({"id": 1, "sn": "SN1"})
     storage.save_devices()
+    assert not (tmp_path / "devices.json").exists()
 
-    # Перезагружаем и убеждаемся, что данные на месте
+    # Перезагружаем (снапшот + WAL) и убеждаемся, что данные на месте
     storage.devices.clear()
     storage.load_all()
     assert storage.devices == [{"id": 1, "sn": "SN1"}]
@@ -36,3 +37,136 @@ def test_atomic_write_creates_dir(tmp_path: Path):
     storage.save_logs()
 
     assert (storage_dir / "device_logs.json").exists()
+
+
+def test_batched_mode_coalesces_writes(tmp_path: Path, monkeypatch):
+    storage = reload_storage(tmp_path)
+    storage.load_all()
+    storage.config["storage_durability"] = "batched"
+    storage.config["storage_flush_interval"] = 60
+
+    fsyncs = []
+    real_fsync = storage.os.fsync
+    monkeypatch.setattr(storage.os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+
+    for i in range(50):
+        storage.devices.append({"id": i, "sn": f"SN{i}", "status": "booked"})
+        storage.save_devices()
+        storage.append_log(f"SN{i}", {"action": "book"})
+
+    assert not (tmp_path / "devices.json").exists()
+    assert fsyncs == []
+
+    storage.flush()
+    # Устройства и логи — одна транзакция WAL, один fsync
+    assert len(fsyncs) == 1
+
+    storage.devices.clear()
+    storage.logs.clear()
+    storage.load_all()
+    assert len(storage.devices) == 50
+    assert storage.logs["SN49"] == [{"action": "book"}]
+    storage.close()
+
+
+def test_async_save_writes_snapshot_in_writer_thread(tmp_path: Path, monkeypatch):
+    import asyncio
+    import json
+    import threading
+
+    storage = reload_storage(tmp_path)
+    storage.load_all()
+
+    writer_threads = []
+    real_write = storage.WriteAheadLog.write
+
+    def tracking_write(self, payload):
+        writer_threads.append(threading.current_thread().name)
+        real_write(self, payload)
+
+    monkeypatch.setattr(storage.WriteAheadLog, "write", tracking_write)
+
+    async def scenario():
+        storage.devices.append({"id": 1, "sn": "SN1", "status": "free"})
+        await storage.save_devices_async()
+        first = json.loads((tmp_path / "storage.wal").read_text(encoding="utf-8").splitlines()[0])
+        storage.devices[0]["status"] = "booked"
+        await storage.save_devices_async()
+        await storage.append_log_async("SN1", {"action": "book"})
+        return first
+
+    first = asyncio.run(scenario())
+
+    assert first["ops"] == [{"c": "devices", "put": {"id": 1, "sn": "SN1", "status": "free"}}]
+    assert writer_threads and all(name.startswith("storage-writer") for name in writer_threads)
+    assert threading.current_thread().name not in writer_threads
+
+    storage.devices.clear()
+    storage.load_all()
+    assert storage.devices[0]["status"] == "booked"
+    assert storage.logs["SN1"] == [{"action": "book"}]
+    storage.close()
+
+
+def test_storage_format_migrates_pretty_files(tmp_path: Path):
+    import json
+
+    devices = [{"id": 1, "sn": "SN1", "status": "free"}]
+    (tmp_path / "devices.json").write_text(json.dumps(devices, indent=4), encoding="utf-8")
+    storage = reload_storage(tmp_path)
+    storage.load_all()
+    assert storage.devices == devices
+
+    storage.config["storage_format"] = "json"
+    storage.close()
+    storage.checkpoint()
+    raw = (tmp_path / "devices.json").read_bytes()
+    assert b"\n" not in raw and b" " not in raw
+    storage.load_all()
+    assert storage.devices == devices
+    storage.close()
+
+
+def test_msgpack_format_is_detected_on_load(tmp_path: Path):
+    pytest.importorskip("msgpack")
+    storage = reload_storage(tmp_path)
+    storage.load_all()
+    storage.config["storage_format"] = "msgpack"
+    storage.close()
+    storage.devices.append({"id": 1, "sn": "SN1"})
+    storage.checkpoint()
+
+    assert (tmp_path / "devices.json").read_bytes()[:1] == b"\x91"
+    storage.load_all()
+    assert storage.devices == [{"id": 1, "sn": "SN1"}]
+    storage.close()
+
+
+def test_reload_config_swaps_settings(tmp_path: Path):
+    import json
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"bot_token": "A", "device_types": ["Phone"]}), encoding="utf-8")
+    storage = reload_storage(tmp_path)
+    storage.load_all()
+    storage.devices.append({"id": 1, "sn": "SN1", "type": "Scanner"})
+    assert storage.is_device_type("Phone") and storage.is_device_type("Scanner")
+    assert not storage.is_device_type("Laptop") and not storage.config_changed_on_disk()
+
+    config_file.write_text(
+        json.dumps({"bot_token": "B", "device_types": ["Phone", "Laptop"], "sn_fuzzy_max_distance": 2}),
+        encoding="utf-8",
+    )
+    assert storage.config_changed_on_disk()
+    changed, pending = storage.reload_config()
+    assert changed == ["device_types", "sn_fuzzy_max_distance"] and pending == ["bot_token"]
+    assert storage.config["bot_token"] == "A" and storage.is_device_type("Laptop")
+    assert storage.sn_fuzzy.max_distance == 2 and storage.sn_fuzzy.lookup("SN1")
+    assert not storage.config_changed_on_disk()
+
+    # Поврежденный файл: ошибка, прежние настройки остаются
+    previous = storage.config
+    config_file.write_text("{broken", encoding="utf-8")
+    with pytest.raises(ValueError):
+        storage.reload_config()
+    assert storage.config is previous
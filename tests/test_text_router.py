@@ -0,0 +1,47 @@
+from libs.text_router import TextRouter
+
+
+async def go_back(update, context):
+    return "back"
+
+
+async def release(update, context):
+    return "release"
+
+
+async def release_all(update, context):
+    return "release_all"
+
+
+def test_exact_labels_before_patterns():
+    router = TextRouter()
+    router.exact("Назад", handler=go_back)
+    router.exact("Освободить все устройства", handler=release_all)
+    router.exact("Назад", handler=release)  # первая регистрация остается
+    types = {"Phone"}
+    router.members(types.__contains__, handler=release_all)
+    router.pattern(r"^Освободить .* \(SN: (.*?)\)$", release)
+
+    assert router.resolve("Назад") == (go_back, None)
+    assert router.resolve("Phone") == (release_all, None) and router.resolve("Tablet") is None
+    types.add("Tablet")  # набор читается на каждом сообщении
+    assert router.resolve("Tablet") == (release_all, None)
+    assert router.resolve("Освободить все устройства") == (release_all, None)
+    handler, match = router.resolve("Освободить Pixel (SN: ABC123)")
+    assert handler is release and match.group(1) == "ABC123"
+    assert len(router) == 4
+
+
+def test_unmatched_text_falls_through():
+    router = TextRouter()
+    router.exact("Назад", handler=go_back)
+    router.pattern(r"^(add|del).*$", release)
+
+    assert router.resolve("назад") is None
+    assert router.resolve("Назад ") is None
+    assert router.resolve("Иван Петров") is None
+    assert router.resolve("") is None and router.resolve(None) is None
+    assert [(kind, str(getattr(label, "pattern", label))) for kind, label, _ in router.routes()] == [
+        ("exact", "Назад"),
+        ("pattern", "^(add|del).*$"),
+    ]
@@ -0,0 +1,66 @@
+from libs.records import Device
+from libs.repository import Collection
+from libs.trigram_index import TrigramIndex
+
+
+def _devices():
+    index = TrigramIndex(("name", "type", "sn"))
+    devices = Collection(["id", "sn"], record_type=Device, key="id")
+    devices.add_listener(index.observe)
+    devices.extend(
+        [
+            {"id": 1, "name": "Pixel 7", "type": "Phone", "sn": "PX7-001"},
+            {"id": 2, "name": "Galaxy Tab", "type": "Tablet", "sn": "GT-777"},
+            {"id": 3, "name": "ThinkPad", "type": "PC", "sn": None},
+        ]
+    )
+    return devices, index
+
+
+def _ids(records):
+    return [r["id"] for r in records]
+
+
+def test_substring_search_matches_any_field_in_list_order():
+    devices, index = _devices()
+    assert _ids(index.search("ta")) == [2]
+    assert _ids(index.search("pad")) == [3]
+    assert _ids(index.search("77")) == [2]
+    assert _ids(index.search("px7")) == [1]
+    assert _ids(index.search("p")) == [1, 3]
+    assert index.search("xyz") == []
+    # Все n-граммы есть, но подстроки нет
+    assert index.search("PIXEL 7 PHONE") == []
+    assert _ids(index.search("7", fields=("sn",))) == [1, 2]
+    assert _ids(index.search("pixel", fields=("sn",))) == []
+
+
+def test_index_follows_edits_and_deletes():
+    devices, index = _devices()
+    devices[0]["name"] = "Nexus"
+    assert index.search("pixel") == []
+    assert _ids(index.search("nexus")) == [1]
+    devices.remove(devices[1])
+    assert index.search("galaxy") == []
+    devices.insert(0, {"id": 4, "name": "Galaxy S", "type": "Phone", "sn": "GS-1"})
+    assert _ids(index.search("phone")) == [4, 1]
+    devices.clear()
+    assert len(index) == 0
+    assert index.search("phone") == []
+
+
+def test_ranked_orders_exact_sn_then_prefixes_then_substring():
+    devices, index = _devices()
+    devices.extend(
+        [
+            {"id": 5, "name": "Tab GT", "type": "Tablet", "sn": "X-1"},
+            {"id": 6, "name": "Phone", "type": "Phone", "sn": "GT"},
+            {"id": 7, "name": "Watch", "type": "Wear", "sn": "GT-9"},
+        ]
+    )
+    ranked = lambda query: _ids(index.ranked(query, exact=("sn",), prefix=("sn", "name")))
+    # точный SN, начало SN (в порядке списка), подстрока
+    assert ranked("gt") == [6, 2, 7, 5]
+    # начало названия раньше вхождения в середину
+    assert ranked("tab") == [5, 2]
+    assert ranked("xyz") == []
@@ -1,7 +1,9 @@
+import asyncio
 import importlib
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import booking
 import storage
 import utils
 
@@ -36,3 +38,113 @@ def test_cleanup_expired_bookings(tmp_path: Path):
     assert "user_id" not in device1
     assert device2["status"] == "booked"
     assert device2["user_id"] == 2
+
+
+def test_expiration_heap_tracks_bookings(tmp_path: Path):
+    reload_modules(tmp_path)
+
+    now = datetime.now()
+    storage.devices.clear()
+    storage.devices.extend(
+        [
+            {"id": 1, "sn": "A1", "status": "booked", "booking_expiration": (now + timedelta(hours=3)).isoformat()},
+            {"id": 2, "sn": "A2", "status": "free"},
+        ]
+    )
+    earlier = []
+    storage.expirations.on_earlier = earlier.append
+    assert storage.expirations.next_deadline() == now + timedelta(hours=3)
+
+    device = storage.devices[1]
+    device["status"] = "booked"
+    device["booking_expiration"] = (now + timedelta(hours=1)).isoformat()
+    assert earlier == [now + timedelta(hours=1)]
+
+    # Перебронирование и освобождение снимают прежний срок
+    device["booking_expiration"] = (now - timedelta(minutes=1)).isoformat()
+    storage.devices[0]["status"] = "free"
+    assert storage.expirations.next_deadline() == now - timedelta(minutes=1)
+    assert storage.expirations.pop_due(now) == [2]
+    assert storage.expirations.next_deadline() is None
+    storage.expirations.on_earlier = None
+
+
+def test_reminders_rebuilt_from_bookings(tmp_path: Path):
+    reload_modules(tmp_path)
+
+    now = datetime.now()
+    expiration = (now + timedelta(hours=2)).isoformat()
+    (tmp_path / "config.json").write_text('{"notify_before_minutes": 30}', encoding="utf-8")
+    storage.load_all()
+    storage.devices.extend(
+        [
+            {"id": 1, "sn": "A1", "status": "booked", "user_id": 1, "booking_expiration": expiration},
+            {"id": 2, "sn": "A2", "status": "booked", "user_id": 1, "booking_expiration": expiration,
+             "reminded_for": expiration},
+        ]
+    )
+    storage.save_devices()
+    storage.flush()
+
+    # После перезапуска напоминание восстанавливается из брони
+    storage.load_all()
+    reminder = datetime.fromisoformat(expiration) - timedelta(minutes=30)
+    assert storage.reminders.next_deadline() == reminder
+    assert storage.reminders.pop_due(now) == []
+    assert storage.reminders.pop_due(reminder) == [1]
+
+    # Отмеченное напоминание не повторяется, новая бронь планируется заново
+    device = storage.devices[0]
+    device["reminded_for"] = device["booking_expiration"]
+    assert storage.reminders.next_deadline() is None
+    device["booking_expiration"] = (now + timedelta(hours=5)).isoformat()
+    assert storage.reminders.next_deadline() == now + timedelta(hours=5) - timedelta(minutes=30)
+
+    # Освобождение снимает отметку напоминания вместе с бронью
+    released = asyncio.run(booking.release(2, "release"))
+    assert "reminded_for" not in released and "booking_expiration" not in released
+    storage.close()
+
+
+def test_request_context_memoizes_per_update(tmp_path: Path):
+    import request_context
+
+    reload_modules(tmp_path)
+    storage.groups.extend([{"id": 1, "name": "QA"}, {"id": 2, "name": "Dev"}])
+    storage.users.extend([{"user_id": 1, "first_name": "Иван", "status": "active", "role": "User", "group_id": 1}])
+    storage.devices.extend(
+        [
+            {"id": 1, "sn": "A1", "status": "booked", "user_id": 1, "group_id": 1},
+            {"id": 2, "sn": "A2", "status": "free", "group_id": 2},
+        ]
+    )
+    context = type("Context", (), {})()
+    update = type("Update", (), {"effective_user": type("User", (), {"id": 1})()})()
+    request = request_context.for_update(update, context)
+    assert request_context.for_update(update, context) is request and context.request is request
+    assert not request.is_admin and request.group_id == 1
+
+    assert utils.visible_group_ids(1, request=request) == (None, 1)
+    assert utils.get_user_booked_count(1, request=request) == 1
+    assert not utils.can_user_book_device(1, 2, request=request)
+    assert utils.get_user_full_name(1, request=request) == "Иван"
+
+    # До конца обновления значения не пересчитываются; без request — актуальные
+    storage.users[0]["first_name"] = "Петр"
+    storage.devices[1].update({"status": "booked", "user_id": 1})
+    assert utils.get_user_full_name(1, request=request) == "Иван"
+    assert utils.get_user_full_name(1) == "Петр"
+    assert utils.get_user_booked_count(1, request=request) == 1
+    assert utils.get_user_booked_count(1) == 2
+    request.forget("booked_count")
+    assert utils.get_user_booked_count(1, request=request) == 2
+
+
+def test_filter_devices_by_user_group_accepts_plain_dicts(tmp_path: Path):
+    reload_modules(tmp_path)
+    storage.groups.extend([{"id": 1, "name": "QA"}])
+    storage.users.extend([{"user_id": 1, "status": "active", "role": "User", "group_id": 1}])
+
+    devices = [{"id": 1, "group_id": 1}, {"id": 2, "group_id": 2}, {"id": 3}, {"id": 4, "group_id": ""}]
+    assert [d["id"] for d in utils.filter_devices_by_user_group(1, devices)] == [1, 3, 4]
+    assert [d["id"] for d in filter(utils.device_visibility(1), devices)] == [1, 3, 4]
@@ -0,0 +1,90 @@
+import importlib
+import json
+from pathlib import Path
+
+from libs.wal import WriteAheadLog, apply_ops
+
+
+def reload_storage(tmp_path: Path, monkeypatch):
+    import storage
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    importlib.reload(storage)
+    return storage
+
+
+def test_apply_ops_upsert_delete_replace():
+    records = [{"id": 1, "v": "a"}, {"id": 2, "v": "b"}]
+    ops = [
+        {"c": "devices", "put": {"id": 2, "v": "B"}},
+        {"c": "devices", "put": {"id": 3, "v": "c"}},
+        {"c": "devices", "del": 1},
+    ]
+    assert apply_ops(records, "id", ops) == [{"id": 2, "v": "B"}, {"id": 3, "v": "c"}]
+    assert apply_ops([], "id", [{"c": "devices", "all": [{"id": 9}]}]) == [{"id": 9}]
+
+
+def test_torn_transaction_is_discarded(tmp_path: Path):
+    wal = WriteAheadLog(str(tmp_path / "storage.wal"))
+    wal.write(wal.encode([{"c": "devices", "put": {"id": 1}}])[1])
+    wal.close()
+    with open(tmp_path / "storage.wal", "ab") as f:
+        f.write(b'{"lsn": 2, "ops": [{"c": "dev')
+
+    reopened = WriteAheadLog(str(tmp_path / "storage.wal"))
+    assert reopened.replay() == [(1, [{"c": "devices", "put": {"id": 1}}])]
+    assert reopened.lsn == 1
+    # Хвост отрезан, следующая транзакция начинается с новой строки
+    reopened.write(reopened.encode([{"c": "devices", "del": 1}])[1])
+    assert len((tmp_path / "storage.wal").read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_booking_and_log_are_one_wal_record(tmp_path: Path, monkeypatch):
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+    for i in range(100):
+        storage.devices.append({"id": i, "sn": f"SN{i}", "status": "free"})
+    storage.save_devices()
+    storage.checkpoint()
+
+    device = storage.devices.get_by("id", 42)
+    with storage.transaction():
+        device["status"] = "booked"
+        device["user_id"] = 7
+        storage.save_devices()
+        storage.append_log("SN42", {"action": "book"})
+
+    lines = (tmp_path / "storage.wal").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    ops = json.loads(lines[0])["ops"]
+    # Пишется только измененная запись и запись лога
+    assert ops == [
+        {"c": "devices", "put": {"id": 42, "sn": "SN42", "status": "booked", "user_id": 7}},
+        {"c": "logs", "sn": "SN42", "entry": {"action": "book"}},
+    ]
+
+    # «Сбой»: снапшоты не переписывались, состояние восстанавливается из WAL
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+    assert storage.devices.get_by("id", 42)["status"] == "booked"
+    assert storage.logs["SN42"] == [{"action": "book"}]
+    assert len(storage.devices) == 100
+    storage.close()
+
+
+def test_sqlite_transaction_writes_device_and_log(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    storage = reload_storage(tmp_path, monkeypatch)
+    storage.load_all()
+    storage.devices.append({"id": 1, "sn": "SN1", "status": "free"})
+    storage.save_devices()
+
+    with storage.transaction():
+        storage.devices[0]["status"] = "booked"
+        storage.save_devices()
+        storage.append_log("SN1", {"action": "book"})
+
+    storage.load_all()
+    assert storage.devices == [{"id": 1, "sn": "SN1", "status": "booked"}]
+    assert storage.logs["SN1"] == [{"action": "book"}]
+    storage.close()
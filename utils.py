@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import TYPE_CHECKING, Callable, Dict, Any, Optional, List, TypeVar
 
 from prettytable import PrettyTable
 
 import storage
+from libs.principals import ACTIVE_STATUSES, Principal
+
+if TYPE_CHECKING:
+    from request_context import RequestContext
+
+T = TypeVar("T")
 
 
 def format_datetime(iso_str: Optional[str]) -> str:
@@ -18,96 +24,152 @@ def format_datetime(iso_str: Optional[str]) -> str:
     return dt.strftime("%d.%m.%Y %H:%M")
 
 
+def _log_entry(action: str) -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "action": action,
+    }
+
+
 def log_action(device_sn: str, action: str) -> None:
-    if device_sn not in storage.logs:
-        storage.logs[device_sn] = []
-    storage.logs[device_sn].append(
-        {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "action": action,
-        }
-    )
-    storage.save_logs()
+    storage.append_log(device_sn, _log_entry(action))
+
+
+async def log_action_async(device_sn: str, action: str) -> None:
+    """Как log_action, но запись в журнал не блокирует event loop."""
+    await storage.append_log_async(device_sn, _log_entry(action))
 
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    return next((u for u in storage.users if u.get("user_id") == user_id), None)
+    return storage.users.get_by("user_id", user_id)
+
+
+def get_device_by_id(device_id: int) -> Optional[Dict[str, Any]]:
+    """Получить устройство по ID."""
+    return storage.devices.get_by("id", device_id)
+
+
+def get_devices_by_sn(sn: str) -> List[Dict[str, Any]]:
+    """Устройства с указанным SN (без учета регистра)."""
+    return storage.devices.find_by("sn", sn)
+
+
+def get_principal(user_id: int, request: Optional[RequestContext] = None) -> Principal:
+    """Права пользователя (запись, статус, роль, администратор, группа) из кэша.
+
+    request — контекст текущего обновления: если он того же пользователя,
+    права берутся из него.
+    """
+    if request is not None and request.user_id == user_id:
+        return request.principal
+    return storage.principals.get(user_id)
+
+
+def _memo(request: Optional[RequestContext], user_id: int, key: str, compute: Callable[[], T]) -> T:
+    # Значение запоминается в контексте обновления, если он того же пользователя
+    if request is not None and request.user_id == user_id:
+        return request.memo(key, compute)
+    return compute()
 
 
 def get_user_role(user_id: int) -> Optional[str]:
-    user = get_user_by_id(user_id)
-    if not user:
+    principal = get_principal(user_id)
+    if principal.status not in ACTIVE_STATUSES:
         return None
-    status = user.get("status")
-    if status not in ("active", "approved"):
-        return None
-    return user.get("role")
+    return principal.role
 
 
 def is_admin(user_id: int) -> bool:
-    return (
-        get_user_role(user_id) == "Admin"
-        or user_id in storage.config.get("admin_ids", [])
-    )
+    return get_principal(user_id).is_admin
 
 
-def get_user_full_name(user_id: int) -> str:
-    user = get_user_by_id(user_id)
+def get_user_full_name(user_id: int, request: Optional[RequestContext] = None) -> str:
+    return _memo(request, user_id, "full_name", lambda: _full_name(get_principal(user_id, request).user))
+
+
+def _full_name(user: Optional[Dict[str, Any]]) -> str:
     if not user:
         return "Неизвестно"
     return f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or "Неизвестно"
 
 
 def get_user_devices(user_id: int) -> List[Dict[str, Any]]:
-    return [d for d in storage.devices if d.get("user_id") == user_id]
+    return storage.devices.find_by("user_id", user_id)
 
 
-def cleanup_expired_bookings() -> None:
-    """Освобождает устройства с истёкшим сроком брони."""
-    now = datetime.now()
-    changed = False
-    for d in storage.devices:
-        exp = d.get("booking_expiration")
-        if not exp:
-            continue
-        try:
-            dt = datetime.fromisoformat(exp)
-        except ValueError:
+def get_user_booked_devices(user_id: int) -> List[Dict[str, Any]]:
+    """Устройства, забронированные пользователем."""
+    return [d for d in storage.devices.find_by("user_id", user_id) if d.get("status") == "booked"]
+
+
+def get_user_booked_count(user_id: int, request: Optional[RequestContext] = None) -> int:
+    """Число броней пользователя (с request — запоминается до конца обновления)."""
+    return _memo(
+        request,
+        user_id,
+        "booked_count",
+        lambda: sum(1 for d in storage.devices.find_by("user_id", user_id) if d.get("status") == "booked"),
+    )
+
+
+def get_booked_device(device_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Устройство, если оно забронировано указанным пользователем."""
+    device = get_device_by_id(device_id)
+    if device and device.get("user_id") == user_id and device.get("status") == "booked":
+        return device
+    return None
+
+
+def _release_expired_bookings() -> List[str]:
+    """Освобождает устройства с истёкшим сроком брони и возвращает их SN.
+
+    Сроки берутся из кучи storage.expirations: проверяются только
+    устройства, чей срок уже наступил, без прохода по всем бронированиям.
+    """
+    released: List[str] = []
+    for device_id in storage.expirations.pop_due(datetime.now()):
+        d = get_device_by_id(device_id)
+        if d is None or d.get("status") != "booked":
             continue
-        if dt < now and d.get("status") == "booked":
-            d["status"] = "free"
-            d.pop("user_id", None)
-            d.pop("booking_expiration", None)
-            log_action(d["sn"], "Бронирование автоматически завершено (истёк срок)")
-            changed = True
-    if changed:
-        storage.save_devices()
+        d["status"] = "free"
+        d.pop("user_id", None)
+        d.pop("booking_expiration", None)
+        d.pop(storage.reminders.MARK, None)
+        released.append(d["sn"])
+    return released
+
+
+EXPIRED_ACTION = "Бронирование автоматически завершено (истёк срок)"
+
+
+def cleanup_expired_bookings() -> None:
+    """Освобождает устройства с истёкшим сроком брони (одной транзакцией хранилища)."""
+    with storage.transaction():
+        released = _release_expired_bookings()
+        for sn in released:
+            log_action(sn, EXPIRED_ACTION)
+        if released:
+            storage.save_devices()
 
 
 def get_group_by_id(group_id: int) -> Optional[Dict[str, Any]]:
     """Получить группу по ID."""
-    return next((g for g in storage.groups if g.get("id") == group_id), None)
+    return storage.groups.get_by("id", group_id)
 
 
 def get_group_by_name(group_name: str) -> Optional[Dict[str, Any]]:
     """Получить группу по имени."""
-    return next((g for g in storage.groups if g.get("name") == group_name), None)
+    return storage.groups.get_by("name", group_name)
 
 
 def get_user_group(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить группу пользователя."""
-    user = get_user_by_id(user_id)
-    if not user:
-        return None
-    group_id = user.get("group_id")
-    if not group_id:
-        return None
-    return get_group_by_id(group_id)
+    return get_principal(user_id).group
 
 
 def get_device_group(device_id: int) -> Optional[Dict[str, Any]]:
     """Получить группу устройства."""
-    device = next((d for d in storage.devices if d.get("id") == device_id), None)
+    device = get_device_by_id(device_id)
     if not device:
         return None
     group_id = device.get("group_id")
@@ -116,18 +178,19 @@ def get_device_group(device_id: int) -> Optional[Dict[str, Any]]:
     return get_group_by_id(group_id)
 
 
-def can_user_book_device(user_id: int, device_id: int) -> bool:
+def can_user_book_device(user_id: int, device_id: int, request: Optional[RequestContext] = None) -> bool:
     """Проверить, может ли пользователь забронировать устройство.
     
     Администраторы могут бронировать любые устройства.
     Обычные пользователи могут бронировать только устройства из своей группы.
     Если пользователь или устройство не в группе - бронирование невозможно.
     """
+    principal = get_principal(user_id, request)
     # Администраторы могут бронировать любые устройства
-    if is_admin(user_id):
+    if principal.is_admin:
         return True
     
-    user_group = get_user_group(user_id)
+    user_group = principal.group
     device_group = get_device_group(device_id)
     
     # Если пользователь или устройство не в группе - нельзя бронировать
@@ -138,25 +201,63 @@ def can_user_book_device(user_id: int, device_id: int) -> bool:
     return user_group.get("id") == device_group.get("id")
 
 
-def filter_devices_by_user_group(user_id: int, devices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def filter_devices_by_user_group(
+    user_id: int, devices: List[Dict[str, Any]], request: Optional[RequestContext] = None
+) -> List[Dict[str, Any]]:
     """Отфильтровать устройства по группе пользователя.
     
     Администраторы видят все устройства.
     Обычные пользователи видят устройства своей группы, а также устройства без группы.
     """
+    principal = get_principal(user_id, request)
     # Администраторы видят все устройства
-    if is_admin(user_id):
+    if principal.is_admin:
         return devices
     
-    user_group = get_user_group(user_id)
-    
-    # Если пользователь не в группе - видит только устройства без группы
-    if not user_group:
-        return [d for d in devices if not d.get("group_id")]
-    
-    # Фильтруем устройства по группе
-    user_group_id = user_group.get("id")
-    return [d for d in devices if not d.get("group_id") or d.get("group_id") == user_group_id]
+    user_group_id = principal.group_id
+
+    # Для полного списка устройств берем готовые бакеты индекса по group_id
+    if devices is storage.devices:
+        if not user_group_id:
+            return storage.devices.find_by("group_id", None)
+        return storage.devices.find_by("group_id", None, user_group_id)
+
+    return [d for d in devices if _visible_in_group(d, user_group_id)]
+
+
+def visible_group_ids(user_id: int, request: Optional[RequestContext] = None) -> Optional[tuple]:
+    """group_id устройств, видимых пользователю (None — все, администратор).
+
+    Устройства без группы (None) видны всем.
+    """
+    return _memo(request, user_id, "visible_group_ids", lambda: _visible_group_ids(get_principal(user_id, request)))
+
+
+def _visible_group_ids(principal: Principal) -> Optional[tuple]:
+    if principal.is_admin:
+        return None
+    user_group_id = principal.group_id
+    return (None, user_group_id) if user_group_id else (None,)
+
+
+def _visible_in_group(device: Dict[str, Any], user_group_id: Any) -> bool:
+    # Любой словарь устройства (запись Device или dict). Без группы
+    # пользователь видит только устройства без группы.
+    group_id = device.get("group_id")
+    return not group_id or (bool(user_group_id) and group_id == user_group_id)
+
+
+def device_visibility(user_id: int, request: Optional[RequestContext] = None) -> Optional[Callable[[Any], bool]]:
+    """Предикат «устройство видно пользователю» (None — видны все, администратор).
+
+    Для ленивой фильтрации (курсор результатов поиска) вместо
+    filter_devices_by_user_group, которому нужен весь список сразу.
+    """
+    principal = get_principal(user_id, request)
+    if principal.is_admin:
+        return None
+    user_group_id = principal.group_id
+    return lambda device: _visible_in_group(device, user_group_id)
 
 
 def get_default_group() -> Optional[Dict[str, Any]]: